@@ -0,0 +1,438 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dataclasses import replace
+from typing import Any, Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from backend.core.breaker import DEADLINE, CircuitOpenError, DeadlineExceeded, get_breakers
+from backend.core.client import (
+    BASE_URL,
+    CONNECT_TIMEOUT,
+    DEFAULT_MODEL,
+    MAX_RETRIES,
+    POOL_SIZE,
+    READ_TIMEOUT,
+    LLMResponse,
+    Message,
+    _is_retryable,
+    _retry_delay,
+    cache_lookup,
+    resolve_api_key,
+)
+from backend.core.cache import get_response_cache
+from backend.core.hedging import HedgeRace, get_hedge_policy, hedge_key
+from backend.core.prompt_cache import get_prompt_cache_stats
+from backend.core.ratelimit import estimate_tokens, get_rate_limiter
+from backend.core.scheduler import get_scheduler
+from backend.core.singleflight import AsyncSingleFlight, make_flight_key
+
+# 이벤트 루프에서 동시에 진행할 수 있는 최대 생성 작업 수
+MAX_INFLIGHT = int(os.getenv("LLM_ASYNC_MAX_INFLIGHT", str(POOL_SIZE)))
+
+# 스케줄러 자리 확인 주기(초)
+SCHED_POLL_INTERVAL = 0.05
+
+
+class LLMJob:
+    """
+    이벤트 루프에 제출된 생성 작업 1건.
+    - partial: 스트리밍 중 지금까지 받은 텍스트 (UI 임시 말풍선용)
+    - ready_at: rate limit 대기열에서 차례가 오는 시각 (UI 예상 대기 시간용)
+    - future : 완료되면 LLMResponse (실패하면 예외)
+    """
+
+    def __init__(self, stage: Optional[str], session_id: Optional[str] = None, classroom: Optional[str] = None):
+        self.stage = stage
+        self.session_id = session_id
+        self.classroom = classroom
+        self.partial = ""
+        self.submitted_at = time.time()
+        self.ready_at = 0.0
+        self.future: Optional[Future] = None
+
+    def publish(self, partial: str):
+        self.partial = partial
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def wait(self, timeout: float) -> bool:
+        """최대 timeout 초 기다린 뒤 완료 여부를 반환 (스크립트 스레드를 오래 잡지 않음)."""
+        try:
+            self.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return False
+        except Exception:
+            pass  # 예외는 result() 에서 다시 올라감
+        return True
+
+    def result(self) -> LLMResponse:
+        return self.future.result()
+
+
+class AsyncLLMRunner:
+    """
+    전용 스레드 1개에서 asyncio 이벤트 루프를 돌리며 AsyncOpenAI 로 생성 작업을 처리한다.
+    스크립트 스레드는 submit() 후 바로 돌아가고, 다음 실행(rerun)에서 결과를 가져간다.
+    → 처리량이 스레드 수가 아니라 동시 I/O 수에 비례.
+    서킷 브레이커는 동기 클라이언트와 같은 것(get_breakers)을 공유한다.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_inflight: int = MAX_INFLIGHT,
+        max_retries: int = MAX_RETRIES,
+        deadline: float = DEADLINE,
+    ):
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name="llm-event-loop", daemon=True)
+        self.thread.start()
+
+        base_url = base_url or BASE_URL
+        self.client = AsyncOpenAI(
+            api_key=resolve_api_key(api_key, base_url),
+            base_url=base_url,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max_inflight,
+                    max_keepalive_connections=max_inflight,
+                    keepalive_expiry=60,
+                ),
+                timeout=self.timeout,
+            ),
+            max_retries=0,
+            timeout=self.timeout,
+        )
+        self.max_inflight = max_inflight
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self.cache = get_response_cache()
+        self.flights = AsyncSingleFlight()  # 동일 요청 합치기 (이벤트 루프 안에서만 사용)
+        self.breakers = get_breakers()
+        self.hedging = get_hedge_policy()
+        self.limiter = get_rate_limiter()
+        self.scheduler = get_scheduler()
+        self.prompt_cache = get_prompt_cache_stats()
+
+        # 통계
+        self.submitted = 0   # 제출된 작업 수
+        self.active = 0      # 지금 업스트림을 호출 중인 수 (max_inflight 이하)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    # -------------------------------
+    # 작업 제출 (스크립트 스레드에서 호출)
+    # -------------------------------
+    def submit(
+        self,
+        messages: List[Message],
+        stage: Optional[str] = None,
+        model: Optional[str] = None,
+        stream: bool = True,
+        session_id: Optional[str] = None,
+        classroom: Optional[str] = None,
+        **options,
+    ) -> LLMJob:
+        job = LLMJob(stage, session_id, classroom)
+        self.submitted += 1
+        coro = self._generate(job, messages, model or DEFAULT_MODEL, stream, options)
+        job.future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return job
+
+    # -------------------------------
+    # 실제 생성 (이벤트 루프에서 실행)
+    # -------------------------------
+    async def _generate(self, job: LLMJob, messages, model, stream, options) -> LLMResponse:
+        # 응답 캐시(SQLite: 조회마다 commit, 주기적 정리, timeout=10) 는 executor 스레드에서 → 이벤트 루프를 막지 않음
+        loop = asyncio.get_running_loop()
+        cache_key, cached = await loop.run_in_executor(None, cache_lookup, self.cache, messages, job.stage, model)
+        if cached is not None:
+            job.partial = cached.text
+            return cached
+
+        start = time.time()
+        result, leader = await self.flights.do(
+            make_flight_key(model, messages, options),
+            lambda publish: self._scheduled(
+                job,
+                lambda deadline: self._guarded(
+                    model,
+                    deadline,
+                    lambda: self._hedged(
+                        job,
+                        model,
+                        stream,
+                        lambda race, index: self._call_upstream(
+                            job, messages, model, stream, options, publish, race, index
+                        ),
+                    ),
+                ),
+            ),
+            on_delta=job.publish,
+        )
+        if not leader:
+            waited = round(time.time() - start, 2)
+            job.partial = result.text
+            return replace(result, stage=job.stage, latency=waited, ttft=waited, attempts=0, source="coalesced")
+
+        self.prompt_cache.record(job.stage, result.usage, result.ttft)
+        if cache_key:
+            # 저장 결과는 기다릴 필요 없음
+            loop.run_in_executor(
+                None, functools.partial(self.cache.put, cache_key, result.text, stage=result.stage, model=result.model)
+            )
+        return result
+
+    async def _scheduled(self, job: LLMJob, coro_factory) -> LLMResponse:
+        """
+        공정 스케줄러에서 자리를 받은 뒤 coro_factory(deadline) 실행 (이벤트 루프를 막지 않도록 짧게 확인하며 대기).
+        deadline(절대 시각)은 대기열에 들어갈 때 한 번만 정한다 (동기 클라이언트와 같음).
+        """
+        deadline = time.time() + self.deadline
+        ticket = self.scheduler.enqueue(job.session_id, job.classroom, job.stage)
+        try:
+            while not ticket.granted.is_set():
+                if time.time() >= deadline:
+                    raise DeadlineExceeded(f"scheduler queue wait exceeded {self.deadline}s")
+                await asyncio.sleep(SCHED_POLL_INTERVAL)
+        except BaseException:
+            self.scheduler.cancel(ticket)
+            raise
+
+        try:
+            result = await coro_factory(deadline)
+        finally:
+            self.scheduler.release(ticket)
+        return replace(result, queue_wait=ticket.wait_time)
+
+    async def _guarded(self, model: str, deadline: float, coro_factory) -> LLMResponse:
+        """서킷 브레이커 확인 + 전체 제한 시간(대기열에서 정한 deadline 까지 남은 시간). 결과는 브레이커에 기록."""
+        breaker = self.breakers.get(model)
+        if not breaker.allow():
+            raise CircuitOpenError(f"circuit open: {model}")
+
+        start = time.time()
+        try:
+            result = await asyncio.wait_for(coro_factory(), max(0.0, deadline - start))
+        except asyncio.TimeoutError as exc:
+            breaker.record(False, time.time() - start)
+            raise DeadlineExceeded(f"deadline {self.deadline}s exceeded") from exc
+        except Exception:
+            breaker.record(False, time.time() - start)
+            raise
+        breaker.record(True, result.latency)
+        return result
+
+    async def _hedged(self, job: LLMJob, model: str, stream: bool, attempt) -> LLMResponse:
+        """
+        헤지 요청 (동기 클라이언트의 _hedged 와 같은 규칙).
+        p95 까지 결과(스트리밍은 첫 토큰)가 없으면 복제 요청을 보내고, 먼저 끝난 쪽을 쓰고 나머지 Task 는 취소한다.
+        """
+        key = hedge_key(model, job.stage, stream)
+        delay = self.hedging.delay(key)
+        if delay is None:
+            result = await attempt(None, 0)
+            self.hedging.record(key, result.ttft if stream else result.latency)
+            return result
+
+        start = time.time()
+        race = HedgeRace()
+        tasks = [asyncio.ensure_future(attempt(race, 0))]
+        hedge_offset = 0.0
+
+        await asyncio.wait(tasks, timeout=delay)
+        if race.winner is None and not tasks[0].done() and self.hedging.allow():
+            hedge_offset = time.time() - start
+            print(f"[LLM HEDGE] {key} no response after {delay:.2f}s, sending duplicate request")
+            tasks.append(asyncio.ensure_future(attempt(race, 1)))
+
+        try:
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    result = task.result()
+                    if result is None:
+                        continue
+                    index = tasks.index(task)
+                    if index == 1:
+                        result = replace(
+                            result,
+                            latency=round(result.latency + hedge_offset, 2),
+                            ttft=round(result.ttft + hedge_offset, 2),
+                        )
+                    result = replace(result, hedged=len(tasks) > 1)
+                    self.hedging.record(key, result.ttft if stream else result.latency, hedge_won=index == 1)
+                    return result
+            raise error
+        finally:
+            # 진 요청 취소 (HTTP 연결도 함께 정리됨)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _reserve(self, job: LLMJob, tokens: int):
+        """
+        전역 rate limit 예약 + 내 차례까지 대기.
+        - 예약은 SQLite 트랜잭션(BEGIN IMMEDIATE, 최대 10초 대기)이라 executor 스레드에서 실행 → 이벤트 루프를 막지 않음
+        - 보내기 전에 취소되거나 제한 시간(deadline)에 걸리면 예약을 돌려놓는다 (예약 도중 취소돼도 끝난 뒤 반납)
+        """
+        loop = asyncio.get_running_loop()
+        reservation = loop.run_in_executor(None, self.limiter.reserve, tokens)
+
+        def refund(done):
+            if not done.cancelled() and done.exception() is None:
+                loop.run_in_executor(None, self.limiter.refund, tokens)
+
+        try:
+            wait = await asyncio.shield(reservation)
+            if wait > 0:
+                job.ready_at = time.time() + wait
+                await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            reservation.add_done_callback(refund)
+            raise
+
+    def _adjust(self, tokens: int):
+        """실제 사용량 보정 (SQLite 쓰기) 도 executor 에서. 결과를 기다릴 필요 없음."""
+        asyncio.get_running_loop().run_in_executor(None, self.limiter.adjust, tokens)
+
+    def _refund(self, tokens: int):
+        """응답을 못 받은 호출의 예약 반납 (executor 에서, 기다리지 않음)."""
+        asyncio.get_running_loop().run_in_executor(None, self.limiter.refund, tokens)
+
+    async def _call_upstream(self, job: LLMJob, messages, model, stream, options, publish, race=None, index=0):
+        """publish(partial): 스트리밍 중간 텍스트를 이 job 과 합쳐진(coalesced) 다른 job 들에 전달."""
+        tokens = estimate_tokens(messages, options.get("max_tokens"))
+        async with self._semaphore:
+            self.active += 1
+            try:
+                start = time.time()
+                attempt = 0
+                # 전역 rate limit 대기열 (이벤트 루프는 막지 않음). 재시도와 상관없이 호출 1번에 1번 예약
+                await self._reserve(job, tokens)
+                try:
+                    while True:
+                        try:
+                            response = await self.client.chat.completions.create(
+                                model=model,
+                                messages=messages,
+                                stream=stream,
+                                **({"stream_options": {"include_usage": True}} if stream else {}),
+                                **options,
+                            )
+                            break
+                        except Exception as exc:
+                            if attempt >= self.max_retries or not _is_retryable(exc):
+                                raise
+                            await asyncio.sleep(_retry_delay(exc, attempt))
+                            attempt += 1
+                except BaseException:
+                    # 응답을 못 받음 (429 / 5xx / 타임아웃 / 헤지에서 져서 취소) → 사용량을 모르므로 예약 반납
+                    self._refund(tokens)
+                    raise
+
+                if not stream:
+                    elapsed = round(time.time() - start, 2)
+                    if response.usage:
+                        self._adjust(response.usage.total_tokens - tokens)
+                    if race is not None and not race.claim(index):
+                        return None  # 헤지 상대가 먼저 끝남
+                    return LLMResponse(
+                        text=response.choices[0].message.content or "",
+                        model=model,
+                        stage=job.stage,
+                        latency=elapsed,
+                        ttft=elapsed,
+                        attempts=attempt + 1,
+                        usage=response.usage.model_dump() if response.usage else {},
+                    )
+
+                ttft = None
+                chunks = []
+                usage = {}
+                async for event in response:
+                    if event.usage:
+                        usage = event.usage.model_dump()
+                    if not event.choices:
+                        continue
+                    delta = event.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if ttft is None:
+                        if race is not None and not race.claim(index):
+                            await response.close()  # 헤지 상대가 먼저 첫 토큰을 받음 → 이 스트림은 취소
+                            return None
+                        ttft = round(time.time() - start, 2)  # ⏱️ 첫 토큰 도착
+                    chunks.append(delta)
+                    publish("".join(chunks))
+
+                if usage:
+                    self._adjust(usage.get("total_tokens", tokens) - tokens)
+
+                if race is not None and not race.claim(index):
+                    return None
+
+                elapsed = round(time.time() - start, 2)  # ⏱️ 완료
+                return LLMResponse(
+                    text="".join(chunks),
+                    model=model,
+                    stage=job.stage,
+                    latency=elapsed,
+                    ttft=ttft if ttft is not None else elapsed,
+                    attempts=attempt + 1,
+                    usage=usage,
+                )
+            finally:
+                self.active -= 1
+
+
+    # -------------------------------
+    # 통계 (캐시 / 브레이커 / 헤지 / rate limit / 스케줄러는 동기 클라이언트와 공유)
+    # -------------------------------
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "submitted": self.submitted,
+            "active": self.active,
+            "max_inflight": self.max_inflight,
+            "singleflight": self.flights.stats(),
+        }
+
+
+# -------------------------------
+# 프로세스 단위 싱글톤
+# -------------------------------
+_runner: Optional[AsyncLLMRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_async_runner() -> AsyncLLMRunner:
+    """프로세스 전체에서 하나의 이벤트 루프 스레드를 공유한다."""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = AsyncLLMRunner()
+    return _runner
+
+
+def async_runner_stats() -> Optional[Dict[str, Any]]:
+    """이벤트 루프 스레드가 떠 있으면 그 통계, 아니면 None (통계를 보려고 러너를 새로 띄우지는 않음)."""
+    return _runner.stats() if _runner is not None else None
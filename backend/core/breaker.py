@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+# -------------------------------
+# 서킷 브레이커 설정 (환경 변수로 조정 가능)
+# -------------------------------
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))                # 최근 N건의 결과로 판단
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))           # 이만큼 쌓이기 전에는 열지 않음
+BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))     # 실패율이 이 이상이면 open
+BREAKER_OPEN_SEC = float(os.getenv("LLM_BREAKER_OPEN_SEC", "30"))          # open 유지 시간(초), 이후 시험 호출 1건
+
+# 호출 1건의 전체 제한 시간(초, 재시도 포함). 넘으면 실패로 보고 fallback
+DEADLINE = float(os.getenv("LLM_DEADLINE", "15"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class LLMUnavailable(Exception):
+    """LLM 을 지금 쓸 수 없음 (브레이커 open / 제한 시간 초과)."""
+
+
+class CircuitOpenError(LLMUnavailable):
+    pass
+
+
+class DeadlineExceeded(LLMUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """
+    모델 1개에 대한 서킷 브레이커.
+    - closed   : 정상. 최근 BREAKER_WINDOW 건 중 실패율이 BREAKER_ERROR_RATE 이상이면 open
+    - open     : 업스트림을 호출하지 않고 바로 CircuitOpenError (→ 앱은 fallback 응답)
+    - half_open: open 후 BREAKER_OPEN_SEC 가 지나면 시험 호출 1건만 통과. 성공하면 closed, 실패하면 다시 open
+    실패 = 예외(재시도 후에도 실패) 또는 제한 시간(DEADLINE) 초과
+    """
+
+    def __init__(
+        self,
+        model: str,
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        error_rate: float = BREAKER_ERROR_RATE,
+        open_sec: float = BREAKER_OPEN_SEC,
+    ):
+        self.model = model
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_sec = open_sec
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probing = False
+        self._results = deque(maxlen=window)   # (성공 여부, 응답 시간)
+        self._lock = threading.Lock()
+
+        # 통계
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self) -> bool:
+        """이번 호출을 업스트림으로 보내도 되는지."""
+        with self._lock:
+            if self.state == OPEN and time.time() - self.opened_at >= self.open_sec:
+                self.state = HALF_OPEN
+                self._probing = False
+
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool, latency: float):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if ok:
+                    # 시험 호출 성공 → 이전 실패 기록은 버리고 다시 시작
+                    self.state = CLOSED
+                    self._results.clear()
+                else:
+                    self._open()
+                self._results.append((ok, latency))
+                return
+
+            self._results.append((ok, latency))
+
+            failures = sum(1 for success, _ in self._results if not success)
+            if (
+                self.state == CLOSED
+                and len(self._results) >= self.min_calls
+                and failures / len(self._results) >= self.error_rate
+            ):
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.time()
+        self.opened += 1
+        print(f"[LLM BREAKER] {self.model} open ({self.open_sec}s)")
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            total = len(self._results)
+            failures = sum(1 for ok, _ in self._results if not ok)
+            latencies = [latency for _, latency in self._results]
+            return {
+                "state": self.state,
+                "error_rate": round(failures / total, 3) if total else 0.0,
+                "avg_latency": round(sum(latencies) / total, 2) if total else 0.0,
+                "rejected": self.rejected,
+                "opened": self.opened,
+            }
+
+
+class BreakerRegistry:
+    """모델별 서킷 브레이커 모음 (동기/비동기 경로가 같이 사용)."""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(model)
+            return breaker
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {model: breaker.stats() for model, breaker in breakers.items()}
+
+
+# -------------------------------
+# 프로세스 단위 싱글톤
+# -------------------------------
+_registry: Optional[BreakerRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_breakers() -> BreakerRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = BreakerRegistry()
+    return _registry
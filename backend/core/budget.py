@@ -0,0 +1,146 @@
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+# -------------------------------
+# 프롬프트 토큰 예산
+# -------------------------------
+# 턴이 쌓일수록 길어지는 부분(생성된 자유 질문 목록, 최근 대화, 학생 정보)을 섹션으로 나눠 토큰 할당량을 주고,
+# 전체가 예산을 넘으면 우선순위가 낮은 섹션부터 오래된 항목을 빼고 "(… N개 생략)" 한 줄로 요약한다.
+#   1) 우선순위 낮은 섹션부터 자기 할당량(allowance)까지만 줄임 → 예산 안에 들어오면 멈춤
+#   2) 그래도 넘으면 다시 낮은 순서대로 min_items 까지 줄임
+# 토큰 수는 빠른 로컬 추정(UTF-8 바이트 기준)으로 세고, PROMPT_TOKENIZER=tiktoken 이면 실제 토크나이저 사용.
+
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "estimate").lower()          # estimate | tiktoken
+ASCII_CHARS_PER_TOKEN = 4.0
+OTHER_CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "1.5"))     # 한국어 등 비 ASCII 글자 (넉넉하게)
+
+TokenCounter = Callable[[str], int]
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    빠른 토큰 수 추정. 한글(UTF-8 3바이트)과 ASCII 의 토큰당 글자 수가 달라 둘을 나눠 센다.
+    글자를 하나씩 보지 않고 encode 길이 차이로 비 ASCII 글자 수를 구한다 (대부분 3바이트 글자라고 가정).
+    """
+    if not text:
+        return 0
+    other = (len(text.encode("utf-8")) - len(text)) // 2
+    return math.ceil((len(text) - other) / ASCII_CHARS_PER_TOKEN + other / OTHER_CHARS_PER_TOKEN)
+
+
+_counter: Optional[TokenCounter] = None
+
+
+def get_token_counter() -> TokenCounter:
+    """PROMPT_TOKENIZER 설정에 맞는 토큰 수 함수. tiktoken 이 없으면 추정으로 대신한다."""
+    global _counter
+    if _counter is None:
+        counter = estimate_text_tokens
+        if PROMPT_TOKENIZER == "tiktoken":
+            try:
+                import tiktoken
+
+                encoding = tiktoken.get_encoding("o200k_base")
+                counter = lambda text: len(encoding.encode(text)) if text else 0
+            except ImportError:
+                print("[PROMPT BUDGET] tiktoken 이 설치되지 않아 추정 토큰 수 사용")
+        _counter = counter
+    return _counter
+
+
+@dataclass
+class Section:
+    """
+    프롬프트 값 1개(= 섹션).
+    - items    : 항목 목록 (질문 1개 / 대화 1턴 / 정보 1줄)
+    - priority : 낮을수록 먼저 줄임
+    - allowance: 먼저 보장하는 토큰 수 (1단계에서는 이 아래로 줄이지 않음)
+    - keep     : 줄일 때 남기는 쪽. newest(뒤쪽 = 최근) | oldest(앞쪽) | all(줄이지 않음)
+    - omitted  : 뺀 항목 요약 한 줄 ({n} = 뺀 개수), empty: 항목이 없을 때 값
+    """
+    name: str
+    items: Sequence[str]
+    priority: int = 0
+    allowance: int = 0
+    keep: str = "newest"
+    min_items: int = 0
+    joiner: str = "\n"
+    header: str = ""
+    omitted: str = "(… {n}개 생략)"
+    empty: str = ""
+
+    def render(self, kept: int) -> str:
+        if not self.items:
+            return self.empty
+        omitted = len(self.items) - kept
+        if self.keep == "oldest":
+            parts = list(self.items[:kept]) + ([self.omitted.format(n=omitted)] if omitted else [])
+        else:
+            parts = ([self.omitted.format(n=omitted)] if omitted else []) + list(self.items[len(self.items) - kept:])
+        body = self.joiner.join(parts)
+        return f"{self.header}\n{body}" if self.header else body
+
+
+@dataclass
+class BudgetReport:
+    """예산 결정 기록 (chat_log 의 prompt_budget)."""
+    label: str
+    budget: int
+    before: int = 0
+    used: int = 0
+    sections: Dict[str, dict] = field(default_factory=dict)
+
+    @property
+    def trimmed(self) -> Dict[str, str]:
+        return {
+            name: f"{s['items']}→{s['kept']}"
+            for name, s in self.sections.items() if s["kept"] < s["items"]
+        }
+
+    def meta(self) -> dict:
+        return {
+            "label": self.label,
+            "budget": self.budget,
+            "before": self.before,
+            "used": self.used,
+            "tokens": {name: s["tokens"] for name, s in self.sections.items()},
+            "trimmed": self.trimmed,
+        }
+
+
+class PromptBudget:
+
+    def __init__(self, budget: int, counter: Optional[TokenCounter] = None):
+        self.budget = budget
+        self.count = counter or get_token_counter()
+
+    def fit(self, sections: Sequence[Section], label: str = "") -> Tuple[Dict[str, str], BudgetReport]:
+        """섹션 이름 → 예산에 맞춘 문자열, 결정 기록. 예산이 0 이하이면 줄이지 않는다."""
+        kept = {s.name: len(s.items) for s in sections}
+        texts = {s.name: s.render(kept[s.name]) for s in sections}
+        tokens = {name: self.count(text) for name, text in texts.items()}
+        before = total = sum(tokens.values())
+
+        if self.budget > 0 and total > self.budget:
+            trimmable = sorted((s for s in sections if s.keep != "all"), key=lambda s: s.priority)
+            for keep_allowance in (True, False):
+                for s in trimmable:
+                    while total > self.budget and kept[s.name] > s.min_items:
+                        if keep_allowance and tokens[s.name] <= s.allowance:
+                            break
+                        kept[s.name] -= 1
+                        texts[s.name] = s.render(kept[s.name])
+                        new_tokens = self.count(texts[s.name])
+                        total += new_tokens - tokens[s.name]
+                        tokens[s.name] = new_tokens
+                if total <= self.budget:
+                    break
+
+        report = BudgetReport(label, self.budget, before, total, {
+            s.name: {"tokens": tokens[s.name], "items": len(s.items), "kept": kept[s.name]} for s in sections
+        })
+        if report.trimmed:
+            print(f"[PROMPT BUDGET] {label} used={total}/{self.budget} (before {before}) trimmed={report.trimmed}")
+        return texts, report
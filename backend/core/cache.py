@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+# -------------------------------
+# 캐시 설정 (환경 변수로 조정 가능)
+# -------------------------------
+CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))          # 최대 키 개수 (LRU)
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))          # 키 유효 시간(초)
+CACHE_VARIANTS = int(os.getenv("LLM_CACHE_VARIANTS", "1"))     # 키당 보관할 응답 개수 (변형 풀)
+
+# 캐시를 사용할 stage(템플릿 이름) 목록. 개인화된 all_memory_app(gpt_*) 턴은 기본 제외.
+CACHE_STAGES = os.getenv("LLM_CACHE_STAGES", "empathy_free_question")
+
+# 저장소: sqlite(디스크, 재시작/배포 후에도 유지) | memory(프로세스 메모리)
+CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "sqlite")
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(ROOT_DIR, "data", "cache", "llm_cache.sqlite3"))
+CACHE_DISK_SIZE = int(os.getenv("LLM_CACHE_DISK_SIZE", "20000"))     # 디스크 캐시 최대 키 개수
+CACHE_DISK_TTL = float(os.getenv("LLM_CACHE_DISK_TTL", "604800"))    # 디스크 캐시 유효 시간(초, 기본 7일)
+
+
+def normalize_text(text: str) -> str:
+    """
+    캐시 키용 정규화.
+    - 유니코드 NFKC + 소문자
+    - 문장부호/기호(?, !, ~, 이모지 등) 제거
+    - 연속 공백을 하나로
+    예) "재밌었어!!  😊" → "재밌었어"
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = "".join(ch for ch in text if not unicodedata.category(ch).startswith(("P", "S")))
+    return " ".join(text.split())
+
+
+def make_cache_key(stage: Optional[str], model: str, messages: List[Dict[str, str]]) -> str:
+    """(템플릿 이름, 모델, 정규화된 렌더링 프롬프트) → 해시 키."""
+    rendered = "\n".join(f"{m['role']}:{normalize_text(m['content'])}" for m in messages)
+    raw = f"{stage}\x1f{model}\x1f{rendered}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LLM 응답 LRU + TTL 캐시.
+    - variants > 1 이면 키마다 서로 다른 응답을 최대 N개까지 모은 뒤 그중 하나를 무작위로 돌려준다.
+      (풀이 다 차기 전에는 miss 로 처리해서 새 응답을 받아 채움 → 아이들이 모두 같은 문장을 보지 않음)
+    - stage 단위로 캐시 사용 여부를 켜고 끌 수 있다.
+    """
+
+    def __init__(
+        self,
+        max_size: int = CACHE_SIZE,
+        ttl: float = CACHE_TTL,
+        variants: int = CACHE_VARIANTS,
+        stages: Iterable[str] = (),
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self.stages = set(stages)
+
+        self._data: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 통계
+        self.hits = 0
+        self.misses = 0
+
+    # -------------------------------
+    # stage 스위치
+    # -------------------------------
+    def enabled_for(self, stage: Optional[str]) -> bool:
+        return stage in self.stages
+
+    def enable(self, stage: str, enabled: bool = True):
+        if enabled:
+            self.stages.add(stage)
+        else:
+            self.stages.discard(stage)
+
+    # -------------------------------
+    # 조회 / 저장
+    # -------------------------------
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry["expires_at"] < time.time():
+                del self._data[key]
+                entry = None
+
+            # 변형 풀이 다 차지 않았으면 새 응답을 받아오도록 miss 처리
+            if entry is None or len(entry["replies"]) < self.variants:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return random.choice(entry["replies"])
+
+    def put(self, key: str, reply: str, stage: Optional[str] = None, model: Optional[str] = None):
+        if not reply:
+            return
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry["expires_at"] < time.time():
+                entry = {"replies": [], "expires_at": time.time() + self.ttl}
+                self._data[key] = entry
+
+            if reply not in entry["replies"] and len(entry["replies"]) < self.variants:
+                entry["replies"].append(reply)
+
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self._data),
+        }
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    SQLite 에 저장되는 응답 캐시 (ResponseCache 와 같은 인터페이스).
+    - 재시작/배포 후에도 유지되고, 같은 서버의 여러 워커 프로세스가 함께 쓴다 (WAL 모드).
+    - 키 개수가 max_size 를 넘으면 마지막 사용 시각(last_access)이 오래된 것부터 지운다.
+    """
+
+    # 매 put 마다 전체 개수를 세지 않도록 N번에 한 번만 정리
+    EVICT_EVERY = 50
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        max_size: int = CACHE_DISK_SIZE,
+        ttl: float = CACHE_DISK_TTL,
+        variants: int = CACHE_VARIANTS,
+        stages: Iterable[str] = (),
+    ):
+        super().__init__(max_size=max_size, ttl=ttl, variants=variants, stages=stages)
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key         TEXT PRIMARY KEY,
+                stage       TEXT,
+                model       TEXT,
+                replies     TEXT NOT NULL,
+                expires_at  REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache (last_access)")
+        self._conn.commit()
+        self._puts = 0
+
+    def _load(self, key: str):
+        row = self._conn.execute(
+            "SELECT replies, expires_at FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < time.time():
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._conn.commit()
+            return None
+        return json.loads(row[0])
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            replies = self._load(key)
+            if replies is None or len(replies) < self.variants:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return random.choice(replies)
+
+    def put(self, key: str, reply: str, stage: Optional[str] = None, model: Optional[str] = None):
+        if not reply:
+            return
+        with self._lock:
+            replies = self._load(key) or []
+            if reply in replies or len(replies) >= self.variants:
+                return
+            replies.append(reply)
+
+            now = time.time()
+            self._conn.execute(
+                """
+                INSERT INTO llm_cache (key, stage, model, replies, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET replies = excluded.replies, last_access = excluded.last_access
+                """,
+                (key, stage, model, json.dumps(replies, ensure_ascii=False), now + self.ttl, now),
+            )
+            self._conn.commit()
+
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        """오래된 키 정리 (만료된 것 + max_size 초과분)."""
+        self._conn.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+        self._conn.execute(
+            """
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_size,),
+        )
+        self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        result = super().stats()
+        with self._lock:
+            result["size"] = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return result
+
+
+# -------------------------------
+# 프로세스 단위 싱글톤
+# -------------------------------
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """프로세스 전체에서 하나의 응답 캐시를 공유한다."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                stages = [s.strip() for s in CACHE_STAGES.split(",") if s.strip()]
+                if CACHE_BACKEND == "sqlite":
+                    _cache = SQLiteResponseCache(stages=stages)
+                else:
+                    _cache = ResponseCache(stages=stages)
+    return _cache
@@ -0,0 +1,612 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from openai import OpenAI, APIConnectionError, APIStatusError
+
+from backend.core.breaker import DEADLINE, BreakerRegistry, CircuitOpenError, DeadlineExceeded, get_breakers
+from backend.core.cache import ResponseCache, get_response_cache, make_cache_key
+from backend.core.hedging import HedgePolicy, HedgeRace, get_hedge_policy, hedge_key
+from backend.core.prompt_cache import PromptCacheStats, cached_tokens, get_prompt_cache_stats
+from backend.core.ratelimit import TokenBucketLimiter, estimate_tokens, get_rate_limiter
+from backend.core.scheduler import FairScheduler, get_scheduler
+from backend.core.singleflight import PARTIAL_POLL_INTERVAL, SingleFlight, make_flight_key
+
+# -------------------------------
+# 기본 설정 (환경 변수로 조정 가능)
+# -------------------------------
+DEFAULT_MODEL = os.getenv("MODEL_NAME", "gpt-4o")
+
+# OpenAI 호환 서버 주소 (예: 로컬 모의 서버 http://127.0.0.1:8001/v1). 비우면 OpenAI 기본 주소
+BASE_URL = os.getenv("LLM_BASE_URL") or os.getenv("OPENAI_BASE_URL")
+
+POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "64"))                 # 동시 세션 수 기준 keep-alive 커넥션 수
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))    # 연결 제한 시간(초)
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "30"))         # 응답 읽기 제한 시간(초)
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))              # 재시도 횟수 (최초 호출 제외)
+RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+
+# 재시도 대상 HTTP 상태 코드 (429 + 5xx)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+Message = Dict[str, str]
+
+
+def resolve_api_key(api_key: Optional[str], base_url: Optional[str]) -> Optional[str]:
+    """
+    API 키 결정. 로컬 모의 서버처럼 base_url 을 직접 지정했는데 키가 없으면
+    SDK 가 키 누락으로 실패하지 않도록 자리 표시용 키를 쓴다.
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key and base_url:
+        return "mock"
+    return api_key
+
+
+@dataclass
+class LLMResponse:
+    """LLM 호출 결과 (본문 + 로그용 메타 정보)."""
+    text: str
+    model: str
+    stage: Optional[str] = None
+    latency: float = 0.0       # 전체 응답 시간(초)
+    ttft: float = 0.0          # 첫 토큰까지 걸린 시간(초)
+    attempts: int = 1          # 재시도 포함 실제 호출 횟수
+    usage: Dict[str, Any] = field(default_factory=dict)
+    source: str = "upstream"   # upstream | cache | coalesced | fallback
+    route: Optional[str] = None     # 모델 라우팅 항목 이름 (routing.Route.name)
+    slo_ms: Optional[int] = None    # 해당 route 의 목표 응답 시간(ms)
+    error: Optional[str] = None     # fallback 으로 대체된 경우 원인
+    hedged: bool = False            # 복제(헤지) 요청을 보냈는지
+    queue_wait: float = 0.0         # 스케줄러 대기열에서 기다린 시간(초)
+    replayed: bool = False          # 중단된 스크립트 실행에서 이미 받아 둔 응답을 다시 사용했는지 (GPT 재호출 없음)
+
+    @property
+    def slo_met(self) -> Optional[bool]:
+        if self.slo_ms is None:
+            return None
+        return self.latency * 1000 <= self.slo_ms
+
+    @property
+    def prompt_tokens(self) -> Optional[int]:
+        return self.usage.get("prompt_tokens") if self.usage else None
+
+    @property
+    def cached_tokens(self) -> Optional[int]:
+        """업스트림 프롬프트 캐시에서 재사용된 입력 토큰 수 (usage 가 없으면 None)."""
+        return cached_tokens(self.usage) if self.usage else None
+
+    def meta(self) -> Dict[str, Any]:
+        """chat_log.jsonl 에 같이 저장할 메타 정보."""
+        return {
+            "model": self.model,
+            "stage": self.stage,
+            "ttft": self.ttft,
+            "latency": self.latency,
+            "attempts": self.attempts,
+            "source": self.source,
+            "route": self.route,
+            "slo_ms": self.slo_ms,
+            "slo_met": self.slo_met,
+            "fallback": self.source == "fallback",   # 연구 분석 시 걸러낼 수 있도록 표시
+            "error": self.error,
+            "hedged": self.hedged,
+            "queue_wait": self.queue_wait,
+            "replayed": self.replayed,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+        }
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS
+    # 타임아웃 / 연결 끊김
+    return isinstance(exc, APIConnectionError)
+
+
+def _retry_delay(exc: Exception, attempt: int) -> float:
+    """지수 백오프 + full jitter. 429 의 Retry-After 헤더가 있으면 우선 사용."""
+    if isinstance(exc, APIStatusError):
+        retry_after = exc.response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), RETRY_MAX_DELAY)
+            except ValueError:
+                pass
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+def cache_lookup(cache: ResponseCache, messages, stage, model):
+    """
+    캐시 조회 공통 함수 (동기/비동기 경로 공용).
+    반환: (cache_key 또는 None, 캐시된 LLMResponse 또는 None)
+    - 해당 stage 에서 캐시가 꺼져 있으면 (None, None)
+    """
+    if not cache.enabled_for(stage):
+        return None, None
+
+    key = make_cache_key(stage, model, messages)
+    cached = cache.get(key)
+    if cached is None:
+        return key, None
+
+    return key, LLMResponse(text=cached, model=model, stage=stage, attempts=0, source="cache")
+
+
+class LLMClient:
+    """
+    프로세스 전체에서 공유하는 LLM 클라이언트.
+    - keep-alive 커넥션 풀 (동시 세션 수 기준)
+    - 호출마다 connect/read 제한 시간
+    - 429/5xx/타임아웃에 대해 jitter 백오프로 제한된 횟수만큼 재시도
+    - 같은 (model, messages) 요청이 진행 중이면 새로 호출하지 않고 결과를 같이 받음 (single-flight)
+    - 모델별 서킷 브레이커 + 호출당 전체 제한 시간(deadline)
+    - (선택) p95 안에 응답이 없으면 복제 요청을 보내 먼저 끝난 쪽 사용 (헤지)
+    - 분당 요청/토큰 전역 rate limit: 429 를 받기 전에 예약 순서대로 대기
+    - 공정 스케줄러: 자리가 부족하면 마무리 턴 우선 + 세션 라운드로빈 + 교실별 동시 호출 제한
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        pool_size: int = POOL_SIZE,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        cache: Optional[ResponseCache] = None,
+        deadline: float = DEADLINE,
+        breakers: Optional[BreakerRegistry] = None,
+        hedging: Optional[HedgePolicy] = None,
+        limiter: Optional[TokenBucketLimiter] = None,
+        scheduler: Optional[FairScheduler] = None,
+        prompt_cache: Optional[PromptCacheStats] = None,
+    ):
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.cache = cache or get_response_cache()
+        self.flights = SingleFlight()  # 동일 요청 합치기
+        self.breakers = breakers or get_breakers()
+        self.hedging = hedging or get_hedge_policy()
+        self.limiter = limiter or get_rate_limiter()
+        self.scheduler = scheduler or get_scheduler()
+        self.prompt_cache = prompt_cache or get_prompt_cache_stats()
+        # 헤지 모드에서 원 요청 / 복제 요청을 실행하는 스레드 (필요할 때만 생성됨)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=pool_size * 2, thread_name_prefix="llm-hedge")
+
+        self.http = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=60,
+            ),
+            timeout=self.timeout,
+        )
+        # 재시도는 여기서 직접 처리하므로 SDK 자체 재시도는 끈다
+        base_url = base_url or BASE_URL
+        self.openai = OpenAI(
+            api_key=resolve_api_key(api_key, base_url),
+            base_url=base_url,
+            http_client=self.http,
+            max_retries=0,
+            timeout=self.timeout,
+        )
+
+    # -------------------------------
+    # 1) 일반 호출
+    # -------------------------------
+    def complete(
+        self,
+        messages: List[Message],
+        stage: Optional[str] = None,
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        session_id: Optional[str] = None,
+        classroom: Optional[str] = None,
+        **options,
+    ) -> LLMResponse:
+        """session_id / classroom: 공정 스케줄러의 라운드로빈 / 교실별 제한 단위."""
+        model = model or DEFAULT_MODEL
+
+        cache_key, cached = cache_lookup(self.cache, messages, stage, model)
+        if cached is not None:
+            return cached
+
+        start = time.time()
+        result, leader = self.flights.do(
+            make_flight_key(model, messages, options),
+            lambda publish: self._scheduled(
+                stage,
+                session_id,
+                classroom,
+                lambda deadline: self._guarded(
+                    model,
+                    lambda: self._hedged(
+                        model,
+                        stage,
+                        False,
+                        lambda race, index: self._complete_upstream(
+                            messages, stage, model, timeout, options, deadline, race, index
+                        ),
+                    ),
+                ),
+            ),
+        )
+        if not leader:
+            waited = round(time.time() - start, 2)
+            return replace(result, stage=stage, latency=waited, ttft=waited, attempts=0, source="coalesced")
+
+        self.prompt_cache.record(stage, result.usage, result.ttft)
+        if cache_key:
+            self.cache.put(cache_key, result.text, stage=result.stage, model=result.model)
+        return result
+
+    # -------------------------------
+    # 2) 스트리밍 호출
+    # -------------------------------
+    def stream(
+        self,
+        messages: List[Message],
+        stage: Optional[str] = None,
+        model: Optional[str] = None,
+        on_delta: Optional[Callable[[str], None]] = None,
+        timeout: Optional[float] = None,
+        session_id: Optional[str] = None,
+        classroom: Optional[str] = None,
+        **options,
+    ) -> LLMResponse:
+        """
+        토큰이 도착할 때마다 on_delta(지금까지의 텍스트)를 호출한다.
+        재시도는 스트림 연결 단계(첫 토큰 전)에서만 한다.
+        같은 요청이 이미 진행 중이면 그 스트림의 중간 텍스트를 같이 받는다.
+        """
+        model = model or DEFAULT_MODEL
+
+        cache_key, cached = cache_lookup(self.cache, messages, stage, model)
+        if cached is not None:
+            if on_delta:
+                on_delta(cached.text)
+            return cached
+
+        start = time.time()
+        first_delta = {}
+
+        def on_partial(partial: str):
+            first_delta.setdefault("ttft", round(time.time() - start, 2))
+            if on_delta:
+                on_delta(partial)
+
+        result, leader = self.flights.do(
+            make_flight_key(model, messages, options),
+            lambda publish: self._scheduled(
+                stage,
+                session_id,
+                classroom,
+                lambda deadline: self._guarded(
+                    model,
+                    lambda: self._hedged(
+                        model,
+                        stage,
+                        True,
+                        lambda race, index: self._stream_upstream(
+                            messages, stage, model, timeout, options, publish, deadline, race, index
+                        ),
+                        publish,
+                    ),
+                ),
+            ),
+            on_delta=on_partial,
+        )
+        if not leader:
+            waited = round(time.time() - start, 2)
+            return replace(
+                result,
+                stage=stage,
+                latency=waited,
+                ttft=first_delta.get("ttft", waited),
+                attempts=0,
+                source="coalesced",
+            )
+
+        self.prompt_cache.record(stage, result.usage, result.ttft)
+        if cache_key:
+            self.cache.put(cache_key, result.text, stage=result.stage, model=result.model)
+        return result
+
+    # -------------------------------
+    # 공정 스케줄러
+    # -------------------------------
+    def _scheduled(self, stage, session_id, classroom, call: Callable[[float], LLMResponse]) -> LLMResponse:
+        """
+        스케줄러에서 자리를 받은 뒤 call(deadline) 호출. 제한 시간 안에 차례가 오지 않으면 DeadlineExceeded.
+        deadline(절대 시각)은 대기열에 들어가기 전에 한 번만 정한다 → 대기 + rate limit + 재시도 + 스트리밍 전체가 LLM_DEADLINE 안.
+        """
+        deadline = time.time() + self.deadline
+        try:
+            with self.scheduler.slot(session_id, classroom, stage, timeout=self.deadline) as ticket:
+                result = call(deadline)
+        except TimeoutError as exc:
+            raise DeadlineExceeded(str(exc)) from exc
+        return replace(result, queue_wait=ticket.wait_time)
+
+    # -------------------------------
+    # 서킷 브레이커
+    # -------------------------------
+    def _guarded(self, model: str, call: Callable[[], LLMResponse]) -> LLMResponse:
+        """브레이커가 열려 있으면 바로 CircuitOpenError. 호출 결과(성공/실패)는 브레이커에 기록."""
+        breaker = self.breakers.get(model)
+        if not breaker.allow():
+            raise CircuitOpenError(f"circuit open: {model}")
+
+        start = time.time()
+        try:
+            result = call()
+        except Exception:
+            breaker.record(False, time.time() - start)
+            raise
+        breaker.record(True, result.latency)
+        return result
+
+    # -------------------------------
+    # 헤지 요청
+    # -------------------------------
+    def _hedged(self, model: str, stage: Optional[str], stream: bool, attempt, publish=None) -> LLMResponse:
+        """
+        attempt(race, index) 로 업스트림을 호출한다. (진 시도는 None 을 반환)
+        (모델, 턴 종류)의 p95 가 지나도 첫 토큰이 없으면 복제 요청을 1번 보내고, 먼저 claim 한 쪽의 결과를 쓴다.
+        진 스트림은 첫 토큰에서 스스로 닫힌다.
+        동기 일반 호출은 응답을 다 받을 때까지 스레드 / 연결 / rate limit 예약을 되돌릴 수 없으므로 헤지하지 않는다
+        (p95 기록만 함. 비동기 경로는 진 Task 를 취소할 수 있어 일반 호출도 헤지).
+        """
+        key = hedge_key(model, stage, stream)
+        delay = self.hedging.delay(key) if stream else None
+        if delay is None:
+            result = attempt(None, 0)
+            self.hedging.record(key, result.ttft if stream else result.latency)
+            return result
+
+        start = time.time()
+        race = HedgeRace()
+        futures = [self._hedge_pool.submit(attempt, race, 0)]
+        hedge_decided = False
+        hedge_offset = 0.0
+        seen = ""
+        error = None
+
+        while True:
+            wait(futures, timeout=PARTIAL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+
+            # 스트리밍 중간 텍스트는 호출한 스레드에서 전달 (Streamlit 요소는 스크립트 스레드에서만 갱신 가능)
+            if publish and race.partial != seen:
+                seen = race.partial
+                publish(seen)
+
+            for index, future in enumerate(futures):
+                if not future.done():
+                    continue
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                result = future.result()
+                if result is None:
+                    continue
+                if index == 1:
+                    # 사용자가 실제로 기다린 시간 기준으로 맞춤
+                    result = replace(
+                        result,
+                        latency=round(result.latency + hedge_offset, 2),
+                        ttft=round(result.ttft + hedge_offset, 2),
+                    )
+                result = replace(result, hedged=len(futures) > 1)
+                self.hedging.record(key, result.ttft if stream else result.latency, hedge_won=index == 1)
+                return result
+
+            if not hedge_decided and race.winner is None and not futures[0].done() and time.time() - start >= delay:
+                hedge_decided = True
+                if self.hedging.allow():
+                    hedge_offset = time.time() - start
+                    print(f"[LLM HEDGE] {key} no response after {delay:.2f}s, sending duplicate request")
+                    futures.append(self._hedge_pool.submit(attempt, race, 1))
+
+            if all(future.done() for future in futures):
+                raise error
+
+    def _throttle(self, tokens: int, deadline: float):
+        """
+        전역 rate limit 에 자리를 예약하고 차례가 올 때까지 기다린다 (429 대신 대기열).
+        제한 시간 안에 차례가 오지 않으면 예약을 돌려놓고 DeadlineExceeded (→ fallback).
+        """
+        wait = self.limiter.reserve(tokens)
+        if wait > 0 and time.time() + wait >= deadline:
+            self.limiter.refund(tokens)
+            raise DeadlineExceeded(f"rate limit queue {wait:.1f}s exceeds deadline")
+        self.limiter.sleep(wait)
+
+    def _call_timeout(self, timeout: Optional[float], deadline: float) -> httpx.Timeout:
+        """이번 시도의 제한 시간: 기본 connect/read 와 남은 전체 제한 시간 중 짧은 쪽."""
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"deadline {self.deadline}s exceeded")
+        read = min(timeout or self.timeout.read, remaining)
+        return httpx.Timeout(read, connect=min(self.timeout.connect, remaining))
+
+    # -------------------------------
+    # 업스트림 실제 호출 (single-flight 리더만 실행)
+    # -------------------------------
+    def _complete_upstream(
+        self, messages, stage, model, timeout, options, deadline, race=None, index=0
+    ) -> Optional[LLMResponse]:
+        start = time.time()
+        tokens = estimate_tokens(messages, options.get("max_tokens"))
+
+        def call():
+            return self.openai.chat.completions.create(
+                model=model,
+                messages=messages,
+                timeout=self._call_timeout(timeout, deadline),
+                **options,
+            )
+
+        # rate limit 예약은 재시도와 상관없이 호출 1번에 1번
+        self._throttle(tokens, deadline)
+        try:
+            response, attempts = self._with_retries(call, deadline)
+        except Exception:
+            self.limiter.refund(tokens)  # 응답을 못 받음 (429 / 5xx / 타임아웃) → 사용량을 모르므로 예약 반납
+            raise
+        elapsed = round(time.time() - start, 2)
+        if response.usage:
+            self.limiter.adjust(response.usage.total_tokens - tokens)
+
+        if race is not None and not race.claim(index):
+            return None  # 헤지 상대가 먼저 끝남
+
+        return LLMResponse(
+            text=response.choices[0].message.content or "",
+            model=model,
+            stage=stage,
+            latency=elapsed,
+            ttft=elapsed,  # 일반 모드에서는 첫 토큰 = 전체 응답
+            attempts=attempts,
+            usage=response.usage.model_dump() if response.usage else {},
+        )
+
+    def _stream_upstream(
+        self, messages, stage, model, timeout, options, publish, deadline, race=None, index=0
+    ) -> Optional[LLMResponse]:
+        start = time.time()
+
+        def emit(partial: str):
+            if race is None:
+                publish(partial)
+            else:
+                # 헤지 모드: 중간 텍스트는 race 에 두고 호출한 스레드가 전달
+                race.publish(index, partial)
+
+        tokens = estimate_tokens(messages, options.get("max_tokens"))
+
+        def call():
+            if race is not None and race.winner not in (None, index):
+                return None  # 재시도 전에 헤지 상대가 이미 첫 토큰을 받음 → 연결 없이 종료
+            return self.openai.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=self._call_timeout(timeout, deadline),
+                **options,
+            )
+
+        # rate limit 예약은 재시도와 상관없이 호출 1번에 1번
+        self._throttle(tokens, deadline)
+        try:
+            response, attempts = self._with_retries(call, deadline)
+        except Exception:
+            self.limiter.refund(tokens)  # 스트림 연결 실패 → 사용량을 모르므로 예약 반납
+            raise
+        if response is None:
+            self.limiter.refund(tokens)
+            return None
+
+        ttft = None
+        chunks = []
+        usage = {}
+        for event in response:
+            if time.time() > deadline:
+                response.close()
+                raise DeadlineExceeded(f"deadline {self.deadline}s exceeded while streaming")
+            if event.usage:
+                usage = event.usage.model_dump()
+            if not event.choices:
+                continue
+            delta = event.choices[0].delta.content
+            if not delta:
+                continue
+
+            if ttft is None:
+                if race is not None and not race.claim(index):
+                    response.close()  # 헤지 상대가 먼저 첫 토큰을 받음 → 이 스트림은 취소
+                    return None
+                ttft = round(time.time() - start, 2)  # ⏱️ 첫 토큰 도착
+
+            chunks.append(delta)
+            emit("".join(chunks))
+
+        if usage:
+            self.limiter.adjust(usage.get("total_tokens", tokens) - tokens)
+
+        if race is not None and not race.claim(index):
+            return None
+
+        elapsed = round(time.time() - start, 2)  # ⏱️ 완료
+
+        return LLMResponse(
+            text="".join(chunks),
+            model=model,
+            stage=stage,
+            latency=elapsed,
+            ttft=ttft if ttft is not None else elapsed,
+            attempts=attempts,
+            usage=usage,
+        )
+
+    # -------------------------------
+    # 통계 (캐시 / single-flight / 서킷 브레이커 / 헤지 / rate limit / 스케줄러 / 프롬프트 캐시 / 비동기 러너)
+    # -------------------------------
+    def stats(self) -> Dict[str, Any]:
+        # async_runner 가 이 모듈을 import 하므로 여기서 import (순환 import 방지)
+        from backend.core.async_runner import async_runner_stats
+
+        return {
+            "cache": self.cache.stats(),
+            "singleflight": self.flights.stats(),
+            "breakers": self.breakers.stats(),
+            "hedging": self.hedging.stats(),
+            "rate_limit": self.limiter.stats(),
+            "scheduler": self.scheduler.stats(),
+            "prompt_cache": self.prompt_cache.stats(),
+            "async_runner": async_runner_stats(),
+        }
+
+    # -------------------------------
+    # 3) 재시도 루프
+    # -------------------------------
+    def _with_retries(self, call, deadline: float):
+        attempt = 0
+        while True:
+            try:
+                return call(), attempt + 1
+            except Exception as exc:
+                if attempt >= self.max_retries or not _is_retryable(exc):
+                    raise
+                delay = _retry_delay(exc, attempt)
+                if time.time() + delay >= deadline:
+                    raise DeadlineExceeded(f"deadline {self.deadline}s exceeded after {attempt + 1} attempts") from exc
+                print(f"[LLM RETRY] attempt={attempt + 1} delay={delay:.2f}s error={exc!r}")
+                time.sleep(delay)
+                attempt += 1
+
+
+# -------------------------------
+# 프로세스 단위 싱글톤
+# -------------------------------
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """프로세스 전체에서 하나의 LLMClient(커넥션 풀)를 공유한다."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client
@@ -0,0 +1,398 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.core.budget import BudgetReport, PromptBudget, Section
+from backend.core.structured import STRUCTURED_INSTRUCTION
+from backend.core.template import as_template
+
+# -------------------------------
+# 대화 엔진 (Streamlit 없이 동작하는 순수 FSM)
+# -------------------------------
+# 앱의 process_flow 와 헤드리스 시뮬레이터(simulate.py)가 같은 전이 표를 쓴다.
+# 기본 시나리오: state 1=S1 활동묻기, 2=S2 기억회상, 3=S3 마무리 / substep 1~6
+#   - 홀수 substep(1, 3, 5): 봇 발화 턴 (고정 질문 또는 GPT)
+#   - 짝수 substep(2, 4, 6): 아이 입력 턴
+#   - state=3, substep=6: 대화 종료
+
+# ------------------------------
+# 고정 질문
+# ------------------------------
+RULE_QUESTIONS = {
+    1: "친구야, 오늘 어땠어?",
+    2: "오늘 활동 중에 가장 기억에 남았던 순간은 뭐였어?",
+    3: "마지막으로, 오늘 활동을 마치며 봉봉이에게 하고 싶은 말 있을까?"
+}
+
+# ------------------------------
+# 단계 라벨 (프롬프트에 넣는 사람용 라벨)
+# ------------------------------
+STAGE_LABELS = {
+    1: "S1 활동묻기 단계",
+    2: "S2 기억회상 단계",
+    3: "S3 활동 마무리 단계",
+}
+
+# ------------------------------
+# 템플릿별 시스템 메시지 (봉봉 역할 지시)
+# ------------------------------
+# 프롬프트 파일에 "system" 이 있으면 그쪽이 우선 (prompt_compose.py). 이전 형식 파일용 기본값.
+SYSTEM_MESSAGES = {
+    "empathy_free_question": (
+        "너는 어린이를 따뜻하게 도와주는 상담 챗봇 '봉봉'이야. "
+        "친근한 반말로 말하고, 아이의 감정을 존중하면서 부드럽게 반응해."
+    ),
+    "empathy_rule_question": (
+        "너는 어린이를 따뜻하게 도와주는 상담 챗봇 '봉봉'이야. "
+        "친근한 반말로 말하고, 아이의 말을 먼저 공감해 준 뒤, "
+        "이번 턴에서 사용할 고정 질문을 자연스럽게 한 번만 사용해야 해."
+    ),
+    "empathy_ending_message": (
+        "너는 오늘 활동을 마무리하는 마지막 인사를 하는 상담 챗봇 '봉봉'이야. "
+        "절대 질문을 하지 말고, 마지막 문장은 반드시 '안녕'으로 끝내야 해."
+    ),
+}
+
+# ------------------------------
+# prompts.json 템플릿별로 앱이 채우는 플레이스홀더 (로드 시점 검증용)
+# ------------------------------
+TEMPLATE_FIELDS = {
+    "empathy_free_question": ("stage_label", "user_message", "fixed_questions", "generated_questions"),
+    "empathy_rule_question": ("stage_label", "prev_answer", "rule_question", "fixed_questions", "generated_questions"),
+    "empathy_ending_message": ("user_message", "fixed_questions", "generated_questions"),
+}
+
+# ------------------------------
+# 기본 시나리오 (update / update_time / high_grade / low_grade 앱)
+# ------------------------------
+# stages: 단계별 라벨 / 고정 질문 / 첫 발화 방식 / 공감 턴 수
+#   - opening: "rule"(고정 질문을 그대로 말함) | "llm"(직전 답변 공감 + 고정 질문, rule_question 템플릿)
+#   - empathy_turns: 첫 발화 뒤 공감 + 자유 질문 턴 수. 마지막 단계의 마지막 공감 턴은 마무리(ending) 턴
+# templates: 턴 종류 → 프롬프트 템플릿 이름 (앱마다 다를 수 있음)
+DEFAULT_SCENARIO = {
+    "templates": {
+        "free_question": "empathy_free_question",
+        "rule_question": "empathy_rule_question",
+        "ending": "empathy_ending_message",
+    },
+    "stages": [
+        {"label": STAGE_LABELS[1], "rule_question": RULE_QUESTIONS[1], "opening": "rule", "empathy_turns": 2},
+        {"label": STAGE_LABELS[2], "rule_question": RULE_QUESTIONS[2], "opening": "llm", "empathy_turns": 2},
+        {"label": STAGE_LABELS[3], "rule_question": RULE_QUESTIONS[3], "opening": "llm", "empathy_turns": 2},
+    ],
+}
+
+# 시나리오 파일(JSON) 경로. 비어 있으면 호출하는 쪽에서 넘긴 기본 경로 사용
+SCENARIO_PATH = os.getenv("SCENARIO_PATH", "")
+
+# ------------------------------
+# 프롬프트 배치 방식
+# ------------------------------
+# inline: 템플릿 본문 안에 값을 바로 채움 (기존 방식)
+# prefix: 역할 / 활동 맥락 / 규칙을 매 턴 같은 앞부분으로 두고 이번 턴 값은 맨 뒤에 붙임
+#         → 업스트림 프롬프트 캐시(cached_tokens)에 걸려 입력 토큰 비용 / 첫 토큰 시간이 줄어든다
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "inline").lower()
+if PROMPT_LAYOUT not in ("inline", "prefix"):
+    raise ValueError(f"PROMPT_LAYOUT must be 'inline' or 'prefix', got {PROMPT_LAYOUT!r}")
+
+# ------------------------------
+# 턴 값 토큰 예산 (budget.py)
+# ------------------------------
+# 템플릿에 채우는 값 전체의 토큰 예산. 넘으면 생성된 자유 질문 목록의 오래된 질문부터 빼고 "(… N개 생략)" 으로 요약
+# (고정 질문 / 아이 답변 / 단계 라벨은 줄이지 않음). 0 이면 예산 없음.
+PROMPT_BUDGET_TOKENS = int(os.getenv("PROMPT_BUDGET_TOKENS", "400"))
+QUESTION_HISTORY_ALLOWANCE = int(os.getenv("PROMPT_BUDGET_QUESTIONS", "160"))   # 자유 질문 목록에 먼저 보장하는 토큰
+
+# prefix 배치에서 값 블록 순서: 세션 내내 같은 값 → 단계마다 바뀌는 값 → 턴마다 바뀌는 값
+PREFIX_VALUE_ORDER = (
+    "fixed_questions",
+    "stage_label",
+    "rule_question",
+    "generated_questions",
+    "prev_answer",
+    "user_message",
+)
+
+
+@dataclass(frozen=True)
+class Transition:
+    """전이 표의 한 칸: (state, substep) 에서 할 일과 그 다음 상태."""
+    kind: str                          # "rule" | "llm" | "user" | "end"
+    next_state: int
+    next_substep: int
+    turn_kind: Optional[str] = None    # llm 턴 종류: free_question / rule_question / ending
+    template: Optional[str] = None
+    turn: int = 0                      # 단계 안에서 몇 번째 공감 턴인지 (1부터)
+    text: Optional[str] = None         # rule 턴에 그대로 말할 문장
+    rule_question: Optional[str] = None
+    stage_label: str = ""
+
+
+class Scenario:
+    """
+    시나리오 정의 → (state, substep) 전이 표로 한 번 컴파일해 두고 O(1) 조회.
+    단계 수 / 단계별 공감 턴 수가 달라도 코드 변경 없이 정의만 바꾸면 된다.
+    단계 i 의 substep: 1=첫 발화, 2=아이, 3=공감 1턴, 4=아이, ..., 2k+1=공감 k턴, 2k+2=아이(다음 단계로)
+    마지막 단계의 마지막 substep 은 대화 종료 상태.
+    """
+
+    def __init__(self, name: str, config: Dict[str, Any]):
+        self.name = name
+        self.templates = {**DEFAULT_SCENARIO["templates"], **config.get("templates", {})}
+        self.stages: List[Dict[str, Any]] = config.get("stages") or DEFAULT_SCENARIO["stages"]
+
+        if self.stages[-1].get("empathy_turns", 0) < 1:
+            raise ValueError(f"시나리오 '{name}': 마지막 단계에는 마무리 턴(empathy_turns >= 1)이 필요합니다.")
+
+        self.rule_questions = {i: stage["rule_question"] for i, stage in enumerate(self.stages, 1)}
+        self.stage_labels = {i: stage.get("label", f"S{i}") for i, stage in enumerate(self.stages, 1)}
+        self.table = self._compile()
+        self.final = (len(self.stages), 2 * self.stages[-1]["empathy_turns"] + 2)
+
+    def _llm(self, turn_kind: str, state: int, next_substep: int, **fields) -> Transition:
+        return Transition(
+            "llm", state, next_substep,
+            turn_kind=turn_kind,
+            template=self.templates[turn_kind],
+            stage_label=self.stage_labels[state],
+            **fields,
+        )
+
+    def _compile(self) -> Dict[Tuple[int, int], Transition]:
+        table = {}
+        last_stage = len(self.stages)
+
+        for state, stage in enumerate(self.stages, 1):
+            turns = stage.get("empathy_turns", 2)
+            rule_question = stage["rule_question"]
+
+            # substep 1: 단계 첫 발화
+            if stage.get("opening", "llm") == "rule":
+                table[(state, 1)] = Transition("rule", state, 2, text=rule_question, stage_label=self.stage_labels[state])
+            else:
+                table[(state, 1)] = self._llm("rule_question", state, 2, rule_question=rule_question)
+
+            # substep 3, 5, ...: 공감 턴 (마지막 단계의 마지막 턴은 마무리)
+            for turn in range(1, turns + 1):
+                substep = 2 * turn + 1
+                is_ending = state == last_stage and turn == turns
+                table[(state, substep)] = self._llm("ending" if is_ending else "free_question", state, substep + 1, turn=turn)
+
+            # substep 2, 4, ...: 아이 입력 → 다음 봇 턴 / 다음 단계
+            for turn in range(1, turns + 2):
+                substep = 2 * turn
+                if turn <= turns:
+                    table[(state, substep)] = Transition("user", state, substep + 1)
+                elif state < last_stage:
+                    table[(state, substep)] = Transition("user", state + 1, 1)
+                else:
+                    table[(state, substep)] = Transition("end", state, substep)
+
+        return table
+
+    def transition(self, state: int, substep: int) -> Transition:
+        """표에 없는 상태(예: 시나리오가 바뀐 뒤 남은 세션)는 종료로 취급."""
+        return self.table.get((state, substep)) or Transition("end", state, substep)
+
+    def is_finished(self, state: int, substep: int) -> bool:
+        return self.transition(state, substep).kind == "end"
+
+    def accepts_input(self, state: int, substep: int) -> bool:
+        """아이 입력창을 보여줄 상태인지 (입력 턴이면서 대화가 끝나지 않음)."""
+        t = self.table.get((state, substep))
+        return t is not None and t.kind == "user"
+
+    @classmethod
+    def from_file(cls, name: str, path: str) -> "Scenario":
+        """
+        시나리오 파일 형식 (앱 이름 → 기본 시나리오에서 바꿀 부분만):
+            {
+              "all_memory_app": {"templates": {"free_question": "gpt_free_followup", ...}},
+              "short_app": {"stages": [{"label": "S1", "rule_question": "...", "opening": "rule", "empathy_turns": 1}]}
+            }
+        """
+        config = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                config = json.load(f).get(name, {})
+        return cls(name, config)
+
+
+@dataclass
+class BotAction:
+    """
+    next_action() 결과: 이번 실행에서 할 일 1개.
+    - kind:
+        "user"   : 아이 입력을 기록하고 (state, substep) 으로 이동
+        "rule"   : 고정 문장(text)을 그대로 말함
+        "llm"    : template 으로 GPT 응답 생성 (turn_kind: free_question / rule_question / ending)
+        "wait"   : 아이 입력을 기다림 (할 일 없음)
+        "ignore" : 봇 턴에 들어온 입력 → 무시
+        "end"    : 대화 종료 상태
+    - state / substep: 이 행동을 마친 뒤의 다음 상태
+    """
+    kind: str
+    state: int
+    substep: int
+    template: Optional[str] = None
+    stage: int = 0
+    turn: int = 0
+    text: Optional[str] = None
+    user_message: str = ""
+    rule_question: Optional[str] = None
+    turn_kind: Optional[str] = None
+    stage_label: str = ""
+
+
+def next_action(
+    state: int,
+    substep: int,
+    messages: List[Dict[str, str]],
+    generated_questions: Optional[List[str]] = None,
+    user_input: Optional[str] = None,
+    scenario: Optional[Scenario] = None,
+) -> BotAction:
+    """
+    현재 (state, substep, 대화 기록, 아이 입력) → 다음 행동 (전이 표 1번 조회).
+    세션 상태를 직접 바꾸지 않으므로 Streamlit / CLI / 테스트 어디서든 같은 결과.
+    generated_questions 는 GPT 턴 프롬프트(render_prompt)에 쓰이며 전이 규칙에는 영향 없음.
+    """
+    t = (scenario or get_scenario()).table.get((state, substep))
+
+    # 0. 대화 종료 후 입력/자동진행 완전 차단 (표에 없는 상태도 종료로 취급)
+    if t is None or t.kind == "end":
+        return BotAction("end", state, substep)
+
+    # 1. 아이 입력 처리. 봇 발화 턴에 들어온 입력은 무시
+    if user_input:
+        if t.kind != "user":
+            return BotAction("ignore", state, substep)
+        return BotAction("user", t.next_state, t.next_substep, user_message=user_input)
+
+    if t.kind == "user":
+        return BotAction("wait", state, substep)
+
+    # 2. 봇 자동 발화 (직전 아이 말 기준). 매 실행 호출되므로 필드 순서대로 위치 인자로 만든다
+    return BotAction(
+        t.kind, t.next_state, t.next_substep, t.template, state, t.turn, t.text,
+        messages[-1]["message"] if messages else "",
+        t.rule_question, t.turn_kind, t.stage_label,
+    )
+
+
+# -------------------------------
+# 프로세스 단위 캐시 (앱별 시나리오를 한 번만 컴파일)
+# -------------------------------
+_scenarios: Dict[str, Scenario] = {}
+_scenarios_lock = threading.Lock()
+
+
+def get_scenario(name: str = "default", default_path: str = "") -> Scenario:
+    """앱 이름별 컴파일된 시나리오. SCENARIO_PATH 가 있으면 그 파일을 우선 사용."""
+    scenario = _scenarios.get(name)
+    if scenario is None:
+        with _scenarios_lock:
+            scenario = _scenarios.get(name)
+            if scenario is None:
+                scenario = _scenarios[name] = Scenario.from_file(name, SCENARIO_PATH or default_path)
+    return scenario
+
+
+# -------------------------------------------------
+# 프롬프트 유틸 함수들
+# -------------------------------------------------
+def apply_prompt_template(template, **kwargs) -> str:
+    """
+    컴파일된 템플릿(compile_prompts 결과) 또는 prompts.json 의 문자열 리스트에
+    {{key}} 플레이스홀더 값을 채운다. 값이 빠지거나 템플릿에 없는 값을 넘기면 TemplateError.
+    PROMPT_LAYOUT=prefix 이면 값은 본문 대신 맨 뒤 [이번 턴 값] 블록에 붙인다.
+    """
+    if PROMPT_LAYOUT == "prefix":
+        return as_template(template).render_prefixed(PREFIX_VALUE_ORDER, **kwargs)
+    return as_template(template).render(**kwargs)
+
+
+def build_fixed_questions_str(rule_questions: Optional[Dict[int, str]] = None) -> str:
+    """
+    RULE_QUESTIONS 전체를 사람이 읽기 좋은 한 줄 문자열로 만들어준다.
+    예: "친구야, 오늘 어땠어? / 오늘 활동 중에 가장 기억에 남았던 순간은 뭐였어? / ..."
+    """
+    rule_questions = rule_questions or RULE_QUESTIONS
+    return " / ".join(rule_questions[i] for i in sorted(rule_questions.keys()))
+
+
+def format_generated_questions(generated: List[str]) -> str:
+    """지금까지 생성된 자유 질문 목록 문자열. 없으면 '현재까지 생성된 자유 질문 없음'."""
+    if not generated:
+        return "현재까지 생성된 자유 질문 없음"
+    return " / ".join(generated)
+
+
+def fit_turn_values(
+    template_name: str,
+    generated_questions: List[str],
+    budget: Optional[int] = None,
+    **values: str,
+) -> Tuple[Dict[str, str], BudgetReport]:
+    """
+    템플릿 값 + 자유 질문 목록을 토큰 예산에 맞춘다.
+    반환: (apply_prompt_template 에 넘길 값 — generated_questions 포함, 예산 결정 기록)
+    """
+    sections = [Section(name, [value], priority=1, keep="all", joiner="") for name, value in values.items()]
+    sections.append(Section(
+        "generated_questions",
+        generated_questions,
+        priority=0,
+        allowance=QUESTION_HISTORY_ALLOWANCE,
+        joiner=" / ",
+        omitted="(앞선 자유 질문 {n}개 생략)",
+        empty=format_generated_questions([]),
+    ))
+    budget = PROMPT_BUDGET_TOKENS if budget is None else budget
+    return PromptBudget(budget).fit(sections, label=template_name)
+
+
+def build_messages(
+    template_name: str,
+    prompt_text: str,
+    structured: bool = False,
+    system: Optional[str] = None,
+) -> List[Dict[str, str]]:
+    """
+    GPT에 보낼 messages 목록 생성.
+    - system: 프롬프트 파일의 템플릿별 system 메시지 (PromptSet.system), 없으면 SYSTEM_MESSAGES
+    - user  : 템플릿을 채운 프롬프트
+    - structured=True 이면 JSON {empathy, question} 형식 안내를 system 에 덧붙임
+    """
+    system = system or SYSTEM_MESSAGES[template_name]
+    if structured:
+        system += "\n" + STRUCTURED_INSTRUCTION
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": prompt_text},
+    ]
+
+
+def render_prompt(
+    prompts: Dict[str, List[str]],
+    action: BotAction,
+    generated_questions: List[str],
+    scenario: Optional[Scenario] = None,
+) -> str:
+    """GPT 행동(action.kind == "llm")의 템플릿을 앱과 같은 값으로 채운다."""
+    scenario = scenario or get_scenario()
+    fields = {"fixed_questions": build_fixed_questions_str(scenario.rule_questions)}
+    if action.turn_kind == "free_question":
+        fields.update(stage_label=action.stage_label, user_message=action.user_message)
+    elif action.turn_kind == "rule_question":
+        fields.update(
+            stage_label=action.stage_label,
+            prev_answer=action.user_message,
+            rule_question=action.rule_question,
+        )
+    else:
+        fields.update(user_message=action.user_message)
+    values, _ = fit_turn_values(action.template, generated_questions, **fields)
+    return apply_prompt_template(prompts[action.template], **values)
@@ -0,0 +1,46 @@
+import random
+from typing import Iterable, Optional
+
+# -------------------------------
+# LLM 장애 시 사용할 규칙 기반 응답
+# -------------------------------
+# 저학년용(짧은 문장)에도 쓸 수 있도록 모두 짧게 유지
+EMPATHY_PHRASES = [
+    "그랬구나!",
+    "이야기해 줘서 고마워.",
+    "우와, 멋지다!",
+    "정말 그랬겠다.",
+    "잘 들었어!",
+]
+
+# 자유 질문 턴용 일반 질문 (고정 질문은 다음 단계에서 따로 물어보므로 여기서 쓰지 않음)
+FOLLOWUP_QUESTIONS = [
+    "그때 기분이 어땠어?",
+    "조금 더 이야기해 줄래?",
+    "그중에 뭐가 제일 좋았어?",
+    "누구랑 같이 했어?",
+    "다음에 또 해 보고 싶어?",
+]
+
+CLOSING_MESSAGES = [
+    "오늘 이야기 나눠 줘서 정말 고마워. 다음에 또 만나자, 안녕!",
+    "오늘도 멋진 이야기 고마워. 또 이야기하자, 안녕!",
+]
+
+
+def fallback_reply(question: Optional[str] = None, exclude: Iterable[str] = ()) -> str:
+    """
+    공감 한 마디 + 질문.
+    - question 이 있으면 그 질문 사용 (공감 + 다음 고정 질문 턴)
+    - 없으면 FOLLOWUP_QUESTIONS 중 exclude(이미 한 질문)에 없는 것을 고름
+    """
+    if question is None:
+        exclude = set(exclude)
+        candidates = [q for q in FOLLOWUP_QUESTIONS if q not in exclude] or FOLLOWUP_QUESTIONS
+        question = random.choice(candidates)
+    return f"{random.choice(EMPATHY_PHRASES)} {question}"
+
+
+def fallback_closing() -> str:
+    """마무리 턴 (질문 없이 '안녕'으로 끝남)."""
+    return random.choice(CLOSING_MESSAGES)
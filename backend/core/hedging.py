@@ -0,0 +1,145 @@
+import math
+import os
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from backend.core.routing import TURN_KINDS
+
+# -------------------------------
+# 헤지 요청 설정 (환경 변수로 조정 가능)
+# -------------------------------
+HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))   # 이 백분위 시간까지 응답이 없으면 복제 요청
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))     # 백분위 계산에 필요한 최소 표본 수
+HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))              # (모델, 턴 종류)별로 보관할 최근 응답 시간 수
+HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.1"))        # 전체 요청 대비 복제 요청 최대 비율
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))      # 복제 요청 전 최소 대기 시간(초)
+
+HedgeKey = Tuple[str, str, str]
+
+
+def hedge_key(model: str, stage: Optional[str], stream: bool) -> HedgeKey:
+    """
+    (모델, 턴 종류, 기준 시간) 키.
+    - 스트리밍은 첫 토큰까지 시간(ttft), 일반 호출은 전체 응답 시간(latency) 기준
+    """
+    return model, TURN_KINDS.get(stage, stage or ""), "ttft" if stream else "latency"
+
+
+class HedgeRace:
+    """
+    원 요청(0)과 복제 요청(1) 중 먼저 결과를 낸 쪽을 정한다.
+    - 일반 호출: 응답을 다 받은 시점에 claim
+    - 스트리밍: 첫 토큰을 받은 시점에 claim → 진 쪽은 스트림을 닫고 None 반환
+    - partial: 이긴 쪽의 스트리밍 중간 텍스트 (호출한 스레드가 가져가서 화면에 전달)
+    """
+
+    def __init__(self):
+        self.winner: Optional[int] = None
+        self.partial = ""
+        self._lock = threading.Lock()
+
+    def claim(self, index: int) -> bool:
+        with self._lock:
+            if self.winner is None:
+                self.winner = index
+            return self.winner == index
+
+    def publish(self, index: int, partial: str):
+        if self.winner == index:
+            self.partial = partial
+
+
+class HedgePolicy:
+    """
+    꼬리 지연(p99) 줄이기용 헤지 요청 정책.
+    (모델, 턴 종류)별 최근 응답 시간의 p95 까지 결과가 없으면 같은 요청을 한 번 더 보내고,
+    먼저 끝난 쪽을 쓰고 나머지는 취소한다.
+    - 복제 요청 비율은 max_rate 이하로 제한 (업스트림 부하 / 비용 보호)
+    - fired: 복제 요청을 보낸 횟수, won: 복제 요청이 이긴 횟수
+    """
+
+    def __init__(
+        self,
+        enabled: bool = HEDGING,
+        percentile: float = HEDGE_PERCENTILE,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        window: int = HEDGE_WINDOW,
+        max_rate: float = HEDGE_MAX_RATE,
+        min_delay: float = HEDGE_MIN_DELAY,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.max_rate = max_rate
+        self.min_delay = min_delay
+
+        self._samples: Dict[HedgeKey, deque] = {}
+        self._lock = threading.Lock()
+
+        # 통계
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+
+    def delay(self, key: HedgeKey) -> Optional[float]:
+        """
+        이번 요청에서 복제 요청을 보내기 전까지 기다릴 시간(초).
+        헤지를 쓰지 않으면(꺼져 있거나 표본 부족) None.
+        """
+        with self._lock:
+            self.requests += 1
+            if not self.enabled:
+                return None
+            samples = self._samples.get(key)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+            index = min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)
+            return max(self.min_delay, ordered[index])
+
+    def allow(self) -> bool:
+        """복제 요청 비율 제한 확인. 허용하면 fired 를 올린다."""
+        with self._lock:
+            if self.fired + 1 > self.max_rate * self.requests:
+                return False
+            self.fired += 1
+            return True
+
+    def record(self, key: HedgeKey, seconds: float, hedge_won: bool = False):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+            if hedge_won:
+                self.won += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "fired": self.fired,
+                "won": self.won,
+                "hedge_rate": round(self.fired / self.requests, 3) if self.requests else 0.0,
+                "win_rate": round(self.won / self.fired, 3) if self.fired else 0.0,
+            }
+
+
+# -------------------------------
+# 프로세스 단위 싱글톤
+# -------------------------------
+_policy: Optional[HedgePolicy] = None
+_policy_lock = threading.Lock()
+
+
+def get_hedge_policy() -> HedgePolicy:
+    """동기 클라이언트와 비동기 러너가 같은 응답 시간 통계를 공유한다."""
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = HedgePolicy()
+    return _policy
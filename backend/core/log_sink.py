@@ -0,0 +1,245 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# -------------------------------
+# chat_log.jsonl 백그라운드 기록기
+# -------------------------------
+# 메시지마다 스크립트 스레드에서 makedirs → open → write 1줄 → close 하던 것을
+# 메모리 큐에 넣기만 하고 바로 돌아오게 바꾼다. 기록 스레드 1개가 큐를 비우며 여러 줄을 한 번에 쓰고,
+# 파일은 열어 둔 채로 유지한다. 디스크로 내리는 시점(flush / fsync)은 LOG_FLUSH 로 고른다.
+#   turn     : 봇 메시지(= 턴 끝)가 들어 있는 묶음을 쓰면 flush (기본)
+#   interval : LOG_FLUSH_MS 마다 flush (쌓인 줄이 있을 때만)
+#   shutdown : 프로세스 종료 / close() 때만 flush (가장 빠름, 죽으면 버퍼만큼 유실)
+# 어느 정책이든 프로세스가 정상 종료하면 atexit 에서 남은 줄을 모두 쓰고 flush + fsync 한다.
+
+LOG_FLUSH = os.getenv("LOG_FLUSH", "turn").lower()                      # turn | interval | shutdown
+LOG_FLUSH_MS = int(os.getenv("LOG_FLUSH_MS", "200"))                    # interval 정책의 flush 간격(ms)
+LOG_FSYNC = os.getenv("LOG_FSYNC", "false").lower() == "true"           # flush 할 때 fsync 까지 (종료 시에는 항상)
+LOG_BATCH_MAX = int(os.getenv("LOG_BATCH_MAX", "256"))                  # 한 번에 쓰는 최대 줄 수
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))                # 큐가 차면 write() 가 기다림 (메모리 상한)
+LOG_CLOSE_TIMEOUT = float(os.getenv("LOG_CLOSE_TIMEOUT", "5"))          # 종료 시 남은 줄을 쓰는 최대 시간(초)
+
+FLUSH_POLICIES = ("turn", "interval", "shutdown")
+if LOG_FLUSH not in FLUSH_POLICIES:
+    raise ValueError(f"LOG_FLUSH 는 {' / '.join(FLUSH_POLICIES)} 중 하나여야 함: {LOG_FLUSH!r}")
+
+_STOP = object()
+
+
+class _FlushRequest:
+    """flush() 호출 1건: 기록 스레드가 그 앞의 줄을 모두 쓰고 flush 한 뒤 done 을 켠다."""
+    __slots__ = ("done",)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class LogSink:
+    """
+    JSONL 파일 1개에 대한 버퍼 기록기.
+    write() 는 줄을 만들어 큐에 넣기만 한다 (직렬화는 호출한 쪽에서 해서 이후 record 가 바뀌어도 안전).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        policy: str = LOG_FLUSH,
+        flush_ms: int = LOG_FLUSH_MS,
+        fsync: bool = LOG_FSYNC,
+        batch_max: int = LOG_BATCH_MAX,
+        queue_max: int = LOG_QUEUE_MAX,
+    ):
+        if policy not in FLUSH_POLICIES:
+            raise ValueError(f"알 수 없는 flush 정책: {policy!r}")
+        self.path = path
+        self.policy = policy
+        self.flush_interval = flush_ms / 1000
+        self.fsync = fsync
+        self.batch_max = batch_max
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_max)
+        self._file = None
+        self._pending: List[str] = []      # 쓰기 실패한 줄 (다음 묶음과 함께 다시 시도)
+        self._dirty = False                 # 쓴 뒤 아직 flush 하지 않은 줄이 있음
+        self._last_flush = time.monotonic()
+        self._closed = False
+        self._lock = threading.Lock()
+
+        # 통계
+        self.written = 0
+        self.batches = 0
+        self.flushes = 0
+        self.errors = 0
+        self.max_queue = 0
+
+        self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+        self._thread.start()
+
+    # -------------------------------
+    # 스크립트 스레드 쪽
+    # -------------------------------
+    def write(self, record: Dict[str, Any], end_of_turn: bool = False):
+        """record 1개를 JSON 한 줄로 큐에 넣는다. end_of_turn: turn 정책에서 이 줄까지 쓰고 flush."""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        if self._closed:
+            # 종료 후 들어온 줄 (atexit 이후의 다른 정리 코드 등) 은 바로 쓴다
+            with self._lock:
+                self._write_lines([line], flush=True)
+            return
+        self._queue.put((line, end_of_turn))
+        size = self._queue.qsize()
+        if size > self.max_queue:
+            self.max_queue = size
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """지금까지 넣은 줄이 모두 파일에 쓰이고 flush 될 때까지 기다림. 시간 안에 끝나면 True."""
+        if self._closed:
+            return True
+        request = _FlushRequest()
+        self._queue.put(request)
+        return request.done.wait(timeout)
+
+    def close(self, timeout: float = LOG_CLOSE_TIMEOUT):
+        """남은 줄을 모두 쓰고 flush + fsync 후 파일을 닫는다 (atexit 에서 자동 호출)."""
+        if self._closed:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._closed = True
+        with self._lock:
+            # 시간 안에 못 끝냈으면 남은 줄을 여기서 직접 쓴다
+            lines = self._pending + [item[0] for item in self._drain() if isinstance(item, tuple)]
+            self._pending = []
+            if lines:
+                self._write_lines(lines, flush=True)
+            if self._file is not None:
+                try:
+                    self._sync(force_fsync=True)
+                    self._file.close()
+                except OSError as e:
+                    print(f"[LOG SINK] {self.path} 닫기 실패: {e!r}")
+                self._file = None
+        print(f"[LOG SINK] closed {self.path} {self.stats()}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "written": self.written,
+            "batches": self.batches,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "queue": self._queue.qsize(),
+            "max_queue": self.max_queue,
+        }
+
+    # -------------------------------
+    # 기록 스레드 쪽
+    # -------------------------------
+    def _drain(self) -> List[Any]:
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def _run(self):
+        while True:
+            timeout = self.flush_interval if self.policy == "interval" and self._dirty else None
+            try:
+                first = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                first = None
+
+            items = [] if first is None else [first]
+            while first is not None and len(items) < self.batch_max:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = [item[0] for item in items if isinstance(item, tuple)]
+            requests = [item for item in items if isinstance(item, _FlushRequest)]
+            stop = any(item is _STOP for item in items)
+            turn_end = any(item[1] for item in items if isinstance(item, tuple))
+
+            # stop 이면 close() 가 마지막에 flush + fsync 하므로 여기서는 쓰기만
+            flush = bool(requests) or (not stop and (
+                (self.policy == "turn" and turn_end)
+                or (self.policy == "interval" and time.monotonic() - self._last_flush >= self.flush_interval)
+            ))
+            with self._lock:
+                self._write_lines(lines, flush=flush)
+            for request in requests:
+                request.done.set()
+            if stop:
+                return
+
+    def _write_lines(self, lines: List[str], flush: bool):
+        """(lock 안에서) 실패한 줄을 앞에 붙여 한 번에 쓰고, flush 이면 버퍼를 내린다. 실패해도 예외를 올리지 않음."""
+        lines = self._pending + lines
+        self._pending = []
+        if not lines and not (flush and self._dirty):
+            return
+        try:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            if lines:
+                self._file.write("".join(lines))
+                self.written += len(lines)
+                self.batches += 1
+                self._dirty = True
+            if flush:
+                self._sync()
+        except OSError as e:
+            # 디스크 문제 등: 줄은 남겨 두고 다음 묶음에서 파일을 다시 열어 시도
+            self.errors += 1
+            self._pending = lines
+            print(f"[LOG SINK] {self.path} 쓰기 실패 ({len(lines)}줄 보관): {e!r}")
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
+
+    def _sync(self, force_fsync: bool = False):
+        self._file.flush()
+        if self.fsync or force_fsync:
+            os.fsync(self._file.fileno())
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self.flushes += 1
+
+
+# -------------------------------
+# 프로세스 단위 싱글톤 (파일 경로별)
+# -------------------------------
+_sinks: Dict[str, LogSink] = {}
+_sinks_lock = threading.Lock()
+
+
+def get_log_sink(path: str) -> LogSink:
+    """같은 파일에 쓰는 모든 세션 / 스크립트 실행이 기록기 1개를 공유한다."""
+    path = os.path.abspath(path)
+    sink = _sinks.get(path)
+    if sink is None:
+        with _sinks_lock:
+            sink = _sinks.get(path)
+            if sink is None:
+                sink = _sinks[path] = LogSink(path)
+    return sink
+
+
+@atexit.register
+def close_log_sinks():
+    """프로세스 종료 시 모든 기록기의 남은 줄을 디스크까지 내린다."""
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+    for sink in sinks:
+        sink.close()
@@ -0,0 +1,87 @@
+import threading
+from typing import Any, Dict, Mapping, Optional
+
+# -------------------------------
+# 업스트림 프롬프트 캐시 집계 (usage.prompt_tokens_details.cached_tokens)
+# -------------------------------
+# OpenAI 는 앞부분이 같은 요청(1024 토큰 이상, 128 토큰 단위)의 입력 토큰을 캐시해 두고
+# 캐시된 토큰 수를 usage.prompt_tokens_details.cached_tokens 로 돌려준다 (캐시된 입력 토큰은 할인, 첫 토큰도 빨라짐).
+# 템플릿(stage)별로 입력 / 캐시 토큰과 캐시 적중 여부에 따른 응답 시간을 모아
+# PROMPT_LAYOUT=inline / prefix 배치의 비용 · 지연 차이를 비교한다.
+# 실제 업스트림 호출(리더 1건)만 기록 — 응답 캐시 / single-flight 로 받은 결과는 입력 토큰을 쓰지 않았으므로 제외.
+
+
+def cached_tokens(usage: Optional[Mapping[str, Any]]) -> int:
+    """usage 에서 캐시된 입력 토큰 수. 모델 / 서버가 알려주지 않으면 0."""
+    details = (usage or {}).get("prompt_tokens_details") or {}
+    return int(details.get("cached_tokens") or 0)
+
+
+class _StageTotals:
+    __slots__ = ("calls", "hits", "prompt_tokens", "cached_tokens", "hit_ttft", "miss_ttft")
+
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0                # cached_tokens > 0 인 호출 수
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.hit_ttft = 0.0          # 적중 호출의 첫 토큰 시간 합
+        self.miss_ttft = 0.0
+
+
+class PromptCacheStats:
+
+    def __init__(self):
+        self._stages: Dict[str, _StageTotals] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: Optional[str], usage: Optional[Mapping[str, Any]], ttft: float):
+        if not usage:
+            return
+        cached = cached_tokens(usage)
+        with self._lock:
+            totals = self._stages.get(stage or "")
+            if totals is None:
+                totals = self._stages[stage or ""] = _StageTotals()
+            totals.calls += 1
+            totals.prompt_tokens += int(usage.get("prompt_tokens") or 0)
+            totals.cached_tokens += cached
+            if cached:
+                totals.hits += 1
+                totals.hit_ttft += ttft
+            else:
+                totals.miss_ttft += ttft
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """stage → 호출 수 / 캐시된 입력 토큰 비율 / 적중 · 미적중 평균 첫 토큰 시간(초)."""
+        with self._lock:
+            result = {}
+            for stage, t in self._stages.items():
+                misses = t.calls - t.hits
+                result[stage] = {
+                    "calls": t.calls,
+                    "hit_rate": round(t.hits / t.calls, 3) if t.calls else 0.0,
+                    "prompt_tokens": t.prompt_tokens,
+                    "cached_tokens": t.cached_tokens,
+                    "cached_ratio": round(t.cached_tokens / t.prompt_tokens, 3) if t.prompt_tokens else 0.0,
+                    "hit_ttft": round(t.hit_ttft / t.hits, 3) if t.hits else None,
+                    "miss_ttft": round(t.miss_ttft / misses, 3) if misses else None,
+                }
+            return result
+
+
+# -------------------------------
+# 프로세스 단위 싱글톤
+# -------------------------------
+_stats: Optional[PromptCacheStats] = None
+_stats_lock = threading.Lock()
+
+
+def get_prompt_cache_stats() -> PromptCacheStats:
+    """동기 클라이언트와 비동기 러너가 같은 집계를 공유한다."""
+    global _stats
+    if _stats is None:
+        with _stats_lock:
+            if _stats is None:
+                _stats = PromptCacheStats()
+    return _stats
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Sequence, Tuple, Union
+
+from backend.core.template import TemplateError
+
+# -------------------------------
+# 조각(fragment) 기반 프롬프트 파일 조립
+# -------------------------------
+# 학년별 프롬프트 파일이 같은 문장을 통째로 복사해 두지 않도록, 역할 / 활동 맥락 / 중복 방지 규칙 / 학년별 말투를
+# 이름 붙은 조각으로 두고 템플릿은 "{{>조각이름}}" 줄로 가져다 쓴다. 로드 시점에 한 번 펼친다.
+#
+#   {
+#     "extends": "prompts.json",            # (선택) 부모 파일. fragments / system / templates 를 이어받고 덮어씀
+#     "fragments": {"이름": [줄, ...]},       # 빈 조각을 가져오는 줄은 통째로 빠짐
+#     "system": {"템플릿": [줄, ...]},        # 템플릿별 system 메시지 (없으면 conversation.SYSTEM_MESSAGES)
+#     "templates": {"템플릿": [줄, ...]}      # 아이 턴마다 값을 채우는 user 메시지 ({{키}} 플레이스홀더)
+#   }
+#
+# 펼친 뒤 system 과 user 메시지에 같은 규칙이 두 번 나오면 뒤에 나온 쪽(user)을 지운다 → 매 턴 보내는 입력 토큰 감소.
+# 비교는 글머리(- / 1) / → 등)·따옴표·공백·끝 마침표를 무시한 줄 단위. "[제목]" 줄과 빈 줄은 지우지 않는다.
+# "templates" 가 없는 파일은 이전 형식(템플릿 이름 → 줄 목록)으로 그대로 읽는다.
+
+INCLUDE_RE = re.compile(r"^\s*\{\{>\s*(\w+)\s*\}\}\s*$")
+_BULLET_RE = re.compile(r"^\s*(?:[-_•→]|\d+\)|[①-⑩])\s*")
+_NUMBERED_RE = re.compile(r"^(\d+)\)")
+_QUOTES = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"'})
+
+Lines = Union[str, Sequence[str]]
+
+
+@dataclass(frozen=True)
+class ComposedPrompts:
+    """조립 결과 (템플릿 / system 은 줄을 합친 문자열)."""
+    templates: Dict[str, str]
+    system: Dict[str, str]
+    files: Tuple[str, ...]                                   # 읽은 파일 (부모 포함) → 변경 감지 대상
+    version: str                                             # 읽은 파일 내용 전체의 해시
+    removed: Dict[str, List[str]] = field(default_factory=dict)  # 템플릿 → system / 앞부분과 겹쳐 지운 줄
+
+
+def _lines(value: Lines) -> List[str]:
+    return [value] if isinstance(value, str) else list(value)
+
+
+def normalize_rule(line: str) -> str:
+    """중복 비교용 정규화: 글머리 / 번호, 따옴표 종류, 공백, 끝 마침표 무시."""
+    text = _BULLET_RE.sub("", line).translate(_QUOTES)
+    return " ".join(text.split()).rstrip(" .")
+
+
+def expand_fragments(name: str, lines: Lines, fragments: Mapping[str, Lines], _stack: Tuple[str, ...] = ()) -> List[str]:
+    """{{>조각}} 줄을 조각 내용으로 바꾼다 (조각 안의 {{>...}} 도 펼침). 없는 조각 / 순환 참조는 TemplateError."""
+    expanded = []
+    for line in _lines(lines):
+        match = INCLUDE_RE.match(line)
+        if not match:
+            expanded.append(line)
+            continue
+        fragment = match.group(1)
+        if fragment not in fragments:
+            raise TemplateError(f"'{name}': 없는 프롬프트 조각 '{fragment}'")
+        if fragment in _stack:
+            raise TemplateError(f"'{name}': 프롬프트 조각 순환 참조 {' → '.join(_stack + (fragment,))}")
+        expanded += expand_fragments(name, fragments[fragment], fragments, _stack + (fragment,))
+    return expanded
+
+
+def _renumber(lines: List[str]) -> List[str]:
+    """줄을 지운 뒤 "1) 2) 4)" 처럼 빈 번호가 생긴 목록을 블록(빈 줄 / [제목] 사이)마다 다시 매긴다."""
+    result, number = [], 0
+    for line in lines:
+        if not line.strip() or line.startswith("["):
+            number = 0
+        elif _NUMBERED_RE.match(line):
+            number += 1
+            line = _NUMBERED_RE.sub(f"{number})", line, count=1)
+        result.append(line)
+    return result
+
+
+def dedupe_rules(system: List[str], user: List[str]) -> Tuple[List[str], List[str], List[str]]:
+    """
+    system → user 순서로 읽으면서 이미 나온 규칙 줄을 지운다.
+    반환: (system 줄, user 줄, 지운 줄)
+    """
+    seen, removed = set(), []
+
+    def keep(lines: List[str]) -> List[str]:
+        kept, dropped = [], False
+        for line in lines:
+            key = normalize_rule(line)
+            if not key or line.lstrip().startswith("["):
+                kept.append(line)
+                continue
+            if key in seen:
+                removed.append(line)
+                dropped = True
+                continue
+            seen.add(key)
+            kept.append(line)
+        return _renumber(kept) if dropped else kept
+
+    return keep(system), keep(user), removed
+
+
+def _read(path: str, _chain: Tuple[str, ...] = ()) -> Tuple[dict, List[Tuple[str, bytes]]]:
+    """파일 1개 + extends 로 이어진 부모 파일들을 읽어 합친 원본(dict)과 (경로, 내용) 목록."""
+    path = os.path.abspath(path)
+    if path in _chain:
+        raise TemplateError(f"프롬프트 파일 extends 순환: {' → '.join(_chain + (path,))}")
+    with open(path, "rb") as f:
+        raw_bytes = f.read()
+    raw = json.loads(raw_bytes.decode("utf-8"))
+
+    parent_path = raw.get("extends") if isinstance(raw.get("extends"), str) else None
+    if parent_path is None:
+        return raw, [(path, raw_bytes)]
+
+    parent, files = _read(os.path.join(os.path.dirname(path), parent_path), _chain + (path,))
+    merged = {
+        section: {**parent.get(section, {}), **raw.get(section, {})}
+        for section in ("fragments", "system", "templates")
+    }
+    return merged, files + [(path, raw_bytes)]
+
+
+def load_prompt_file(path: str) -> ComposedPrompts:
+    """프롬프트 파일을 읽어 조각을 펼치고 system / user 사이 중복 규칙을 지운 결과."""
+    raw, files = _read(path)
+    version = hashlib.sha256(b"".join(content for _, content in files)).hexdigest()[:12]
+    paths = tuple(p for p, _ in files)
+
+    if "templates" not in raw:
+        # 이전 형식: {템플릿 이름: 줄 목록}
+        templates = {name: "\n".join(_lines(lines)) for name, lines in raw.items()}
+        return ComposedPrompts(templates, {}, paths, version)
+
+    fragments = raw.get("fragments", {})
+    templates, system, removed = {}, {}, {}
+    for name, lines in raw["templates"].items():
+        system_lines = expand_fragments(f"system:{name}", raw.get("system", {}).get(name, []), fragments)
+        user_lines = expand_fragments(name, lines, fragments)
+        system_lines, user_lines, dropped = dedupe_rules(system_lines, user_lines)
+        templates[name] = "\n".join(user_lines)
+        if system_lines:
+            system[name] = "\n".join(system_lines)
+        if dropped:
+            removed[name] = dropped
+    return ComposedPrompts(templates, system, paths, version, removed)
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+from backend.core.prompt_compose import load_prompt_file
+from backend.core.template import PromptTemplate, TemplateError, compile_prompts
+
+# -------------------------------
+# 프로세스 공용 프롬프트 레지스트리 (파일 변경 시 자동 재컴파일)
+# -------------------------------
+# prompts.json / low_grade_prompts.json 을 프로세스당 한 번만 읽어 컴파일해 두고 모든 세션이 공유한다.
+# 파일 상태(stat)는 PROMPT_RELOAD_INTERVAL 초에 최대 한 번만 확인하고, mtime / 크기가 바뀐 경우에만 다시 컴파일
+# → 프롬프트를 고치면 이미 열려 있는 세션도 다음 턴부터 새 프롬프트를 쓴다.
+# version 은 파일 내용 해시 → chat_log 에 prompt_version 으로 남겨 어떤 프롬프트로 만든 턴인지 구분.
+# 조각 / extends 형식(prompt_compose.py)이면 부모 파일까지 변경 감지 · 해시 대상.
+
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2"))
+
+
+class PromptSet(dict):
+    """
+    템플릿 이름 → PromptTemplate (dict 처럼 사용) + 파일 버전 정보.
+    system: 템플릿 이름 → system 메시지 (파일에 없으면 비어 있음 → build_messages 가 기본값 사용)
+    files : 읽은 파일 (extends 부모 포함), removed: 템플릿별로 system 과 겹쳐 지운 규칙 줄
+    """
+
+    def __init__(
+        self,
+        templates: Mapping[str, PromptTemplate],
+        version: str,
+        path: str,
+        system: Optional[Mapping[str, str]] = None,
+        files: Sequence[str] = (),
+        removed: Optional[Mapping[str, List[str]]] = None,
+    ):
+        super().__init__(templates)
+        self.version = version
+        self.path = path
+        self.system = dict(system or {})
+        self.files = tuple(files) or (path,)
+        self.removed = dict(removed or {})
+
+
+class _Entry:
+    __slots__ = ("prompts", "signature", "checked_at", "required")
+
+    def __init__(self, prompts: PromptSet, required):
+        self.prompts = prompts
+        self.signature = PromptRegistry._signature(prompts.files)
+        self.checked_at = time.monotonic()
+        self.required = required
+
+
+class PromptRegistry:
+
+    def __init__(self, reload_interval: float = PROMPT_RELOAD_INTERVAL):
+        self.reload_interval = reload_interval
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.reload_errors = 0
+
+    @staticmethod
+    def _signature(files: Sequence[str]) -> tuple:
+        return tuple((stat.st_mtime_ns, stat.st_size) for stat in map(os.stat, files))
+
+    @staticmethod
+    def _compile(path: str, required) -> PromptSet:
+        composed = load_prompt_file(path)
+        templates = compile_prompts(composed.templates, required)
+        return PromptSet(templates, composed.version, path, composed.system, composed.files, composed.removed)
+
+    def get(self, path: str, required: Optional[Mapping[str, Iterable[str]]] = None) -> PromptSet:
+        """
+        컴파일된 프롬프트 세트. 처음 읽을 때 형식이 잘못됐으면 TemplateError / ValueError 를 그대로 올리고,
+        실행 중 수정한 파일이 잘못됐으면 오류를 로그로만 남기고 이전 버전을 계속 쓴다 (진행 중인 대화를 멈추지 않음).
+        """
+        path = os.path.abspath(path)
+        entry = self._entries.get(path)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked_at < self.reload_interval:
+            return entry.prompts
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                entry = self._entries[path] = _Entry(self._compile(path, required), required)
+                print(f"[PROMPTS] loaded {path} version={entry.prompts.version} "
+                      f"deduped_lines={sum(map(len, entry.prompts.removed.values()))}")
+                return entry.prompts
+
+            if now - entry.checked_at < self.reload_interval:
+                return entry.prompts
+            entry.checked_at = now
+
+            try:
+                if self._signature(entry.prompts.files) != entry.signature:
+                    prompts = self._compile(path, entry.required)
+                    print(f"[PROMPTS] reloaded {path} version {entry.prompts.version} → {prompts.version}")
+                    entry.prompts, entry.signature = prompts, self._signature(prompts.files)
+                    self.reloads += 1
+            except (OSError, ValueError, TemplateError) as e:
+                # 저장 도중 / 잘못 고친 파일: 다음 확인 때 다시 시도
+                self.reload_errors += 1
+                print(f"[PROMPTS] reload failed {path}: {e!r} → version {entry.prompts.version} 계속 사용")
+            return entry.prompts
+
+    def stats(self) -> dict:
+        return {
+            "files": {path: entry.prompts.version for path, entry in self._entries.items()},
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+        }
+
+
+# -------------------------------
+# 프로세스 단위 싱글톤
+# -------------------------------
+_registry: Optional[PromptRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = PromptRegistry()
+    return _registry
@@ -0,0 +1,154 @@
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from backend.core.fallback import FOLLOWUP_QUESTIONS
+
+# -------------------------------
+# 생성된 자유 질문 중복 색인 (세션당 1개)
+# -------------------------------
+# 질문을 정규화(공백 / 문장부호 제거)한 문자열 집합으로 같은 질문을 바로 찾고,
+# 글자 n-gram(기본 2글자) 역색인으로 후보만 골라 Dice 유사도를 계산해 비슷한 질문을 찾는다.
+#   "무슨 일이 있었길래 재밌었어?" vs "무슨 일이 있었길래 그렇게 즐거웠어?" → 0.56
+# 기준을 넘으면 중복: 한 번만 짧게 다시 생성하고, 그래도 겹치면 규칙 기반 질문 중 겹치지 않는 것으로 바꾼다.
+
+QUESTION_SIMILARITY = float(os.getenv("QUESTION_SIMILARITY", "0.55"))   # 이 값 이상이면 비슷한 질문
+QUESTION_NGRAM = int(os.getenv("QUESTION_NGRAM", "2"))                   # 글자 n-gram 크기
+QUESTION_REGENERATE = os.getenv("QUESTION_REGENERATE", "true").lower() == "true"  # 중복이면 GPT 로 한 번 다시 생성
+QUESTION_REGENERATE_MAX_TOKENS = int(os.getenv("QUESTION_REGENERATE_MAX_TOKENS", "60"))  # 질문 1문장만 받으므로 짧게
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+
+def normalize_question(text: str) -> str:
+    """비교용: 공백 / 문장부호 / 대소문자 무시."""
+    return _NON_WORD_RE.sub("", text or "").lower()
+
+
+def char_ngrams(normalized: str, n: int = QUESTION_NGRAM) -> FrozenSet[str]:
+    if len(normalized) <= n:
+        return frozenset([normalized]) if normalized else frozenset()
+    return frozenset(normalized[i:i + n] for i in range(len(normalized) - n + 1))
+
+
+@dataclass(frozen=True)
+class QuestionMatch:
+    kind: str        # exact | near
+    score: float     # Dice 유사도 (exact 는 1.0)
+    question: str    # 겹친 기존 질문
+
+
+class QuestionIndex:
+    """
+    질문 추가 / 중복 확인이 모두 질문 길이에 비례하는 색인 (목록 전체를 훑지 않음).
+    fixed: 고정 질문 — 자유 질문이 고정 질문과 겹치는지도 확인하지만 generated 개수에는 넣지 않는다.
+    """
+
+    def __init__(
+        self,
+        questions: Iterable[str] = (),
+        fixed: Iterable[str] = (),
+        threshold: float = QUESTION_SIMILARITY,
+        n: int = QUESTION_NGRAM,
+    ):
+        self.threshold = threshold
+        self.n = n
+        self._texts: List[str] = []
+        self._grams: List[FrozenSet[str]] = []
+        self._exact: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = {}
+        self.generated = 0
+        for question in fixed:
+            self._insert(question)
+        for question in questions:
+            self.add(question)
+
+    def _insert(self, question: str):
+        normalized = normalize_question(question)
+        if not normalized:
+            return
+        index = len(self._texts)
+        grams = char_ngrams(normalized, self.n)
+        self._texts.append(question)
+        self._grams.append(grams)
+        self._exact.setdefault(normalized, index)
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(index)
+
+    def add(self, question: str):
+        self._insert(question)
+        self.generated += 1
+
+    def match(self, question: str) -> Optional[QuestionMatch]:
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        if normalized in self._exact:
+            return QuestionMatch("exact", 1.0, self._texts[self._exact[normalized]])
+
+        grams = char_ngrams(normalized, self.n)
+        shared = Counter(i for gram in grams for i in self._postings.get(gram, ()))
+        best: Optional[QuestionMatch] = None
+        for index, count in shared.items():
+            score = 2 * count / (len(grams) + len(self._grams[index]))
+            if score >= self.threshold and (best is None or score > best.score):
+                best = QuestionMatch("near", round(score, 3), self._texts[index])
+        return best
+
+
+def build_regenerate_messages(user_message: str, avoid: List[str], system: str) -> List[Dict[str, str]]:
+    """중복 질문 대신 쓸 질문 1개만 짧게 다시 받는 프롬프트 (공감 문장은 이미 받았으므로 질문만)."""
+    prompt = "\n".join([
+        f'아이가 방금 한 말: "{user_message}"',
+        "아래 질문들과 의미가 겹치지 않으면서 아이의 말에서 자연스럽게 이어지는 새로운 질문 1개만 써 줘.",
+        "질문 한 문장만 쓰고, 공감 문장이나 설명은 쓰지 마.",
+        "[이미 한 질문]",
+        *[f"- {question}" for question in avoid],
+    ])
+    return [{"role": "system", "content": system}, {"role": "user", "content": prompt}]
+
+
+def resolve_repeat(
+    index: QuestionIndex,
+    question: str,
+    regenerate: Optional[Callable[[], str]] = None,
+) -> Tuple[str, Optional[dict]]:
+    """
+    새 자유 질문을 색인에 넣기 전에 중복 확인.
+    반환: (실제로 쓸 질문, 중복 기록 또는 None)
+    - 중복이면 regenerate()(→ 질문 1문장, 없으면 빈 문자열) 로 한 번만 다시 받고, 실패하거나 또 겹치면 FOLLOWUP_QUESTIONS 중 겹치지 않는 질문으로 교체
+    - 바꿀 질문도 없으면 원래 질문을 그대로 쓰고 resolved="kept"
+    """
+    match = index.match(question)
+    if match is None:
+        index.add(question)
+        return question, None
+
+    repeat = {"kind": match.kind, "score": match.score, "similar_to": match.question, "original": question}
+    if regenerate is not None:
+        try:
+            candidate = (regenerate() or "").strip()
+        except Exception as exc:  # 다시 생성은 덤: 실패하면 규칙 기반 질문으로
+            repeat["regenerate_error"] = repr(exc)
+            candidate = ""
+        if candidate and index.match(candidate) is None:
+            index.add(candidate)
+            return candidate, {**repeat, "resolved": "regenerated"}
+
+    for candidate in FOLLOWUP_QUESTIONS:
+        if index.match(candidate) is None:
+            index.add(candidate)
+            return candidate, {**repeat, "resolved": "reworded"}
+
+    index.add(question)
+    return question, {**repeat, "resolved": "kept"}
+
+
+def tally_repeat(totals: Dict[str, int], repeat: Optional[dict]) -> Dict[str, int]:
+    """잡은 중복 수 누적: caught(전체) / exact / near / regenerated / reworded / kept."""
+    if repeat:
+        for key in ("caught", repeat["kind"], repeat["resolved"]):
+            totals[key] = totals.get(key, 0) + 1
+    return totals
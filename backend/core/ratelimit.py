@@ -0,0 +1,188 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from backend.core.cache import ROOT_DIR
+
+# -------------------------------
+# 전역 rate limit 설정 (환경 변수로 조정 가능)
+# -------------------------------
+# 0 이면 해당 항목은 제한하지 않음. 기본값은 OpenAI gpt-4o tier-1 기준
+RATE_LIMIT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", "500"))       # 분당 요청 수
+RATE_LIMIT_TPM = float(os.getenv("LLM_RATE_LIMIT_TPM", "30000"))     # 분당 토큰 수 (프롬프트 + 출력)
+
+# 저장소: sqlite(같은 서버의 여러 워커 프로세스가 공유) | memory(프로세스 안에서만 공유)
+RATE_LIMIT_BACKEND = os.getenv("LLM_RATE_LIMIT_BACKEND", "sqlite")
+RATE_LIMIT_PATH = os.getenv("LLM_RATE_LIMIT_PATH", os.path.join(ROOT_DIR, "data", "cache", "rate_limit.sqlite3"))
+
+# 출력 토큰 수를 모를 때(max_tokens 미지정) 예약할 값
+DEFAULT_OUTPUT_TOKENS = 300
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> int:
+    """
+    요청 1건의 토큰 수 추정 (예약용).
+    한국어는 대략 글자 2개당 1토큰 이상이므로 넉넉하게 잡고, 응답을 받은 뒤 실제 usage 로 보정한다.
+    """
+    prompt_chars = sum(len(m.get("content") or "") for m in messages)
+    return prompt_chars // 2 + 4 * len(messages) + (max_tokens or DEFAULT_OUTPUT_TOKENS)
+
+
+class TokenBucketLimiter:
+    """
+    분당 요청 수 / 토큰 수 토큰 버킷 (스레드 + 프로세스 공용).
+    - reserve(): 버킷에서 바로 차감하고(음수 허용) 내 차례까지 기다릴 시간을 돌려준다
+      → 실패(429) 대신 예약 순서대로 줄을 서는 대기열처럼 동작
+    - eta(): 지금 새로 들어오는 요청이 기다려야 할 시간 ("봉봉이 생각 중…" 표시용)
+    - SQLite(BEGIN IMMEDIATE)로 같은 서버의 여러 Streamlit 워커가 하나의 버킷을 공유
+    """
+
+    def __init__(
+        self,
+        rpm: float = RATE_LIMIT_RPM,
+        tpm: float = RATE_LIMIT_TPM,
+        path: str = RATE_LIMIT_PATH,
+    ):
+        # 버킷 이름 → 분당 보충량 (= 최대 용량)
+        self.rates = {name: rate for name, rate in (("requests", rpm), ("tokens", tpm)) if rate > 0}
+        self.path = path
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rate_bucket (
+                name       TEXT PRIMARY KEY,
+                level      REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._lock = threading.Lock()
+
+        # 통계 (이 프로세스 기준)
+        self.waiting = 0          # 지금 차례를 기다리는 호출 수
+        self.throttled = 0        # 기다려야 했던 호출 수
+        self.total_wait = 0.0     # 누적 대기 시간(초)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rates)
+
+    # -------------------------------
+    # 버킷 갱신 (트랜잭션 안에서만 호출)
+    # -------------------------------
+    def _levels(self, now: float) -> Dict[str, float]:
+        """경과 시간만큼 보충한 현재 잔량."""
+        rows = dict(
+            (name, (level, updated_at))
+            for name, level, updated_at in self._conn.execute("SELECT name, level, updated_at FROM rate_bucket")
+        )
+        levels = {}
+        for name, rate in self.rates.items():
+            level, updated_at = rows.get(name, (rate, now))
+            levels[name] = min(rate, level + (now - updated_at) * rate / 60)
+        return levels
+
+    def _update(self, deltas: Dict[str, float]) -> Dict[str, float]:
+        """잔량에 deltas 를 더해서 저장하고 새 잔량을 돌려준다."""
+        with self._lock:
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = self._levels(now)
+                for name, delta in deltas.items():
+                    if name in levels:
+                        levels[name] = min(self.rates[name], levels[name] + delta)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO rate_bucket (name, level, updated_at) VALUES (?, ?, ?)",
+                    [(name, level, now) for name, level in levels.items()],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return levels
+
+    def _wait_for(self, levels: Dict[str, float]) -> float:
+        """잔량이 음수인 버킷이 0 으로 돌아올 때까지 걸리는 시간(초)."""
+        return max([-level * 60 / self.rates[name] for name, level in levels.items() if level < 0] or [0.0])
+
+    # -------------------------------
+    # 공개 API
+    # -------------------------------
+    def reserve(self, tokens: int) -> float:
+        """요청 1건 + tokens 를 예약하고, 보내기 전에 기다릴 시간(초)을 반환."""
+        if not self.enabled:
+            return 0.0
+        return self._wait_for(self._update({"requests": -1, "tokens": -tokens}))
+
+    def refund(self, tokens: int):
+        """예약했지만 보내지 않은 요청을 돌려놓는다."""
+        if self.enabled:
+            self._update({"requests": 1, "tokens": tokens})
+
+    def adjust(self, tokens: int):
+        """응답을 받은 뒤 실제 사용량과 추정치의 차이(실제 - 추정)를 반영."""
+        if self.enabled and tokens:
+            self._update({"tokens": -tokens})
+
+    def eta(self, tokens: int = 0) -> float:
+        """지금 들어오는 요청이 기다려야 할 예상 시간(초). 예약하지 않음."""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            levels = self._levels(time.time())
+        levels["requests"] = levels.get("requests", 0) - 1
+        levels["tokens"] = levels.get("tokens", 0) - tokens
+        return round(self._wait_for({k: v for k, v in levels.items() if k in self.rates}), 1)
+
+    def acquire(self, tokens: int) -> float:
+        """예약 후 차례가 올 때까지 기다린다 (동기 경로). 기다린 시간 반환."""
+        wait = self.reserve(tokens)
+        self.sleep(wait)
+        return wait
+
+    def sleep(self, wait: float):
+        if wait <= 0:
+            return
+        with self._lock:
+            self.waiting += 1
+            self.throttled += 1
+            self.total_wait += wait
+        try:
+            time.sleep(wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "eta": self.eta(),
+            "waiting": self.waiting,
+            "throttled": self.throttled,
+            "total_wait": round(self.total_wait, 2),
+        }
+
+
+# -------------------------------
+# 프로세스 단위 싱글톤
+# -------------------------------
+_limiter: Optional[TokenBucketLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> TokenBucketLimiter:
+    """프로세스 전체에서 하나의 limiter 를 공유한다 (sqlite 면 워커 프로세스끼리도 공유)."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                path = RATE_LIMIT_PATH if RATE_LIMIT_BACKEND == "sqlite" else ":memory:"
+                _limiter = TokenBucketLimiter(path=path)
+    return _limiter
@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+# -------------------------------
+# 모델 라우팅 설정
+# -------------------------------
+# route 에 model 이 없을 때 사용할 기본 모델
+DEFAULT_MODEL = os.getenv("MODEL_NAME", "gpt-4o")
+
+# 라우팅 표(JSON) 경로. 비어 있으면 호출하는 쪽에서 넘긴 기본 경로 사용
+ROUTING_PATH = os.getenv("LLM_ROUTING_PATH", "")
+
+# 라우팅 키로 쓰는 필드 (값이 "*" 이거나 없으면 모든 값과 일치)
+ROUTE_KEYS = ("app", "stage", "turn")
+
+# 라우트에서 설정할 수 있는 값
+ROUTE_FIELDS = ("model", "max_tokens", "temperature", "slo_ms")
+
+# 턴 종류: free_question(공감+자유 질문) / rule_question(공감+고정 질문 연결) / ending(마무리)
+TURN_KINDS = {
+    "empathy_free_question": "free_question",
+    "empathy_rule_question": "rule_question",
+    "empathy_ending_message": "ending",
+    "gpt_free_followup": "free_question",
+    "gpt_intro_with_fixed": "rule_question",
+    "gpt_closing": "ending",
+    "question_regenerate": "free_question",    # 중복 자유 질문 다시 생성 (같은 모델 / 우선순위)
+}
+
+
+@dataclass(frozen=True)
+class Route:
+    """한 턴의 GPT 호출 설정."""
+    name: str                          # 로그용 이름 (예: "low_grade_app/S1/free_question")
+    model: str
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    slo_ms: Optional[int] = None       # 목표 응답 시간(ms), 넘으면 경고 로그
+
+    def options(self) -> Dict[str, Any]:
+        """chat.completions 에 넘길 추가 옵션 (설정된 값만)."""
+        options = {}
+        if self.max_tokens is not None:
+            options["max_tokens"] = self.max_tokens
+        if self.temperature is not None:
+            options["temperature"] = self.temperature
+        return options
+
+
+def _stage_key(stage) -> str:
+    """1 / "1" / "S1" → "S1"."""
+    text = str(stage).upper()
+    return text if text.startswith("S") else f"S{text}"
+
+
+def _matches(entry: Dict[str, Any], key: Dict[str, str]) -> bool:
+    return all(entry.get(k, "*") in ("*", key[k]) for k in ROUTE_KEYS)
+
+
+def _specificity(entry: Dict[str, Any]) -> int:
+    return sum(1 for k in ROUTE_KEYS if entry.get(k, "*") != "*")
+
+
+class ModelRouter:
+    """
+    (앱, 단계 S1~S3, 턴 종류) → 모델 / 최대 출력 토큰 / temperature / 지연 SLO.
+
+    설정 파일 형식:
+        {
+          "defaults": {"model": null, "max_tokens": 300, "temperature": 0.7, "slo_ms": 6000},
+          "routes": [
+            {"turn": "free_question", "model": "gpt-4o-mini", "max_tokens": 160, "slo_ms": 3000},
+            {"app": "low_grade_app", "max_tokens": 100}
+          ]
+        }
+    - 일치하는 route 를 덜 구체적인 것부터 차례로 덮어쓴다 (같으면 파일 순서대로)
+    - model 이 null 이면 MODEL_NAME 환경 변수(기본 gpt-4o) 사용
+    """
+
+    def __init__(self, config: Dict[str, Any], default_model: str = DEFAULT_MODEL):
+        self.default_model = default_model
+        self.defaults = config.get("defaults", {})
+        self.routes: List[Dict[str, Any]] = config.get("routes", [])
+
+    @classmethod
+    def from_file(cls, path: str, default_model: str = DEFAULT_MODEL) -> "ModelRouter":
+        if not os.path.exists(path):
+            print(f"[LLM ROUTING] 설정 파일 없음, 기본 모델만 사용: {path}")
+            return cls({}, default_model)
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), default_model)
+
+    def resolve(self, app: str, stage, turn: str) -> Route:
+        """
+        app  : 앱 이름 (예: "update_app")
+        stage: 1~3 또는 "S1"~"S3"
+        turn : 턴 종류 또는 템플릿 이름 (예: "free_question", "empathy_free_question")
+        """
+        turn = TURN_KINDS.get(turn, turn)
+        key = {"app": app, "stage": _stage_key(stage), "turn": turn}
+
+        settings = {k: v for k, v in self.defaults.items() if k in ROUTE_FIELDS and v is not None}
+        matched = [entry for entry in self.routes if _matches(entry, key)]
+        for entry in sorted(matched, key=_specificity):
+            settings.update({k: v for k, v in entry.items() if k in ROUTE_FIELDS and v is not None})
+
+        return Route(
+            name=f"{app}/{key['stage']}/{turn}",
+            model=settings.get("model") or self.default_model,
+            max_tokens=settings.get("max_tokens"),
+            temperature=settings.get("temperature"),
+            slo_ms=settings.get("slo_ms"),
+        )
+
+
+# -------------------------------
+# 프로세스 단위 싱글톤
+# -------------------------------
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_model_router(default_path: str) -> ModelRouter:
+    """라우팅 표를 한 번만 읽어서 공유한다. LLM_ROUTING_PATH 가 있으면 그 파일을 우선 사용."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter.from_file(ROUTING_PATH or default_path)
+    return _router
@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from backend.core.routing import TURN_KINDS
+
+# -------------------------------
+# 스케줄러 설정 (환경 변수로 조정 가능)
+# -------------------------------
+SCHED_MAX_CONCURRENT = int(os.getenv("LLM_SCHED_MAX_CONCURRENT", "16"))   # 동시에 업스트림으로 보내는 최대 호출 수
+CLASSROOM_MAX_ACTIVE = int(os.getenv("LLM_CLASSROOM_MAX_ACTIVE", "8"))    # 교실 1곳이 동시에 쓸 수 있는 최대 호출 수 (0 = 제한 없음)
+SCHED_SESSION_STATS = 500                                                 # 대기 시간 통계를 보관할 최근 세션 수
+
+# 턴 종류별 우선순위 (숫자가 작을수록 먼저). 마무리 턴은 곧 떠날 아이라서 가장 먼저
+TURN_PRIORITY = {
+    "ending": 0,
+    "rule_question": 1,
+    "free_question": 2,
+}
+DEFAULT_PRIORITY = 2
+
+
+class Ticket:
+    """스케줄러 대기열의 호출 1건."""
+
+    def __init__(self, session_id: str, classroom: str, priority: int):
+        self.session_id = session_id
+        self.classroom = classroom
+        self.priority = priority
+        self.enqueued_at = time.time()
+        self.started_at: Optional[float] = None
+        self.granted = threading.Event()
+
+    @property
+    def wait_time(self) -> float:
+        end = self.started_at if self.started_at is not None else time.time()
+        return round(end - self.enqueued_at, 2)
+
+
+class FairScheduler:
+    """
+    LLM 호출 공정 스케줄러.
+    - 동시 호출 수(max_concurrent)가 차면 대기열에 넣고, 자리가 나면 다음 호출을 고른다
+    - 고르는 순서: 우선순위(마무리 → 고정 질문 연결 → 자유 질문) → 같은 우선순위 안에서는 세션 라운드로빈
+      → 먼저 재시도한 스레드가 아니라, 오래 기다린 세션부터 골고루 차례가 돌아감
+    - 교실별 동시 호출 수 제한(classroom_limit): 한 교실이 자리를 독차지하지 못하게 함
+    """
+
+    def __init__(self, max_concurrent: int = SCHED_MAX_CONCURRENT, classroom_limit: int = CLASSROOM_MAX_ACTIVE):
+        self.max_concurrent = max_concurrent
+        self.classroom_limit = classroom_limit
+
+        # 우선순위 → (세션 → 대기 중인 Ticket 들). OrderedDict 순서가 라운드로빈 순서
+        self._queues: Dict[int, "OrderedDict[str, deque[Ticket]]"] = {}
+        self._running = 0
+        self._active_by_classroom: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        # 통계
+        self._session_waits: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self.max_wait = 0.0
+
+    # -------------------------------
+    # 대기열
+    # -------------------------------
+    def enqueue(self, session_id: Optional[str], classroom: Optional[str], stage: Optional[str]) -> Ticket:
+        turn = TURN_KINDS.get(stage, stage)
+        ticket = Ticket(session_id or "-", classroom or "-", TURN_PRIORITY.get(turn, DEFAULT_PRIORITY))
+        with self._lock:
+            queue = self._queues.setdefault(ticket.priority, OrderedDict())
+            queue.setdefault(ticket.session_id, deque()).append(ticket)
+            self._dispatch()
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """호출이 끝나면 자리를 반납하고 다음 호출을 고른다."""
+        with self._lock:
+            self._running -= 1
+            self._active_by_classroom[ticket.classroom] -= 1
+            self._dispatch()
+
+    def cancel(self, ticket: Ticket):
+        """기다리다 포기한 호출 (이미 자리를 받았으면 반납)."""
+        with self._lock:
+            if ticket.granted.is_set():
+                self._running -= 1
+                self._active_by_classroom[ticket.classroom] -= 1
+            else:
+                sessions = self._queues.get(ticket.priority, {})
+                tickets = sessions.get(ticket.session_id)
+                if tickets and ticket in tickets:
+                    tickets.remove(ticket)
+                    if not tickets:
+                        del sessions[ticket.session_id]
+            self._dispatch()
+
+    def _dispatch(self):
+        """(lock 안에서) 빈 자리만큼 다음 호출에 자리를 준다."""
+        while self._running < self.max_concurrent:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self._running += 1
+            self._active_by_classroom[ticket.classroom] = self._active_by_classroom.get(ticket.classroom, 0) + 1
+            ticket.started_at = time.time()
+            self._record_wait(ticket)
+            ticket.granted.set()
+
+    def _next_ticket(self) -> Optional[Ticket]:
+        for priority in sorted(self._queues):
+            sessions = self._queues[priority]
+            for session_id in list(sessions):
+                tickets = sessions[session_id]
+                if not self._admit(tickets[0].classroom):
+                    continue
+                ticket = tickets.popleft()
+                # 이 세션은 줄 맨 뒤로 (라운드로빈)
+                del sessions[session_id]
+                if tickets:
+                    sessions[session_id] = tickets
+                return ticket
+        return None
+
+    def _admit(self, classroom: str) -> bool:
+        if self.classroom_limit <= 0:
+            return True
+        return self._active_by_classroom.get(classroom, 0) < self.classroom_limit
+
+    # -------------------------------
+    # 사용
+    # -------------------------------
+    @contextmanager
+    def slot(self, session_id: Optional[str], classroom: Optional[str], stage: Optional[str], timeout: float):
+        """
+        자리를 받을 때까지 기다렸다가 실행. 반환: Ticket (wait_time = 대기 시간)
+        timeout 안에 자리를 못 받으면 TimeoutError.
+        """
+        ticket = self.enqueue(session_id, classroom, stage)
+        if not ticket.granted.wait(timeout):
+            self.cancel(ticket)
+            raise TimeoutError(f"scheduler queue wait exceeded {timeout}s")
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    # -------------------------------
+    # 통계
+    # -------------------------------
+    def _record_wait(self, ticket: Ticket):
+        wait = ticket.wait_time
+        self.max_wait = max(self.max_wait, wait)
+        entry = self._session_waits.pop(ticket.session_id, {"count": 0, "total": 0.0, "last": 0.0})
+        entry["count"] += 1
+        entry["total"] += wait
+        entry["last"] = wait
+        self._session_waits[ticket.session_id] = entry
+        while len(self._session_waits) > SCHED_SESSION_STATS:
+            self._session_waits.popitem(last=False)
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return sum(len(t) for sessions in self._queues.values() for t in sessions.values())
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            by_priority = {
+                name: sum(len(t) for t in self._queues.get(priority, {}).values())
+                for name, priority in TURN_PRIORITY.items()
+            }
+            return {
+                "queue_depth": sum(by_priority.values()),
+                "queue_by_turn": by_priority,
+                "running": self._running,
+                "running_by_classroom": {k: v for k, v in self._active_by_classroom.items() if v},
+                "max_wait": round(self.max_wait, 2),
+                "session_wait": {
+                    session_id: {
+                        "last": round(entry["last"], 2),
+                        "avg": round(entry["total"] / entry["count"], 2),
+                        "count": entry["count"],
+                    }
+                    for session_id, entry in self._session_waits.items()
+                },
+            }
+
+
+# -------------------------------
+# 프로세스 단위 싱글톤
+# -------------------------------
+_scheduler: Optional[FairScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> FairScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = FairScheduler()
+    return _scheduler
@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+# 팔로워가 리더의 스트리밍 중간 결과를 확인하는 주기(초)
+PARTIAL_POLL_INTERVAL = 0.05
+
+
+def make_flight_key(model: str, messages, options: Optional[Dict[str, Any]] = None) -> str:
+    """바이트 단위로 같은 (model, messages, 옵션) 요청이면 같은 키."""
+    raw = json.dumps([model, messages, options or {}], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """진행 중인 업스트림 호출 1건 (리더가 실행, 팔로워는 결과를 기다림)."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.partial = ""
+        self.done = False
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+    def publish(self, partial: str):
+        with self.cond:
+            self.partial = partial
+            self.cond.notify_all()
+
+    def finish(self, result=None, error: Optional[BaseException] = None):
+        with self.cond:
+            self.result = result
+            self.error = error
+            self.done = True
+            self.cond.notify_all()
+
+
+class SingleFlight:
+    """
+    동일 요청 합치기 (single-flight).
+    같은 키의 호출이 이미 진행 중이면 새 HTTP 호출을 만들지 않고 그 결과를 같이 받는다.
+    - 리더가 스트리밍 중이면 팔로워의 on_delta 에도 중간 텍스트를 흘려준다.
+    - coalesced: 합쳐져서 아낀 업스트림 호출 수
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[Callable[[str], None]], Any], on_delta=None):
+        """
+        fn(publish) 를 실행한다. fn 은 중간 텍스트가 생길 때마다 publish(partial) 를 호출할 수 있다.
+        반환: (결과, 리더 여부)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return self._follow(flight, on_delta), False
+
+        def publish(partial: str):
+            flight.publish(partial)
+            if on_delta:
+                on_delta(partial)
+
+        try:
+            result = fn(publish)
+        except BaseException as exc:
+            flight.finish(error=exc)
+            raise
+        else:
+            flight.finish(result=result)
+            return result, True
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def _follow(self, flight: _Flight, on_delta):
+        seen = ""
+        while True:
+            with flight.cond:
+                if not flight.done and flight.partial == seen:
+                    flight.cond.wait(PARTIAL_POLL_INTERVAL)
+                partial = flight.partial
+                done = flight.done
+
+            if on_delta and partial != seen:
+                on_delta(partial)
+            seen = partial
+
+            if done:
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,     # 아낀 업스트림 호출 수
+            "inflight": len(self._flights),
+        }
+
+
+class _AsyncFlight:
+    """이벤트 루프 안에서 진행 중인 호출 1건 (리더의 Task + 중간 텍스트를 받을 콜백들)."""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.partial = ""
+        self.listeners: List[Callable[[str], None]] = []
+
+    def publish(self, partial: str):
+        self.partial = partial
+        for listener in list(self.listeners):
+            listener(partial)
+
+
+class AsyncSingleFlight:
+    """
+    이벤트 루프(단일 스레드) 안에서 쓰는 single-flight.
+    같은 키의 코루틴이 진행 중이면 그 Task 를 같이 await 한다.
+    - 리더가 스트리밍 중이면 팔로워의 on_delta 에도 중간 텍스트를 흘려준다 (SingleFlight 와 같음).
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _AsyncFlight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, coro_factory: Callable[[Callable[[str], None]], Any], on_delta=None):
+        """
+        coro_factory(publish) 를 Task 로 실행한다. 코루틴은 중간 텍스트가 생길 때마다 publish(partial) 를 호출할 수 있다.
+        반환: (결과, 리더 여부)
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            if on_delta is None:
+                return await asyncio.shield(flight.task), False
+            if flight.partial:
+                on_delta(flight.partial)  # 늦게 합류해도 지금까지의 텍스트부터
+            flight.listeners.append(on_delta)
+            try:
+                return await asyncio.shield(flight.task), False
+            finally:
+                flight.listeners.remove(on_delta)
+
+        self.leaders += 1
+        flight = _AsyncFlight()
+        if on_delta is not None:
+            flight.listeners.append(on_delta)
+        flight.task = asyncio.ensure_future(coro_factory(flight.publish))
+        self._flights[key] = flight
+        try:
+            return await asyncio.shield(flight.task), True
+        finally:
+            self._flights.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "inflight": len(self._flights),
+        }
@@ -1,9 +1,55 @@
 import json
 import os
+import re
+import tempfile
+import threading
 from typing import Any, Dict, Optional
 
+from backend.core.log_sink import get_log_sink
+
 BASE_PATH = "data"
 
+# 파일을 바꿔치기하기 전에 디스크까지 내려쓰기 (끄면 빠르지만 전원이 나가면 마지막 저장이 사라질 수 있음)
+STORAGE_FSYNC = os.getenv("STORAGE_FSYNC", "true").lower() == "true"
+
+# 세션 ID 는 URL 로 들어오므로 파일 이름으로 안전한 문자만 허용 (경로 조작 방지)
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def is_valid_session_id(session_id: Optional[str]) -> bool:
+    return bool(session_id) and bool(_SESSION_ID_RE.match(session_id))
+
+
+def write_json_atomic(path: str, data: Any):
+    """
+    같은 폴더의 임시 파일에 다 쓴 뒤 os.replace 로 바꿔치기.
+    쓰는 도중 프로세스가 죽어도 기존 파일은 그대로 → 반쯤 쓰인 JSON 이 남지 않는다.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            if STORAGE_FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_json(path: str) -> Optional[Any]:
+    """파일이 없거나 (atomic 저장 도입 전에) 깨진 파일이면 None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        print(f"[STORAGE] {path} 읽기 실패 → 무시: {e!r}")
+        return None
+
 
 class JSONStorage:
 
@@ -14,40 +60,51 @@ class JSONStorage:
         os.makedirs(os.path.join(BASE_PATH, "users"), exist_ok=True)
         os.makedirs(os.path.join(BASE_PATH, "logs"), exist_ok=True)
 
+    def _path(self, folder: str, session_id: str) -> str:
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"잘못된 세션 ID: {session_id!r}")
+        return os.path.join(BASE_PATH, folder, f"{session_id}.json")
+
     # -------------------------------
     # 1) 세션 저장/조회
     # -------------------------------
     def save_session(self, session_id: str, data: Dict[str, Any]):
-        path = os.path.join(BASE_PATH, "sessions", f"{session_id}.json")
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        write_json_atomic(self._path("sessions", session_id), data)
 
     def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        path = os.path.join(BASE_PATH, "sessions", f"{session_id}.json")
-        if not os.path.exists(path):
-            return None
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return read_json(self._path("sessions", session_id))
 
     # -------------------------------
     # 2) 상태 저장 (S1/S2/S3/S4)
     # -------------------------------
     def save_state(self, session_id: str, state: Dict[str, Any]):
-        path = os.path.join(BASE_PATH, "state", f"{session_id}.json")
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
+        write_json_atomic(self._path("state", session_id), state)
 
     def load_state(self, session_id: str):
-        path = os.path.join(BASE_PATH, "state", f"{session_id}.json")
-        if not os.path.exists(path):
+        state = read_json(self._path("state", session_id))
+        if state is None:
             return {"current_stage": "S1", "turn": 1}
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return state
 
     # -------------------------------
     # 3) 로그 append (jsonl)
     # -------------------------------
-    def append_log(self, record: Dict[str, Any]):
-        log_path = os.path.join(BASE_PATH, "logs", "chat_log.jsonl")
-        with open(log_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    def append_log(self, record: Dict[str, Any], end_of_turn: bool = False):
+        """백그라운드 기록기(log_sink)에 넘김 → 파일은 기록 스레드가 묶어서 씀."""
+        get_log_sink(os.path.join(BASE_PATH, "logs", "chat_log.jsonl")).write(record, end_of_turn=end_of_turn)
+
+
+# -------------------------------
+# 프로세스 단위 싱글톤
+# -------------------------------
+_storage: Optional[JSONStorage] = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> JSONStorage:
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = JSONStorage()
+    return _storage
@@ -0,0 +1,124 @@
+import json
+import os
+import re
+from typing import Dict, Optional
+
+# -------------------------------
+# 구조화 출력(JSON) 설정
+# -------------------------------
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "true").lower() == "true"
+
+# JSON 모드(response_format)를 지원하지 않는 모델 목록 (쉼표 구분) → 텍스트 + 파서로 처리
+NO_JSON_MODE_MODELS = {
+    m.strip() for m in os.getenv("NO_JSON_MODE_MODELS", "").split(",") if m.strip()
+}
+
+# 공감 턴 응답 형식: {"empathy": 공감·격려 문장들, "question": 마지막 질문 1문장}
+EMPATHY_TURN_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "empathy_turn",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "empathy": {"type": "string"},
+                "question": {"type": "string"},
+            },
+            "required": ["empathy", "question"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# 시스템 메시지 뒤에 붙이는 출력 형식 안내
+STRUCTURED_INSTRUCTION = (
+    "응답은 반드시 JSON 으로만 작성해. "
+    "\"empathy\" 에는 질문 없이 공감·격려 문장만, "
+    "\"question\" 에는 아이에게 건넬 마지막 질문 1문장만 넣어."
+)
+
+QUESTION_MARKS = ("?", "？")
+
+# 문장 경계: 종결 부호 뒤 공백 또는 줄바꿈
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?？。！])\s+|\n+")
+
+# 스트리밍 중인(닫히지 않은) JSON 에서 필드 값 꺼내기
+_PARTIAL_FIELD = re.compile(r'"(empathy|question)"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+
+def use_structured_output(model: Optional[str]) -> bool:
+    """이 모델로 구조화 출력(JSON 모드)을 쓸지 여부."""
+    return STRUCTURED_OUTPUT and model not in NO_JSON_MODE_MODELS
+
+
+def extract_question(reply: str) -> str:
+    """
+    (fallback 파서) 응답에서 마지막 질문 문장을 찾는다.
+    - 줄 단위가 아니라 문장 단위로 나눠서, 줄 중간에 있는 질문도 찾음
+    - 반각 '?' 와 전각 '？' 모두 인식
+    - 질문이 없으면 빈 문자열
+    """
+    sentences = [s.strip() for s in _SENTENCE_SPLIT.split(reply) if s.strip()]
+    for sentence in reversed(sentences):
+        if any(mark in sentence for mark in QUESTION_MARKS):
+            return sentence
+    return ""
+
+
+def parse_empathy_turn(text: str) -> Dict[str, object]:
+    """
+    공감 턴 응답을 {empathy, question, reply, structured} 로 정리한다.
+    - JSON 이면 필드를 그대로 사용 (문자열 스캔 없음)
+    - JSON 이 아니면(또는 잘렸으면) fallback 파서로 질문 문장을 찾는다
+    - reply: 말풍선/로그에 쓸 최종 발화
+    """
+    try:
+        data = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        data = None
+
+    if isinstance(data, dict) and "question" in data:
+        empathy = str(data.get("empathy", "")).strip()
+        question = str(data.get("question", "")).strip()
+        return {
+            "empathy": empathy,
+            "question": question,
+            "reply": " ".join(part for part in (empathy, question) if part),
+            "structured": True,
+        }
+
+    # max_tokens 에 걸려 잘린 JSON 이면 읽을 수 있는 부분만 텍스트로 꺼낸다
+    if text.lstrip().startswith("{"):
+        text = empathy_turn_display(text)
+
+    question = extract_question(text)
+    empathy = text.replace(question, "").strip() if question else text.strip()
+    return {
+        "empathy": empathy,
+        "question": question,
+        "reply": text,
+        "structured": False,
+    }
+
+
+def empathy_turn_display(partial: str) -> str:
+    """
+    스트리밍 중인 JSON 조각을 말풍선에 보여줄 텍스트로 바꾼다.
+    예) '{"empathy": "그랬구나! ", "question": "뭐가' → '그랬구나! 뭐가'
+    """
+    fields = {}
+    for name, raw in _PARTIAL_FIELD.findall(partial):
+        # 이스케이프 도중에 잘린 경우(끝이 '\') 마지막 글자는 버림
+        if raw.endswith("\\") and not raw.endswith("\\\\"):
+            raw = raw[:-1]
+        try:
+            fields[name] = json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            fields[name] = raw
+
+    if not fields:
+        # JSON 이 아닌 응답(fallback)이면 그대로 표시
+        return "" if partial.lstrip().startswith("{") else partial
+
+    return " ".join(fields[name].strip() for name in ("empathy", "question") if fields.get(name))
@@ -0,0 +1,107 @@
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional, Sequence, Union
+
+# -------------------------------
+# 프롬프트 템플릿 컴파일러
+# -------------------------------
+# prompts.json 의 템플릿(문자열 리스트)을 한 번만 파싱해 [고정 문자열, {{키}}, 고정 문자열, ...] 조각으로 나눠 두고,
+# 턴마다 빈 칸만 채워 "".join 한 번으로 만든다 (키마다 전체 문자열을 다시 훑는 str.replace 반복 없음).
+# 값이 빠졌거나(→ {{키}} 가 그대로 GPT 로 감) 템플릿에 없는 값을 넘기면(→ 오타) TemplateError.
+#
+# render_prefixed: 프롬프트 캐시(앞부분이 같은 요청의 입력 토큰 재사용)용 배치.
+# 본문의 {{키}} 자리는 <키> 표시로 고정해 두고 이번 턴 값은 맨 뒤 [이번 턴 값] 블록에 모아 붙인다
+# → 역할 / 활동 맥락 / 규칙이 매 턴 같은 앞부분(prefix)이 되어 업스트림 캐시에 걸린다.
+
+PLACEHOLDER_RE = re.compile(r"\{\{(\w+)\}\}")
+PREFIX_VALUES_HEADER = "[이번 턴 값] (위 본문의 <키> 자리에 들어갈 내용)"
+
+
+class TemplateError(ValueError):
+    """템플릿 형식 / 채울 값이 맞지 않음."""
+
+
+class PromptTemplate:
+    """컴파일된 프롬프트 템플릿 1개 (불변, 프로세스 전체에서 공유해도 안전)."""
+
+    __slots__ = ("name", "fields", "_parts", "_slots", "_static")
+
+    def __init__(self, name: str, source: Union[str, Sequence[str]]):
+        text = source if isinstance(source, str) else "\n".join(source)
+        self.name = name
+
+        # split 결과: 짝수 index = 고정 문자열, 홀수 index = 플레이스홀더 키
+        pieces = PLACEHOLDER_RE.split(text)
+        self._parts: List[str] = pieces
+        self._slots = tuple((i, pieces[i]) for i in range(1, len(pieces), 2))
+        self.fields: FrozenSet[str] = frozenset(key for _, key in self._slots)
+        # prefix 배치용 고정 본문: {{키}} → <키>
+        self._static = "".join(piece if i % 2 == 0 else f"<{piece}>" for i, piece in enumerate(pieces))
+
+    def _check(self, values: Mapping[str, str]):
+        if values.keys() != self.fields:
+            missing = sorted(self.fields - values.keys())
+            unused = sorted(values.keys() - self.fields)
+            raise TemplateError(f"템플릿 '{self.name}': 빠진 값 {missing}, 템플릿에 없는 값 {unused}")
+
+    def render(self, **values: str) -> str:
+        self._check(values)
+        parts = self._parts.copy()
+        for index, key in self._slots:
+            parts[index] = values[key]
+        return "".join(parts)
+
+    def render_prefixed(self, order: Sequence[str] = (), **values: str) -> str:
+        """
+        고정 본문(매 턴 동일) + 맨 뒤 [이번 턴 값] 블록.
+        order: 값 블록 안의 순서. 덜 바뀌는 값을 앞에 둘수록 캐시되는 앞부분이 길어진다 (order 에 없는 키는 이름순으로 뒤에).
+        """
+        self._check(values)
+        keys = [key for key in order if key in values]
+        keys += sorted(values.keys() - set(keys))
+        lines = [self._static, "", PREFIX_VALUES_HEADER]
+        lines += [f"- {key}: {values[key]}" for key in keys]
+        return "\n".join(lines)
+
+    def __repr__(self) -> str:
+        return f"PromptTemplate({self.name!r}, fields={sorted(self.fields)})"
+
+
+def compile_prompts(
+    prompts: Mapping[str, Union[str, Sequence[str]]],
+    required: Optional[Mapping[str, Iterable[str]]] = None,
+) -> Dict[str, PromptTemplate]:
+    """
+    prompts.json 전체를 로드 시점에 한 번 컴파일.
+    required: 템플릿 이름 → 앱이 채워 넣는 키 목록. 템플릿이 없거나, 키가 빠졌거나(앱이 넘기는 값이 버려짐),
+    앱이 모르는 {{키}} 가 있으면(GPT 에 그대로 감) 바로 TemplateError → 잘못된 프롬프트 파일로 대화를 시작하지 않는다.
+    """
+    compiled = {name: PromptTemplate(name, source) for name, source in prompts.items()}
+
+    problems = []
+    for name, keys in (required or {}).items():
+        template = compiled.get(name)
+        if template is None:
+            problems.append(f"'{name}' 템플릿 없음")
+            continue
+        keys = frozenset(keys)
+        if template.fields != keys:
+            problems.append(
+                f"'{name}': 빠진 플레이스홀더 {sorted(keys - template.fields)}, "
+                f"알 수 없는 플레이스홀더 {sorted(template.fields - keys)}"
+            )
+    if problems:
+        raise TemplateError("프롬프트 템플릿 오류: " + " / ".join(problems))
+    return compiled
+
+
+@lru_cache(maxsize=64)
+def _compile_lines(lines: tuple) -> PromptTemplate:
+    return PromptTemplate("<inline>", lines)
+
+
+def as_template(source: Union[PromptTemplate, str, Sequence[str]]) -> PromptTemplate:
+    """이미 컴파일된 템플릿은 그대로, 문자열 리스트는 컴파일(내용별로 캐시)해서 반환."""
+    if isinstance(source, PromptTemplate):
+        return source
+    return _compile_lines((source,) if isinstance(source, str) else tuple(source))
@@ -0,0 +1,387 @@
+"""
+OpenAI 호환 로컬 모의(mock) LLM 서버
+
+실제 OpenAI 키 없이 process_flow 부하 테스트 / 지연 재현 / 오프라인 개발용.
+/v1/chat/completions (일반 + 스트리밍 SSE) 와 /v1/models 를 흉내 낸다.
+
+- 지연 분포: fixed:초 | lognormal:중앙값초,sigma | replay:chat_log.jsonl (기록된 ttft/latency 를 그대로 재생)
+- 오류 주입: 429(Retry-After 포함) / 500 / 타임아웃(응답 없이 대기) 비율
+- (선택) 프롬프트 캐시: 앞부분이 같은 요청에 usage.prompt_tokens_details.cached_tokens + 짧은 첫 토큰 시간
+- 응답: 템플릿에 맞는 한국어 공감 문장 + 질문('?') 또는 마무리('안녕')
+  response_format(json_schema) 요청이면 {"empathy", "question"} JSON 으로 응답
+
+사용법 (프로젝트 루트에서):
+    python -m backend.mock.llm_server --port 8001 --latency lognormal:1.2,0.6 --error-429 0.05
+    python -m backend.mock.llm_server --port 8001 --prefix-cache --prefix-cache-min 256
+    LLM_BASE_URL=http://127.0.0.1:8001/v1 streamlit run frontend/streamlit/update_app.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+# -------------------------------
+# 모의 응답 문장
+# -------------------------------
+EMPATHY_SENTENCES = [
+    "우와, 정말 멋진 이야기다!",
+    "그랬구나, 이야기해 줘서 고마워.",
+    "그림 그리면서 열심히 했구나.",
+    "슈퍼히어로 색칠도 정말 재미있었겠다.",
+    "네 마음이 잘 느껴져.",
+]
+
+FREE_QUESTIONS = [
+    "그때 기분이 어땠어?",
+    "어떤 색을 제일 많이 썼어?",
+    "그림에서 제일 마음에 드는 부분은 어디야?",
+    "슈퍼히어로한테 어떤 힘을 주고 싶어?",
+]
+
+CLOSING_SENTENCES = [
+    "오늘 이야기 나눠 줘서 정말 고마워.",
+    "오늘 그림 그리면서 멋지게 활동했어.",
+]
+
+# 고정 질문 위치: update/low/high 앱 템플릿 "[현재 턴에서 사용할 고정 질문]", all_memory_app "[고정 질문]"
+# PROMPT_LAYOUT=prefix 이면 본문에는 "<rule_question>" 만 있고 값은 맨 뒤 "- rule_question: ..." 줄에 있다
+_RULE_QUESTION = re.compile(r'\[(?:현재 턴에서 사용할 )?고정 질문\]\s*\n\s*"([^"<\n][^"\n]*)"')
+_RULE_QUESTION_VALUE = re.compile(r"^- rule_question: (.+)$", re.MULTILINE)
+
+
+def detect_template(messages: List[Dict[str, str]]) -> Tuple[str, Optional[str]]:
+    """프롬프트 내용으로 템플릿 종류(free / rule / ending)와 고정 질문을 추정."""
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    prompt = "\n".join(m.get("content", "") for m in messages)
+
+    # 마무리 턴: system 에 '안녕'으로 끝내라는 지시 또는 프롬프트에 "마지막 턴"
+    if "안녕" in system or "마지막 턴" in prompt:
+        return "ending", None
+    match = _RULE_QUESTION_VALUE.search(prompt) or _RULE_QUESTION.search(prompt)
+    if match:
+        return "rule", match.group(1).strip()
+    return "free", None
+
+
+def make_reply(messages: List[Dict[str, str]], structured: bool) -> str:
+    template, rule_question = detect_template(messages)
+    empathy = " ".join(random.sample(EMPATHY_SENTENCES, 2))
+
+    if template == "ending":
+        text = f"{empathy} {random.choice(CLOSING_SENTENCES)} 안녕!"
+        return json.dumps({"empathy": text, "question": ""}, ensure_ascii=False) if structured else text
+
+    question = rule_question or random.choice(FREE_QUESTIONS)
+    if structured:
+        return json.dumps({"empathy": empathy, "question": question}, ensure_ascii=False)
+    return f"{empathy} {question}"
+
+
+# -------------------------------
+# 지연 분포
+# -------------------------------
+class LatencyModel:
+    """
+    (첫 토큰 시간, 전체 시간) 표본 생성.
+    - fixed:0.8            → 첫 토큰 0.8초
+    - lognormal:1.2,0.6    → 첫 토큰 중앙값 1.2초, sigma 0.6 (꼬리가 긴 분포)
+    - replay:경로.jsonl     → chat_log.jsonl 에 기록된 (ttft, latency) 중 무작위
+    스트리밍은 첫 토큰 이후 token_interval 간격으로 글자 조각을 보낸다.
+    """
+
+    def __init__(self, spec: str, token_interval: float):
+        self.token_interval = token_interval
+        kind, _, arg = spec.partition(":")
+        self.kind = kind
+
+        if kind == "fixed":
+            self.value = float(arg or 0.5)
+        elif kind == "lognormal":
+            median, _, sigma = (arg or "1.0,0.5").partition(",")
+            self.mu = math.log(float(median))
+            self.sigma = float(sigma or 0.5)
+        elif kind == "replay":
+            self.samples = self._load_replay(arg)
+            if not self.samples:
+                raise SystemExit(f"replay 표본 없음: {arg}")
+        else:
+            raise SystemExit(f"알 수 없는 지연 분포: {spec}")
+
+    @staticmethod
+    def _load_replay(path: str) -> List[Tuple[float, float]]:
+        samples = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                # 업스트림에서 실제로 받은 응답만 (캐시 / fallback 제외)
+                if record.get("role") != "bot" or record.get("source", "upstream") != "upstream":
+                    continue
+                if record.get("latency"):
+                    samples.append((float(record.get("ttft") or record["latency"]), float(record["latency"])))
+        return samples
+
+    def sample(self, n_chunks: int) -> Tuple[float, float]:
+        """반환: (첫 토큰까지 시간, 이후 조각 사이 간격)"""
+        if self.kind == "fixed":
+            return self.value, self.token_interval
+        if self.kind == "lognormal":
+            return random.lognormvariate(self.mu, self.sigma), self.token_interval
+        ttft, latency = random.choice(self.samples)
+        return ttft, max(0.0, latency - ttft) / max(1, n_chunks)
+
+
+# -------------------------------
+# 프롬프트 캐시 흉내
+# -------------------------------
+class PrefixCache:
+    """
+    OpenAI 프롬프트 캐시와 비슷한 규칙: 입력을 block 토큰 단위로 잘라 앞부분 해시를 기억해 두고,
+    이미 본 가장 긴 앞부분(min_tokens 이상)을 cached_tokens 로 돌려준다.
+    토큰 수는 응답 usage 와 같은 기준(한국어 대략 토큰당 2글자).
+    """
+
+    def __init__(self, min_tokens: int = 1024, block_tokens: int = 128, capacity: int = 50_000):
+        self.min_tokens = min_tokens
+        self.block_tokens = block_tokens
+        self.capacity = capacity
+        self._seen: "OrderedDict[bytes, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, messages: List[Dict[str, str]]) -> int:
+        """이번 요청에서 캐시된 토큰 수. 요청의 앞부분들은 다음 요청을 위해 기억한다."""
+        text = "".join(f"{m.get('role')}\n{m.get('content') or ''}\n" for m in messages)
+        block_chars = self.block_tokens * 2
+        digest = hashlib.sha1()
+        prefixes = []
+        for end in range(block_chars, len(text) + 1, block_chars):
+            digest.update(text[end - block_chars:end].encode("utf-8"))
+            if end // 2 >= self.min_tokens:
+                prefixes.append((end // 2, digest.digest()))
+
+        cached = 0
+        with self._lock:
+            for tokens, key in prefixes:
+                if key in self._seen:
+                    cached = tokens
+                    self._seen.move_to_end(key)
+                else:
+                    self._seen[key] = None
+            while len(self._seen) > self.capacity:
+                self._seen.popitem(last=False)
+        return cached
+
+
+# -------------------------------
+# HTTP 핸들러
+# -------------------------------
+class MockLLMHandler(BaseHTTPRequestHandler):
+    server_version = "MockLLM/1.0"
+    protocol_version = "HTTP/1.1"
+
+    # ThreadingHTTPServer 에 붙여 둔 설정 / 통계
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, fmt, *args):
+        if not self.config.quiet:
+            super().log_message(fmt, *args)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": m, "object": "model"} for m in self.config.models]})
+        elif self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.server.stats)
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        self._count("requests")
+
+        # 오류 주입
+        roll = random.random()
+        if roll < self.config.error_429:
+            self._count("injected_429")
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}},
+                headers={"Retry-After": str(self.config.retry_after)},
+            )
+            return
+        roll -= self.config.error_429
+        if roll < self.config.error_500:
+            self._count("injected_500")
+            self._send_json(500, {"error": {"message": "Internal server error (mock)", "type": "server_error"}})
+            return
+        roll -= self.config.error_500
+        if roll < self.config.timeout_rate:
+            self._count("injected_timeout")
+            time.sleep(self.config.hang_seconds)  # 응답 없이 대기 → 클라이언트 read timeout
+            self.close_connection = True
+            return
+
+        model = body.get("model", "mock")
+        messages = body.get("messages", [])
+        structured = (body.get("response_format") or {}).get("type") in ("json_schema", "json_object")
+        text = make_reply(messages, structured)
+
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+        if max_tokens:
+            text = text[: int(max_tokens) * 2]  # 한국어 기준 대략 토큰당 2글자
+
+        usage = {
+            "prompt_tokens": sum(len(m.get("content") or "") for m in messages) // 2,
+            "completion_tokens": max(1, len(text) // 2),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        chunks = [text[i:i + self.config.chunk_chars] for i in range(0, len(text), self.config.chunk_chars)]
+        ttft, interval = self.config.latency.sample(len(chunks))
+
+        if self.config.prefix_cache:
+            cached = self.config.prefix_cache.lookup(messages)
+            usage["prompt_tokens_details"] = {"cached_tokens": cached}
+            if cached:
+                self._count("prefix_cache_hits")
+                # 캐시된 비율만큼 첫 토큰 시간(입력 처리 시간) 단축
+                ttft *= 1 - self.config.prefix_cache_speedup * cached / max(1, usage["prompt_tokens"])
+
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            self._stream(model, chunks, ttft, interval, usage if include_usage else None)
+        else:
+            time.sleep(ttft + interval * len(chunks))
+            self._send_json(200, self._completion(model, text, usage))
+
+    # -------------------------------
+    # 응답 작성
+    # -------------------------------
+    @staticmethod
+    def _completion(model: str, text: str, usage: Dict[str, int]) -> Dict:
+        return {
+            "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    def _stream(self, model: str, chunks: List[str], ttft: float, interval: float, usage: Optional[Dict[str, int]]):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        def event(choices, extra=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+            }
+            payload.update(extra or {})
+            self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            time.sleep(ttft)
+            event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            for chunk in chunks:
+                event([{"index": 0, "delta": {"content": chunk}, "finish_reason": None}])
+                time.sleep(interval)
+            event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if usage:
+                event([], {"usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 클라이언트가 스트림을 닫음 (헤지 요청에서 진 쪽 등)
+            self._count("client_closed")
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _count(self, name: str):
+        with self.server.stats_lock:
+            self.server.stats[name] = self.server.stats.get(name, 0) + 1
+
+
+def build_server(host: str, port: int, config: argparse.Namespace) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.config = config
+    server.stats = {}
+    server.stats_lock = threading.Lock()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 호환 로컬 모의 LLM 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_LLM_PORT", "8001")))
+    parser.add_argument("--latency", default="lognormal:1.0,0.5",
+                        help="fixed:초 | lognormal:중앙값초,sigma | replay:chat_log.jsonl 경로 (첫 토큰 기준)")
+    parser.add_argument("--token-interval", type=float, default=0.03, help="스트리밍 조각 사이 간격(초)")
+    parser.add_argument("--chunk-chars", type=int, default=3, help="스트리밍 조각 하나의 글자 수")
+    parser.add_argument("--error-429", type=float, default=0.0, help="429 응답 비율")
+    parser.add_argument("--error-500", type=float, default=0.0, help="500 응답 비율")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="응답 없이 대기하는 비율")
+    parser.add_argument("--hang-seconds", type=float, default=60.0, help="타임아웃 주입 시 대기 시간(초)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 응답의 Retry-After(초)")
+    parser.add_argument("--models", default="gpt-4o,gpt-4o-mini", help="/v1/models 에 보여줄 모델 목록")
+    parser.add_argument("--prefix-cache", action="store_true", help="프롬프트 캐시 흉내 (cached_tokens 응답)")
+    parser.add_argument("--prefix-cache-min", type=int, default=1024, help="캐시되는 최소 입력 토큰 수")
+    parser.add_argument("--prefix-cache-speedup", type=float, default=0.5,
+                        help="전부 캐시됐을 때 줄어드는 첫 토큰 시간 비율 (0~1)")
+    parser.add_argument("--quiet", action="store_true", help="요청 로그 끄기")
+    config = parser.parse_args()
+
+    config.latency = LatencyModel(config.latency, config.token_interval)
+    config.prefix_cache = PrefixCache(config.prefix_cache_min) if config.prefix_cache else None
+    config.models = [m.strip() for m in config.models.split(",") if m.strip()]
+
+    server = build_server(config.host, config.port, config)
+    print(f"[MOCK LLM] http://{config.host}:{config.port}/v1 (latency={config.latency.kind}, "
+          f"prefix_cache={'on' if config.prefix_cache else 'off'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
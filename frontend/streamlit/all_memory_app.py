@@ -5,7 +5,17 @@ from datetime import datetime
 import streamlit as st
 from dotenv import load_dotenv
 import pandas as pd
-from openai import OpenAI
+
+# 프로젝트 루트를 import 경로에 추가 (backend 공용 모듈 사용)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from core.llm_stream import get_route, run_chat_completion
+from core.run_stats import count_script_run, finish_turn, start_turn
+from core.session_store import persist_session, restore_session
+from backend.core.budget import PromptBudget, Section
+from backend.core.conversation import get_scenario, next_action
+from backend.core.fallback import fallback_closing, fallback_reply
+from backend.core.log_sink import get_log_sink
 
 # Streamlit 스크롤 방지용 컴포넌트
 import streamlit.components.v1 as components 
@@ -13,8 +23,15 @@ import streamlit.components.v1 as components
 # 환경 변수 로드
 load_dotenv()
 
-# OpenAI 클라이언트
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# 스트리밍 모드 (토큰이 도착하는 대로 말풍선에 표시)
+STREAMING = os.getenv("STREAMING", "true").lower() == "true"  # 기본값 스트리밍 사용
+
+# 모델 라우팅 키로 쓰는 앱 이름 (config/model_routing.json 의 "app")
+APP_NAME = os.path.splitext(os.path.basename(__file__))[0]
+
+# 메모리 블록 토큰 예산: 넘으면 오래된 대화 → 강점/성향 → 학생 정보 순으로 줄이고 "(… N개 생략)" 으로 요약
+MEMORY_BUDGET_TOKENS = int(os.getenv("MEMORY_BUDGET_TOKENS", "500"))
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "10"))   # 예산과 별개로 넣는 최근 대화 최대 턴 수
 
 
 
@@ -86,51 +103,64 @@ def update_dynamic_memory(role, text):
 
 
 # ------------------------------
-# 고정 질문
+# 대화 시나리오 (고정 질문 / 단계 / 턴별 gpt_* 함수) → 전이 표로 컴파일
 # ------------------------------
-RULE_QUESTIONS = {
-    1: "친구야, 오늘 어땠어?",
-    2: "오늘 활동 중에 가장 기억에 남았던 순간은 뭐였어?",
-    3: "마지막으로, 오늘 활동을 마치며 봉봉이에게 하고 싶은 말 있을까?"
-}
+SCENARIO = get_scenario(APP_NAME, os.path.join(os.path.dirname(__file__), "config", "scenarios.json"))
+RULE_QUESTIONS = SCENARIO.rule_questions
+STAGE_LABELS = SCENARIO.stage_labels
 
 # ------------------------------
 # GPT FUNCTIONS
 # ------------------------------
 
-def build_memory_prompt(static, dynamic):
-    # 정적 메모리
-    s = static
-    d = dynamic.get("turns", [])
-
-    static_block = f"""
-[학생 정보 요약 — 참고용 메모리]
-- 자기표현 키워드: {s.get('user_self_keywords')}
-- 그림 제목: {s.get('user_drawing_info', {}).get('title')}
-- 그림 속 나이: {s.get('user_drawing_info', {}).get('age_in_picture')}
-- 현재 행동: {s.get('user_drawing_info', {}).get('current_action')}
-- 미래 예측: {s.get('user_drawing_info', {}).get('future_prediction')}
-- 그림 속 메시지: {s.get('user_drawing_info', {}).get('message_to_self')}
-
-[강점 및 성향]
-- 좋아하는 것: {s.get('user_hero_info', {}).get('likes')}
-- 잘하는 것: {s.get('user_hero_info', {}).get('abilities')}
-- 강점: {s.get('user_hero_info', {}).get('strength_points')}
-- 약점: {s.get('user_hero_info', {}).get('weakness_points')}
-- 잠재력: {s.get('user_hero_info', {}).get('potentials')}
-"""
+# 정적 메모리 항목: (표시 이름, static_memory 안의 경로)
+PROFILE_FIELDS = [
+    ("자기표현 키워드", ("user_self_keywords",)),
+    ("그림 제목", ("user_drawing_info", "title")),
+    ("그림 속 나이", ("user_drawing_info", "age_in_picture")),
+    ("현재 행동", ("user_drawing_info", "current_action")),
+    ("미래 예측", ("user_drawing_info", "future_prediction")),
+    ("그림 속 메시지", ("user_drawing_info", "message_to_self")),
+]
+STRENGTH_FIELDS = [
+    ("좋아하는 것", ("user_hero_info", "likes")),
+    ("잘하는 것", ("user_hero_info", "abilities")),
+    ("강점", ("user_hero_info", "strength_points")),
+    ("약점", ("user_hero_info", "weakness_points")),
+    ("잠재력", ("user_hero_info", "potentials")),
+]
+
+
+def memory_lines(static, fields):
+    """값이 있는 항목만 '- 이름: 값' 줄로 (비어 있는 항목은 None 으로 보내지 않음)."""
+    lines = []
+    for label, path in fields:
+        value = static
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if value not in (None, "", [], {}):
+            lines.append(f"- {label}: {value}")
+    return lines
 
-    # 동적 메모리 = 지금까지의 대화 축약
-    turns_text = "\n".join(
-        [f"- {t['role']}: {t['text']}" for t in d[-10:]]  # 최근 10개만 사용
-    )
 
-    dynamic_block = f"""
-[지금까지의 대화 내용(최근)]
-{turns_text}
-"""
+def build_memory_prompt(static, dynamic):
+    """
+    학생 정보 + 최근 대화 블록을 MEMORY_BUDGET_TOKENS 안으로 맞춘다.
+    반환: (메모리 문자열, 예산 결정 기록)
+    """
+    turns = dynamic.get("turns", [])[-MEMORY_MAX_TURNS:]
 
-    return static_block + "\n" + dynamic_block
+    sections = [
+        Section("profile", memory_lines(static, PROFILE_FIELDS), priority=2, allowance=120, keep="oldest",
+                header="[학생 정보 요약 — 참고용 메모리]"),
+        Section("strengths", memory_lines(static, STRENGTH_FIELDS), priority=1, allowance=80, keep="oldest",
+                header="[강점 및 성향]"),
+        # 동적 메모리 = 지금까지의 대화 축약 (오래된 턴부터 생략)
+        Section("recent_turns", [f"- {t['role']}: {t['text']}" for t in turns], priority=0, allowance=150,
+                header="[지금까지의 대화 내용(최근)]", omitted="- (앞선 대화 {n}턴 생략)"),
+    ]
+    texts, report = PromptBudget(MEMORY_BUDGET_TOKENS).fit(sections, label="memory")
+    return "\n\n".join(text for text in texts.values() if text), report
 
 
 
@@ -140,14 +170,14 @@ def gpt_free_followup(user_message: str, stage: int, turn: int) -> str:
     static, dynamic = get_memory_context()
 
     # memory prompt 생성
-    memory_text = build_memory_prompt(static, dynamic)
+    memory_text, budget = build_memory_prompt(static, dynamic)
     
     print(static)
     print(dynamic)
     print(memory_text)
     print("--------------------------------")
     """공감 + 자유맥락 후속 질문 (고정질문 X)"""
-    stage_label = {1: "S1 활동묻기 단계", 2: "S2 기억회상 단계", 3: "S3 활동 마무리 단계"}.get(stage, "대화 단계")
+    stage_label = STAGE_LABELS.get(stage, "대화 단계")
 
     prompt = f"""
 {memory_text}
@@ -172,8 +202,13 @@ def gpt_free_followup(user_message: str, stage: int, turn: int) -> str:
 {user_message}
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
+    # GPT 호출 (스트리밍 모드면 말풍선에 바로 표시)
+    result = run_chat_completion(
+        bot_bubble_html,
+        stage="gpt_free_followup",
+        stream=STREAMING,
+        fallback=fallback_reply,
+        route=get_route(APP_NAME, stage, "gpt_free_followup"),
         messages=[
             # 1) 역할 지시 — 여기에서만
             {
@@ -194,18 +229,19 @@ def gpt_free_followup(user_message: str, stage: int, turn: int) -> str:
             {"role": "user", "content": prompt},
         ],
     )
-    return response.choices[0].message.content
+    st.session_state["last_llm_meta"] = {**result.meta(), "prompt_budget": budget.meta()}
+    return result.text
 
 
 def gpt_intro_with_fixed(prev_answer: str, stage: int, fixed_question: str) -> str:
     static, dynamic = get_memory_context()
-    memory_text = build_memory_prompt(static, dynamic)
+    memory_text, budget = build_memory_prompt(static, dynamic)
     print(static)
     print(dynamic)
     print(memory_text)
     print("--------------------------------")
     """단계 시작 시: 직전 답변 공감 + 고정 질문"""
-    stage_label = {2: "S2 기억회상 단계", 3: "S3 활동 마무리 단계"}.get(stage, "다음 단계")
+    stage_label = STAGE_LABELS.get(stage, "다음 단계")
 
     prompt = f"""
 
@@ -232,8 +268,13 @@ def gpt_intro_with_fixed(prev_answer: str, stage: int, fixed_question: str) -> s
 "{fixed_question}"
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
+    # GPT 호출 (스트리밍 모드면 말풍선에 바로 표시)
+    result = run_chat_completion(
+        bot_bubble_html,
+        stage="gpt_intro_with_fixed",
+        stream=STREAMING,
+        fallback=lambda: fallback_reply(fixed_question),
+        route=get_route(APP_NAME, stage, "gpt_intro_with_fixed"),
         messages=[
             # 1) 역할 지시 — 여기에서만
             {
@@ -254,12 +295,13 @@ def gpt_intro_with_fixed(prev_answer: str, stage: int, fixed_question: str) -> s
             {"role": "user", "content": prompt},
         ],
     )
-    return response.choices[0].message.content
+    st.session_state["last_llm_meta"] = {**result.meta(), "prompt_budget": budget.meta()}
+    return result.text
 
 
-def gpt_closing(user_message: str) -> str:
+def gpt_closing(user_message: str, stage: int = 3) -> str:
     static, dynamic = get_memory_context()
-    memory_text = build_memory_prompt(static, dynamic)
+    memory_text, budget = build_memory_prompt(static, dynamic)
 
     prompt = f"""
 {memory_text}
@@ -282,8 +324,13 @@ def gpt_closing(user_message: str) -> str:
 {user_message}
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
+    # GPT 호출 (스트리밍 모드면 말풍선에 바로 표시)
+    result = run_chat_completion(
+        bot_bubble_html,
+        stage="gpt_closing",
+        stream=STREAMING,
+        fallback=fallback_closing,
+        route=get_route(APP_NAME, stage, "gpt_closing"),
         messages=[
             # 1) 역할 지시 — 여기에서만
             {
@@ -300,7 +347,8 @@ def gpt_closing(user_message: str) -> str:
             {"role": "user", "content": prompt},
         ],
     )
-    return response.choices[0].message.content
+    st.session_state["last_llm_meta"] = {**result.meta(), "prompt_budget": budget.meta()}
+    return result.text
 
 
 
@@ -308,6 +356,9 @@ def gpt_closing(user_message: str) -> str:
 # 메시지 추가 (로그 저장 통합)
 # -------------------------------------------------
 def add_message(role: str, text: str):
+    # 직전 GPT 호출의 메타 정보는 봇 메시지 로그에 한 번만 붙인다
+    meta = st.session_state.pop("last_llm_meta", None) if role == "bot" else None
+
     st.session_state["messages"].append({
         "role": role,
         "message": text,
@@ -315,7 +366,7 @@ def add_message(role: str, text: str):
     })
     
     # 턴 단위 파일 실시간 저장
-    append_turn_to_file(role, text)
+    append_turn_to_file(role, text, meta)
 
      # 동적 메모리 업데이트 추가
     update_dynamic_memory(role, text)
@@ -325,6 +376,9 @@ def add_message(role: str, text: str):
 # 세션 초기화
 # -------------------------------------------------
 def init_session():
+    # URL 세션 토큰(?sid=)으로 저장된 대화가 있으면 이어서 진행
+    restore_session(APP_NAME)
+
     if "messages" not in st.session_state:
         st.session_state["messages"] = []
 
@@ -341,7 +395,7 @@ def init_session():
 # -------------------------------------------------
 # 턴 단위 파일 저장 (실시간 append) - 데모 1에서 가져옴
 # -------------------------------------------------
-def append_turn_to_file(role, text):
+def append_turn_to_file(role, text, meta=None):
     current_index = len(st.session_state["messages"]) - 1
     turn_number = (current_index // 2) + 1
     
@@ -352,16 +406,16 @@ def append_turn_to_file(role, text):
         "text": text,
         "turn": turn_number
     }
+
+    # GPT 응답 메타 정보 (첫 토큰 시간 / 전체 응답 시간 등)
+    if meta:
+        log.update(meta)
     
     # 저장 경로 설정
-    log_dir = os.path.join(os.path.dirname(__file__), "data/logs") # 실제 환경에 맞게 경로 조정
-    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(os.path.dirname(__file__), "data/logs", "chat_log.jsonl")  # 실제 환경에 맞게 경로 조정
 
-    log_path = os.path.join(log_dir, "chat_log.jsonl")
-
-    # JSONL 형식 저장
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(log, ensure_ascii=False) + "\n")
+    # JSONL 형식 저장: 백그라운드 기록기 큐에 넣기만 하고 바로 돌아옴 (봇 메시지 = 턴 끝, LOG_FLUSH 정책으로 flush)
+    get_log_sink(log_path).write(log, end_of_turn=(role == "bot"))
 
 
 
@@ -370,35 +424,43 @@ def append_turn_to_file(role, text):
 # UI 렌더링
 # -------------------------------------------------
 def render_chat_messages():
-    # 빈 공간을 만들어 스크롤을 맨 아래로 내리는 역할을 합니다.
-    # st.empty().markdown(...) 대신, div를 직접 사용하여 Streamlit 기본 동작을 보장합니다.
     for msg in st.session_state["messages"]:
-        if msg["role"] == "bot":
-            st.markdown(f"""
-            <div style="text-align:left;">
-                <div style="
-                    display:inline-block; background:#f1f0f0;
-                    padding:12px 15px; border-radius:12px;
-                    margin:5px 0; max-width:70%;
-                    font-size:16px;
-                    color:#000000;">
-                    🧸 <b>봉봉</b><br>{msg['message']}
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div style="text-align:right;">
-                <div style="
-                    display:inline-block; background:#d1e7ff;
-                    padding:12px 15px; border-radius:12px;
-                    margin:5px 0; max-width:70%;
-                    font-size:16px;
-                    color:#000000;">
-                    🌟 <b>나</b><br>{msg['message']}
-                </div>
+        render_message(msg)
+
+
+def render_message(msg):
+    """말풍선 1개 그리기 (봇: 왼쪽 / 아이: 오른쪽)."""
+    if msg["role"] == "bot":
+        st.markdown(bot_bubble_html(msg["message"]), unsafe_allow_html=True)
+    else:
+        st.markdown(f"""
+        <div style="text-align:right;">
+            <div style="
+                display:inline-block; background:#d1e7ff;
+                padding:12px 15px; border-radius:12px;
+                margin:5px 0; max-width:70%;
+                font-size:16px;
+                color:#000000;">
+                🌟 <b>나</b><br>{msg['message']}
             </div>
-            """, unsafe_allow_html=True)
+        </div>
+        """, unsafe_allow_html=True)
+
+
+def bot_bubble_html(text: str) -> str:
+    """스트리밍 중인 봇 말풍선 HTML (render_chat_messages 의 봇 말풍선과 동일한 스타일)."""
+    return f"""
+    <div style="text-align:left;">
+        <div style="
+            display:inline-block; background:#f1f0f0;
+            padding:12px 15px; border-radius:12px;
+            margin:5px 0; max-width:70%;
+            font-size:16px;
+            color:#000000;">
+            🧸 <b>봉봉</b><br>{text}
+        </div>
+    </div>
+    """
 
 
 # -------------------------------------------------
@@ -514,139 +576,80 @@ def process_flow(user_input=None):
     process_flow(user_input)
 
     챗봇의 전체 대화 단계를 관리하는 Finite State Machine(FSM).
+    전이 규칙은 config/scenarios.json 의 시나리오를 컴파일한 전이 표(backend/core/conversation.py)가 정하고,
+    여기서는 그 행동을 세션 상태 / 화면에 반영한다.
 
-    🔹 FSM 설계
-    S1 → S2 → S3 순서로 진행되며,
-    각 스테이지에서 GPT 공감 턴은 고정된 substep(1~6)으로 나뉜다.
+    🔹 기본 시나리오
+    S1 → S2 → S3 순서로 진행되며, 각 스테이지는 substep 1~6 으로 나뉜다.
 
-    - substep 1 : RULE 또는 GPT의 첫 질문 자동 발화
+    - substep 1 : RULE(S1) 또는 gpt_intro_with_fixed 의 첫 질문 자동 발화
     - substep 2 : 사용자 입력
-    - substep 3 : GPT 공감 1턴 자동 발화
+    - substep 3 : gpt_free_followup 공감 1턴 자동 발화
     - substep 4 : 사용자 입력
-    - substep 5 : GPT 공감 2턴 자동 발화
+    - substep 5 : gpt_free_followup 공감 2턴 자동 발화 (S3 에서는 gpt_closing 마무리)
     - substep 6 : 사용자 입력 후 다음 스테이지로 전환 (S3에서는 종료)
 
-    🔹 종료 상태 (End State)
-    state==3 AND substep==6 → 대화 종료
-    - 입력창 숨김
-    - 자동 발화 없음
-    - 다음 스테이지 이동 없음
-    - 다운로드 버튼만 노출
+    🔹 한 번의 실행에서 "아이 입력 → 봇 답변"까지 처리한다 (턴마다 st.rerun() 하지 않음).
+    상태는 행동마다 바로 저장하므로, 실행이 중간에 끊겨도 다음 실행에서 남은 봇 턴을 이어서 처리한다.
     """
-    
-    # ---------------------------------------------
-    # 🔥 0. 대화 종료 후 입력/자동진행 완전 차단
-    # ---------------------------------------------
-    # state=3, substep=6 = S3 마지막 GPT 발화까지 모두 끝난 상태
-    if st.session_state["state"] == 3 and st.session_state["substep"] == 6:
-        return  # 더 이상 어떤 처리도 하지 않음
 
-    state = st.session_state["state"]
-    sub = st.session_state["substep"]
-
-    # GPT 답변 중(sub=1,3,5)에 들어온 유저 입력은 무시
-    if user_input and sub not in [2, 4, 6]:
-        return
-
-    # -------------------------------------------------
-    # 1. 유저 입력 처리 (sub 2, 4, 6)
-    # -------------------------------------------------
-    if user_input:
-        add_message("user", user_input)
-
-        # substep 2, 4 → 다음 GPT 자동 발화를 호출해야 함
-        if sub in [2, 4]:
-            st.session_state["substep"] += 1
-            st.rerun()
-
-        # substep 6 → 다음 단계로 넘어감
-        elif sub == 6:
-            if state < 3:
-                st.session_state["state"] += 1
-                st.session_state["substep"] = 1
-                st.rerun()
-            else:
-                # state=3 & sub=6은 위 최상단 차단에서 이미 필터됨
-                return
-
-        return  # user_input 처리 종료
+    while True:
+        action = next_action(
+            st.session_state["state"],
+            st.session_state["substep"],
+            st.session_state["messages"],
+            user_input=user_input,
+            scenario=SCENARIO,
+        )
 
-    
+        # 🔥 0. 대화 종료 후 입력/자동진행 완전 차단 / 아이 입력 대기
+        if action.kind in ("end", "wait"):
+            return
+
+        # GPT 답변 중(sub=1,3,5)에 들어온 유저 입력은 무시하고 남은 봇 턴 진행
+        if action.kind == "ignore":
+            user_input = None
+            continue
+
+        # -------------------------------------------------
+        # 1. 유저 입력 처리 (sub 2, 4, 6) → 같은 실행에서 봇 턴으로
+        # -------------------------------------------------
+        if action.kind == "user":
+            slot = st.empty()
+            add_message("user", user_input)
+            start_turn()
+            user_input = None
+
+        # -------------------------------------------------
+        # 2. GPT/RULE 자동 발화 처리
+        # -------------------------------------------------
+        else:
+            slot = st.empty()
+            with slot.container():
+                if action.kind == "rule":
+                    bot_msg = action.text
+                elif action.turn_kind == "rule_question":
+                    bot_msg = gpt_intro_with_fixed(action.user_message, action.stage, action.rule_question)
+                elif action.turn_kind == "ending":
+                    bot_msg = gpt_closing(action.user_message, action.stage)
+                else:
+                    bot_msg = gpt_free_followup(action.user_message, action.stage, action.turn)
+
+            # 봇 답변으로 턴이 끝나면 이번 턴에 든 스크립트 실행 횟수를 로그에 남김
+            runs = finish_turn()
+            if runs is not None:
+                st.session_state.setdefault("last_llm_meta", {})["script_runs"] = runs
 
-    # -------------------------------------------------
-    # 2. GPT/RULE 자동 발화 처리 (user_input == None일 때)
-    # 이 부분이 첫 로딩 시점(sub=1)과 GPT 응답 턴(sub=3, 5)을 담당
-    # -------------------------------------------------
-    
-    # S1 활동묻기
-    if state == 1:
-        if sub == 1: # S1-1: 룰베이스 고정 질문 (첫 로딩 시점)
-            add_message("bot", RULE_QUESTIONS[1])
-            st.session_state["substep"] = 2
-            st.rerun() # 유저 입력 대기 상태로 전환
-        
-        if sub == 3: # S1-3: GPT 공감 1턴 (직전 유저 답변 후)
-            last = st.session_state["messages"][-1]["message"]
-            bot_msg = gpt_free_followup(last, 1, 1)
             add_message("bot", bot_msg)
-            st.session_state["substep"] = 4
-            st.rerun() # 유저 입력 대기 상태로 전환
-        
-        if sub == 5: # S1-5: GPT 공감 2턴
-            last = st.session_state["messages"][-1]["message"]
-            bot_msg = gpt_free_followup(last, 1, 2)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 6
-            st.rerun() # 유저 입력 대기 상태로 전환
-
-    # S2 기억회상
-    elif state == 2:
-        if sub == 1: # S2-1: GPT 공감 + 고정 질문 (S1 종료 후)
-            prev_answer = st.session_state["messages"][-1]["message"]
-            fixed = RULE_QUESTIONS[2]
-            bot_msg = gpt_intro_with_fixed(prev_answer, 2, fixed)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 2
-            st.rerun()
-            
-        if sub == 3: # S2-3: GPT 공감 1턴
-            last = st.session_state["messages"][-1]["message"]
-            bot_msg = gpt_free_followup(last, 2, 1)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 4
-            st.rerun()
-            
-        if sub == 5: # S2-5: GPT 공감 2턴
-            last = st.session_state["messages"][-1]["message"]
-            bot_msg = gpt_free_followup(last, 2, 2)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 6
-            st.rerun()
 
-    # S3 마무리
-    elif state == 3:
-        if sub == 1: # S3-1: GPT 공감 + 고정 질문 (S2 종료 후)
-            prev_answer = st.session_state["messages"][-1]["message"]
-            fixed = RULE_QUESTIONS[3]
-            bot_msg = gpt_intro_with_fixed(prev_answer, 3, fixed)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 2
-            st.rerun()
-            
-        if sub == 3: # S3-3: GPT 공감 1턴
-            last = st.session_state["messages"][-1]["message"]
-            bot_msg = gpt_free_followup(last, 3, 1)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 4
-            st.rerun()
-            
-        if sub == 5: # S3-5: GPT 공감 2턴 (마무리 발화)
-            last = st.session_state["messages"][-1]["message"]
-            bot_msg = gpt_closing(last)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 6
-            #st.session_state["downloads_enabled"] = True
-            st.rerun() # 대화 완료 후 다운로드 버튼을 활성화하기 위해 RERUN
+        # 기록 → 상태 전이 → 저장을 말풍선 그리기보다 먼저 끝낸다.
+        # 그리는 도중 실행이 중단돼도 같은 턴에 다시 들어와 메시지를 두 번 기록하지 않음
+        st.session_state["state"] = action.state
+        st.session_state["substep"] = action.substep
+        persist_session(APP_NAME)
+
+        with slot.container():
+            render_message(st.session_state["messages"][-1])
 
 
 # -------------------------------------------------
@@ -654,6 +657,7 @@ def process_flow(user_input=None):
 # -------------------------------------------------
 def main():
     st.set_page_config(layout="centered", page_title="Chatbot Demo – Step 4")
+    count_script_run()
 
     st.markdown("""
         <style>
@@ -704,12 +708,8 @@ def main():
 
 
 
-    # --- 입력 가능 substep 정의: 유저 입력 턴만 가능 ---
-    can_user_input = (sub in [2, 4, 6])
-
-    # --- S3 종료(sub=6)면 입력창 숨김 ---
-    if state == 3 and sub == 6:
-        can_user_input = False
+    # --- 입력 가능 substep 정의: 유저 입력 턴만 가능 (대화 종료 후에는 입력창 숨김) ---
+    can_user_input = SCENARIO.accepts_input(state, sub)
 
     # --- 입력창 표시 ---
     if can_user_input:
@@ -721,15 +721,18 @@ def main():
 
     # 3. FSM 처리 (입력 유무에 따라 한 번만 호출)
     process_flow(user_input)
-    
 
-    # 4. 저장 영역 (S3-5 → substep=6 이후 처리)
+    # 입력창 표시 여부가 바뀌었을 때만(첫 고정 질문 직후 / 마무리 인사 직후) 한 번 다시 그림
+    if can_user_input != SCENARIO.accepts_input(st.session_state["state"], st.session_state["substep"]):
+        st.rerun()
+
+    # 4. 저장 영역 (마무리 인사 후 대화 종료 상태에서 처리)
     state = st.session_state["state"]
     sub = st.session_state["substep"]
     downloads_enabled = st.session_state.get("downloads_enabled", False)
 
     # (1) 아직 다운로드 버튼 누르기 전 → 중앙에 "대화 저장" 버튼만 표시
-    if state == 3 and sub == 6 and not downloads_enabled:
+    if SCENARIO.is_finished(state, sub) and not downloads_enabled:
 
         st.markdown("<div style='height:25px;'></div>", unsafe_allow_html=True)  # 마무리 완료 버튼 위 여백 추가
 
@@ -739,6 +742,7 @@ def main():
 
         if save_click:
             st.session_state["downloads_enabled"] = True
+            persist_session(APP_NAME)
             st.rerun()
 
         # # 구분선 + 여백
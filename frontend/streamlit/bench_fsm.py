@@ -0,0 +1,240 @@
+"""
+대화 FSM 벤치마크: if 사다리(기존 next_action) vs 컴파일된 전이 표(Scenario)
+
+1) 전이 결정(dispatch) 1회 시간: 모든 (state, substep) 을 돌며 next_action 호출
+2) 세션 1개(S1→S3) 스크립트 시간: GPT 는 즉시 답하는 가짜 함수로 바꾸고 엔진 + 상태 갱신 + 말풍선 HTML 만 잰다
+   - ladder+rerun : 예전 all_memory_app 처럼 행동 1개마다 st.rerun() → 매 실행마다 전체 대화 다시 그림
+   - ladder       : 기존 if 사다리 + 한 번의 실행에서 "입력 → 봇 답변" 처리
+   - table        : 전이 표 + 한 번의 실행에서 "입력 → 봇 답변" 처리
+   Streamlit 자체의 렌더링 / 웹소켓 비용은 포함하지 않는다 (스크립트 쪽 CPU 시간만).
+
+사용법 (프로젝트 루트에서):
+    python frontend/streamlit/bench_fsm.py
+    python frontend/streamlit/bench_fsm.py --sessions 2000 --stages 5 --empathy-turns 3
+"""
+import argparse
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 프로젝트 루트를 import 경로에 추가 (backend 공용 모듈 사용)
+sys.path.append(os.path.abspath(os.path.join(BASE_DIR, "..", "..")))
+
+from backend.core.conversation import DEFAULT_SCENARIO, RULE_QUESTIONS, Scenario, next_action
+
+
+# -------------------------------
+# 기준선: 전이 표 도입 전 if 사다리 (S1~S3 × substep 1~6 고정)
+# -------------------------------
+USER_TURNS = (2, 4, 6)
+FINAL_STATE = 3
+
+
+@dataclass
+class LadderAction:
+    kind: str
+    state: int
+    substep: int
+    template: Optional[str] = None
+    stage: int = 0
+    turn: int = 0
+    text: Optional[str] = None
+    user_message: str = ""
+    rule_question: Optional[str] = None
+
+
+def ladder_next_action(
+    state: int,
+    substep: int,
+    messages: List[Dict[str, str]],
+    generated_questions: Optional[List[str]] = None,
+    user_input: Optional[str] = None,
+    rule_questions: Optional[Dict[int, str]] = None,
+) -> LadderAction:
+    rule_questions = rule_questions or RULE_QUESTIONS
+
+    if state >= FINAL_STATE and substep >= 6:
+        return LadderAction("end", state, substep)
+
+    if user_input:
+        if substep not in USER_TURNS:
+            return LadderAction("ignore", state, substep)
+        if substep in (2, 4):
+            return LadderAction("user", state, substep + 1, user_message=user_input)
+        return LadderAction("user", state + 1, 1, user_message=user_input)
+
+    if substep in USER_TURNS:
+        return LadderAction("wait", state, substep)
+
+    last = messages[-1]["message"] if messages else ""
+
+    if substep == 1:
+        if state == 1:
+            return LadderAction("rule", state, 2, stage=state, text=rule_questions[1])
+        return LadderAction(
+            "llm", state, 2,
+            template="empathy_rule_question",
+            stage=state,
+            user_message=last,
+            rule_question=rule_questions[state],
+        )
+
+    if substep == 5 and state == FINAL_STATE:
+        return LadderAction("llm", state, 6, template="empathy_ending_message", stage=state, user_message=last)
+
+    return LadderAction(
+        "llm", state, substep + 1,
+        template="empathy_free_question",
+        stage=state,
+        turn=1 if substep == 3 else 2,
+        user_message=last,
+    )
+
+
+def ladder_accepts_input(state: int, substep: int) -> bool:
+    return substep in USER_TURNS and not (state >= FINAL_STATE and substep >= 6)
+
+
+# -------------------------------
+# 가짜 화면 / GPT (앱과 같은 말풍선 HTML 을 만들기만 함)
+# -------------------------------
+def bubble_html(msg: Dict[str, str]) -> str:
+    side, color, name = ("left", "#f1f0f0", "🧸 <b>봉봉</b>") if msg["role"] == "bot" else ("right", "#d1e7ff", "🌟 <b>나</b>")
+    return f"""
+    <div style="text-align:{side};">
+        <div style="display:inline-block; background:{color}; padding:12px 15px; border-radius:12px;">
+            {name}<br>{msg['message']}
+        </div>
+    </div>
+    """
+
+
+def fake_reply(action) -> str:
+    if action.kind == "rule":
+        return action.text
+    return f"그랬구나! {action.user_message} 그 얘기 더 해줄래?"
+
+
+# -------------------------------
+# 세션 1개 실행 (스크립트 실행 단위로)
+# -------------------------------
+def run_script(session: dict, user_input, dispatch, accepts_input, single_run: bool) -> bool:
+    """스크립트 1번 실행. 다시 실행(st.rerun)이 필요하면 True."""
+    for msg in session["messages"]:
+        bubble_html(msg)
+
+    can_user_input = accepts_input(session["state"], session["substep"])
+    while True:
+        action = dispatch(session["state"], session["substep"], session["messages"], user_input)
+        if action.kind in ("end", "wait"):
+            break
+        if action.kind == "ignore":
+            user_input = None
+            continue
+
+        message = {"role": "user", "message": user_input} if action.kind == "user" else {"role": "bot", "message": fake_reply(action)}
+        session["messages"].append(message)
+        bubble_html(message)
+        session["state"], session["substep"] = action.state, action.substep
+        user_input = None
+
+        if not single_run:
+            return True
+
+    return can_user_input != accepts_input(session["state"], session["substep"])
+
+
+def run_session(dispatch, accepts_input, single_run: bool) -> int:
+    """아이 답변이 끝날 때까지 세션 1개 진행. 스크립트 실행 횟수 반환."""
+    session = {"state": 1, "substep": 1, "messages": []}
+    runs = 0
+    pending = None
+    while True:
+        runs += 1
+        rerun = run_script(session, pending, dispatch, accepts_input, single_run)
+        pending = None
+        if rerun:
+            continue
+        if not accepts_input(session["state"], session["substep"]):
+            return runs
+        pending = "슈퍼맨 색칠했어 파란색이랑 빨간색"
+
+
+def timed(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="if 사다리 vs 전이 표 FSM 벤치마크")
+    parser.add_argument("--calls", type=int, default=200_000, help="dispatch 측정 호출 수")
+    parser.add_argument("--sessions", type=int, default=5_000, help="세션 측정 횟수")
+    parser.add_argument("--stages", type=int, default=None, help="전이 표만: 단계 수를 바꾼 시나리오로 측정")
+    parser.add_argument("--empathy-turns", type=int, default=None, help="전이 표만: 단계별 공감 턴 수를 바꿔 측정")
+    args = parser.parse_args()
+
+    scenario = Scenario("default", DEFAULT_SCENARIO)
+    messages = [{"role": "user", "message": "재밌었어!"}]
+    keys = [(state, substep, None) for state in range(1, 4) for substep in range(1, 7)]
+    keys += [(state, substep, "재밌었어!") for state in range(1, 4) for substep in (2, 4, 6)]
+    rounds = max(1, args.calls // len(keys))
+
+    def ladder_dispatch():
+        for state, substep, user_input in keys:
+            ladder_next_action(state, substep, messages, None, user_input)
+
+    def table_dispatch():
+        for state, substep, user_input in keys:
+            next_action(state, substep, messages, None, user_input, scenario)
+
+    # 같은 입력에 같은 전이를 내는지 먼저 확인
+    for state, substep, user_input in keys:
+        old = ladder_next_action(state, substep, messages, None, user_input)
+        new = next_action(state, substep, messages, None, user_input, scenario)
+        assert (old.kind, old.state, old.substep, old.template, old.text, old.rule_question) == \
+            (new.kind, new.state, new.substep, new.template, new.text, new.rule_question), (state, substep, user_input)
+        assert old.template != "empathy_free_question" or old.turn == new.turn, (state, substep)
+
+    calls = rounds * len(keys)
+    ladder_s = timed(ladder_dispatch, rounds)
+    table_s = timed(table_dispatch, rounds)
+    print(f"[DISPATCH] calls={calls}")
+    print(f"  ladder : {ladder_s / calls * 1e9:8.0f} ns/call")
+    print(f"  table  : {table_s / calls * 1e9:8.0f} ns/call ({ladder_s / table_s:.2f}x)")
+
+    ladder = lambda s, sub, m, u: ladder_next_action(s, sub, m, None, u)
+    table = lambda s, sub, m, u: next_action(s, sub, m, None, u, scenario)
+    variants = [
+        ("ladder+rerun", ladder, ladder_accepts_input, False),
+        ("ladder", ladder, ladder_accepts_input, True),
+        ("table", table, scenario.accepts_input, True),
+    ]
+
+    print(f"\n[SESSION] sessions={args.sessions} (S1→S3, GPT 즉시 응답)")
+    for name, dispatch, accepts_input, single_run in variants:
+        runs = run_session(dispatch, accepts_input, single_run)
+        elapsed = timed(lambda: run_session(dispatch, accepts_input, single_run), args.sessions)
+        print(f"  {name:<13}: {elapsed / args.sessions * 1e6:8.1f} us/session  script_runs={runs}")
+
+    if args.stages or args.empathy_turns:
+        stages = [
+            {"rule_question": f"질문 {i}?", "opening": "rule" if i == 1 else "llm",
+             "empathy_turns": args.empathy_turns or 2}
+            for i in range(1, (args.stages or 3) + 1)
+        ]
+        custom = Scenario("custom", {"stages": stages})
+        dispatch = lambda s, sub, m, u: next_action(s, sub, m, None, u, custom)
+        runs = run_session(dispatch, custom.accepts_input, True)
+        elapsed = timed(lambda: run_session(dispatch, custom.accepts_input, True), args.sessions)
+        print(f"  {'table custom':<13}: {elapsed / args.sessions * 1e6:8.1f} us/session  script_runs={runs} "
+              f"(stages={len(stages)}, states={len(custom.table)})")
+
+
+if __name__ == "__main__":
+    main()
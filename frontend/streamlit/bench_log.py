@@ -0,0 +1,150 @@
+"""
+chat_log.jsonl 기록 벤치마크: 메시지마다 open/append/close (기존 append_turn_to_file) vs 백그라운드 기록기(log_sink)
+
+1) 처리량(messages/sec): 메시지 N개를 쓰고 파일에 다 내려갈 때까지의 시간
+2) 스크립트 실행 지연: 아이 턴 1번(= 스크립트 실행 1번)에서 로그 기록에 쓰는 시간 (아이 메시지 + 봇 메시지 2줄)
+   --threads 로 여러 세션이 동시에 기록하는 상황도 잰다. GPT / 화면 그리기 시간은 포함하지 않는다.
+
+- direct   : makedirs → open("a") → write 1줄 → close → print (기존 방식, print 는 /dev/null 로)
+- turn     : log_sink, 봇 메시지(턴 끝)마다 flush
+- interval : log_sink, LOG_FLUSH_MS 마다 flush
+- shutdown : log_sink, 종료 때만 flush
+--fsync 를 주면 direct 는 줄마다, log_sink 는 flush 할 때마다 fsync 한다.
+
+사용법 (프로젝트 루트에서):
+    python frontend/streamlit/bench_log.py
+    python frontend/streamlit/bench_log.py --messages 50000 --threads 8 --fsync
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 프로젝트 루트를 import 경로에 추가 (backend 공용 모듈 사용)
+sys.path.append(os.path.abspath(os.path.join(BASE_DIR, "..", "..")))
+
+from backend.core.log_sink import FLUSH_POLICIES, LOG_FLUSH_MS, LogSink
+
+
+def sample_record(role: str, turn: int) -> dict:
+    """앱이 남기는 것과 비슷한 크기의 기록 (봇 메시지는 GPT 메타 정보 포함)."""
+    record = {
+        "session_id": "sess_004",
+        "timestamp": datetime.now().isoformat(),
+        "role": role,
+        "text": "슈퍼맨 색칠했어 파란색이랑 빨간색" if role == "user" else "우와, 멋지다! 어떤 색을 제일 먼저 칠했어?",
+        "turn": turn,
+        "prompt_version": "b54038271a91",
+    }
+    if role == "bot":
+        record.update({
+            "model": "gpt-4o-mini", "stage": "empathy_free_question", "ttft": 0.42, "latency": 1.37,
+            "attempts": 1, "source": "upstream", "prompt_tokens": 653, "cached_tokens": 0,
+            "prompt_layout": "inline", "script_runs": 1,
+            "prompt_budget": {"label": "empathy_free_question", "budget": 400, "before": 212, "used": 212,
+                              "tokens": {"generated_questions": 48, "user_message": 14}, "trimmed": {}},
+        })
+    return record
+
+
+def direct_writer(path: str, fsync: bool, devnull):
+    """기준선: 기존 append_turn_to_file 의 파일 쓰기 부분."""
+    def write(record: dict, end_of_turn: bool = False):
+        log_dir = os.path.dirname(path)
+        os.makedirs(log_dir, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        with contextlib.redirect_stdout(devnull):
+            print(f"[FILE_APPEND] role={record['role']}, turn={record['turn']}, path={path}")
+    return write
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def run_turns(write, turns: int, latencies: list):
+    """스크립트 실행 1번 = 아이 메시지 + 봇 메시지 기록. 실행마다 기록 시간을 latencies 에 추가."""
+    users, bots = sample_record("user", 1), sample_record("bot", 1)
+    for turn in range(turns):
+        started = time.perf_counter()
+        write({**users, "turn": turn + 1})
+        write({**bots, "turn": turn + 1}, end_of_turn=True)
+        latencies.append(time.perf_counter() - started)
+
+
+def bench(name: str, make_writer, finish, messages: int, threads: int):
+    """(이름, 총 시간, 메시지/초, 실행 지연 목록)."""
+    turns_per_thread = max(1, messages // 2 // threads)
+    latencies = [[] for _ in range(threads)]
+    write = make_writer()
+
+    started = time.perf_counter()
+    workers = [
+        threading.Thread(target=run_turns, args=(write, turns_per_thread, latencies[i])) for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    enqueued = time.perf_counter() - started
+    finish()
+    total = time.perf_counter() - started
+
+    runs = [value for values in latencies for value in values]
+    written = turns_per_thread * threads * 2
+    return name, enqueued, total, written / total, runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="open/append/close vs 백그라운드 기록기 chat_log 벤치마크")
+    parser.add_argument("--messages", type=int, default=20_000, help="기록할 메시지 수")
+    parser.add_argument("--threads", type=int, default=1, help="동시에 기록하는 세션(스크립트 스레드) 수")
+    parser.add_argument("--fsync", action="store_true", help="direct 는 줄마다, log_sink 는 flush 마다 fsync")
+    parser.add_argument("--policies", default=",".join(FLUSH_POLICIES), help="잴 flush 정책 (쉼표 구분)")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench-log-")
+    devnull = open(os.devnull, "w")
+    results = []
+    try:
+        path = os.path.join(tmp_dir, "direct", "chat_log.jsonl")
+        results.append(bench("direct", lambda: direct_writer(path, args.fsync, devnull), lambda: None,
+                             args.messages, args.threads))
+
+        for policy in args.policies.split(","):
+            path = os.path.join(tmp_dir, policy, "chat_log.jsonl")
+            sink = LogSink(path, policy=policy, fsync=args.fsync)
+            results.append(bench(policy, lambda: sink.write, sink.close, args.messages, args.threads))
+            with open(path, encoding="utf-8") as f:
+                lines = sum(1 for _ in f)
+            assert lines == sink.written, (policy, lines, sink.written)
+    finally:
+        devnull.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"\n[BENCH] messages={args.messages} threads={args.threads} fsync={args.fsync} flush_ms={LOG_FLUSH_MS}")
+    print(f"{'writer':<10} {'enqueue':>9} {'total':>9} {'msg/s':>10}   실행당 기록 p50 / p95 / max (us)")
+    base = results[0][3]
+    for name, enqueued, total, rate, runs in results:
+        print(f"{name:<10} {enqueued:>8.2f}s {total:>8.2f}s {rate:>10.0f}   "
+              f"{percentile(runs, 0.5) * 1e6:>8.1f} / {percentile(runs, 0.95) * 1e6:>8.1f} / "
+              f"{max(runs) * 1e6:>9.1f}   {rate / base:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
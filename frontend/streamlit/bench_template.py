@@ -0,0 +1,92 @@
+"""
+프롬프트 템플릿 마이크로 벤치마크: str.replace 반복(기존 apply_prompt_template) vs 컴파일된 템플릿
+
+- replace  : 턴마다 lines 를 합치고 키마다 전체 문자열을 다시 훑어 치환 (기존 방식)
+- compiled : 로드 시점에 한 번 컴파일한 PromptTemplate.render (조각 채우기 + join 1번)
+- lines    : apply_prompt_template(lines, ...) — 문자열 리스트를 넘겨도 내용별 캐시로 컴파일은 1번
+
+사용법 (프로젝트 루트에서):
+    python frontend/streamlit/bench_template.py
+    python frontend/streamlit/bench_template.py --prompts low_grade_prompts.json --repeat 200000
+"""
+import argparse
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 프로젝트 루트를 import 경로에 추가 (backend 공용 모듈 사용)
+sys.path.append(os.path.abspath(os.path.join(BASE_DIR, "..", "..")))
+
+from backend.core.conversation import (
+    RULE_QUESTIONS,
+    TEMPLATE_FIELDS,
+    apply_prompt_template,
+    build_fixed_questions_str,
+)
+from backend.core.prompt_compose import load_prompt_file
+from backend.core.template import compile_prompts
+
+
+def replace_template(lines, **kwargs) -> str:
+    """기준선: 템플릿 컴파일 도입 전 apply_prompt_template."""
+    text = "\n".join(lines)
+    for key, value in kwargs.items():
+        placeholder = "{{" + key + "}}"
+        text = text.replace(placeholder, value)
+    return text
+
+
+def sample_values(name: str) -> dict:
+    values = {
+        "stage_label": "S2 기억회상 단계",
+        "user_message": "슈퍼맨 색칠했어 파란색이랑 빨간색",
+        "prev_answer": "친구랑 같이 해서 좋았어",
+        "rule_question": RULE_QUESTIONS[2],
+        "fixed_questions": build_fixed_questions_str(),
+        "generated_questions": "어떤 색을 제일 먼저 칠했어? / 그 그림에서 제일 마음에 드는 부분은 어디야?",
+    }
+    return {key: values[key] for key in TEMPLATE_FIELDS[name]}
+
+
+def timed(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="str.replace vs 컴파일된 프롬프트 템플릿")
+    parser.add_argument("--prompts", default="prompts.json", help="prompts/ 폴더의 프롬프트 파일")
+    parser.add_argument("--repeat", type=int, default=100_000)
+    args = parser.parse_args()
+
+    # 조각을 펼친 템플릿 원문 (이전 형식 파일이면 그대로)
+    raw = {
+        name: text.split("\n")
+        for name, text in load_prompt_file(os.path.join(BASE_DIR, "prompts", args.prompts)).templates.items()
+    }
+
+    started = time.perf_counter()
+    compiled = compile_prompts(raw, TEMPLATE_FIELDS)
+    print(f"[COMPILE] {len(compiled)} templates in {(time.perf_counter() - started) * 1e6:.0f} us (로드 시 1번)")
+
+    print(f"\n{'template':<26} {'chars':>6} {'replace':>10} {'compiled':>10} {'lines':>10}   speedup")
+    for name in TEMPLATE_FIELDS:
+        lines, template, values = raw[name], compiled[name], sample_values(name)
+
+        # 같은 결과인지 먼저 확인
+        assert template.render(**values) == replace_template(lines, **values), name
+
+        old_s = timed(lambda: replace_template(lines, **values), args.repeat)
+        new_s = timed(lambda: template.render(**values), args.repeat)
+        lines_s = timed(lambda: apply_prompt_template(lines, **values), args.repeat)
+        print(f"{name:<26} {len(template.render(**values)):>6} "
+              f"{old_s / args.repeat * 1e6:>8.2f}us {new_s / args.repeat * 1e6:>8.2f}us "
+              f"{lines_s / args.repeat * 1e6:>8.2f}us   {old_s / new_s:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, replace
+
+import streamlit as st
+
+from backend.core.async_runner import get_async_runner
+from backend.core.client import LLMResponse, get_llm_client
+from backend.core.routing import get_model_router
+from core.session_store import current_step_id, persist_session
+
+# 비동기 생성 모드: 스크립트 스레드가 GPT 응답을 기다리며 막히지 않도록
+# 이벤트 루프 스레드에 작업을 넘기고, 다음 실행(rerun)에서 결과를 가져간다.
+ASYNC_GENERATION = os.getenv("ASYNC_GENERATION", "false").lower() == "true"
+
+# 비동기 모드에서 한 번의 스크립트 실행이 결과를 기다리는 최대 시간(초)
+ASYNC_POLL_INTERVAL = float(os.getenv("ASYNC_POLL_INTERVAL", "0.3"))
+
+# 일반 모드: GPT 호출은 작업 스레드에서 돌리고, 스크립트는 이 간격으로 스트리밍 중인 텍스트를 다시 그림
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "0.05"))
+
+# 일반 모드 GPT 호출 작업 스레드 수 (동시에 생성 중인 봇 턴 수)
+LLM_STEP_WORKERS = int(os.getenv("LLM_STEP_WORKERS", "32"))
+
+# 교실 구분 (URL ?classroom=... 이 없을 때 기본값). 스케줄러의 교실별 동시 호출 제한 단위
+DEFAULT_CLASSROOM = os.getenv("CLASSROOM_ID", "default")
+
+# 모델 라우팅 표 기본 위치 (LLM_ROUTING_PATH 로 바꿀 수 있음)
+ROUTING_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "model_routing.json")
+
+
+@st.cache_resource
+def get_llm():
+    """공용 LLM 클라이언트 (프로세스당 1번만 생성, 모든 세션이 커넥션 풀 공유)."""
+    return get_llm_client()
+
+
+@st.cache_resource
+def get_runner():
+    """공용 비동기 이벤트 루프 스레드 (프로세스당 1번만 생성)."""
+    return get_async_runner()
+
+
+@st.cache_resource
+def get_step_pool():
+    """일반 모드 GPT 호출용 작업 스레드 풀 (스크립트 실행이 중단돼도 호출은 끝까지 진행)."""
+    return ThreadPoolExecutor(max_workers=LLM_STEP_WORKERS, thread_name_prefix="llm-step")
+
+
+@st.cache_resource
+def get_router():
+    """공용 모델 라우팅 표 (프로세스당 1번만 로드)."""
+    return get_model_router(ROUTING_PATH)
+
+
+def get_route(app: str, stage, turn: str):
+    """(앱, 단계, 턴 종류/템플릿 이름) → routing.Route (model / max_tokens / temperature / slo_ms)."""
+    return get_router().resolve(app, stage, turn)
+
+
+# 헤더에 표시하는 턴 종류 (config/model_routing.json 의 "turn")
+TURN_LABELS = (("free_question", "자유 질문"), ("rule_question", "고정 질문"), ("ending", "마무리"))
+
+
+def routed_models_label(app: str, stage) -> str:
+    """
+    헤더 표시용: 현재 단계에서 턴 종류별로 라우팅된 모델 (같은 모델은 묶어서).
+    예: "gpt-4o-mini (자유 질문 · 고정 질문) / gpt-4o (마무리)"
+    """
+    by_model = {}
+    for turn, label in TURN_LABELS:
+        by_model.setdefault(get_route(app, stage, turn).model, []).append(label)
+    return " / ".join(f"{model} ({' · '.join(labels)})" for model, labels in by_model.items())
+
+
+def scheduling_context() -> dict:
+    """공정 스케줄러용 세션 / 교실 정보 (세션마다 고유 ID를 한 번 만들어 둠)."""
+    session_id = st.session_state.setdefault("llm_session_id", uuid.uuid4().hex[:12])
+    classroom = st.query_params.get("classroom") or DEFAULT_CLASSROOM
+    return {"session_id": session_id, "classroom": classroom}
+
+
+def thinking_text(eta: float = 0.0) -> str:
+    """대기 중 임시 말풍선 문구. rate limit 대기열 예상 시간이 1초 이상이면 같이 표시."""
+    if eta >= 1:
+        return f"봉봉이 생각 중… (약 {eta:.0f}초)"
+    return "봉봉이 생각 중…"
+
+
+def run_chat_completion(
+    render_html,
+    messages,
+    stage,
+    model=None,
+    stream: bool = True,
+    display=None,
+    route=None,
+    fallback=None,
+    **options,
+):
+    """
+    GPT 호출 공통 함수 (스트리밍 / 일반 / 비동기 모드).
+
+    - stream=True 이면 토큰이 도착하는 대로 말풍선(placeholder)에 부분 텍스트를 그린다.
+    - render_html: 텍스트 → 봇 말풍선 HTML 을 만드는 함수 (앱마다 말풍선 스타일이 다름)
+    - display: 받은 원문(예: 스트리밍 중인 JSON) → 말풍선에 보여줄 텍스트 변환 함수
+    - options: response_format 등 chat.completions 추가 옵션 (None 값은 제외)
+    - route: get_route() 결과. 모델 / max_tokens / temperature 를 정하고, 응답 시간을 SLO 와 비교
+    - fallback: 호출 실패(브레이커 open / 제한 시간 초과 / API 오류) 시 대신 쓸 응답을 만드는 함수
+      → FSM 이 멈추지 않고 다음 단계로 진행. 로그에는 fallback=true 로 기록됨
+    - 최종 텍스트는 호출한 쪽에서 add_message 로 딱 한 번만 저장한다.
+      (여기서 그린 임시 말풍선은 st.rerun() 이후 render_chat_messages 로 대체됨)
+    - 봇 턴마다 (세션, 단계, substep) 으로 정해지는 step ID 를 쓴다.
+      받은 응답은 화면에 그리기 전에 step_results 에 저장(세션 파일 포함)하고,
+      아이 입력 / 연결 끊김으로 실행이 중단돼 같은 턴에 다시 들어오면 GPT 를 다시 부르지 않고
+      저장된 응답(또는 아직 진행 중인 같은 호출)을 그대로 쓴다.
+
+    반환값: backend.core.client.LLMResponse (text / ttft / latency / meta())
+    """
+    options = {k: v for k, v in options.items() if v is not None}
+    display = display or (lambda text: text)
+
+    if route is not None:
+        model = route.model
+        options = {**route.options(), **options}
+    options.update(scheduling_context())
+
+    step_id = current_step_id()
+    placeholder = st.empty()
+
+    saved = st.session_state.get("step_results", {}).get(step_id)
+    if saved is not None:
+        print(f"[STEP REPLAY] {step_id} stage={stage} → 저장된 응답 사용 (GPT 재호출 없음)")
+        result = replace(LLMResponse(**saved), replayed=True)
+        placeholder.markdown(render_html(display(result.text)), unsafe_allow_html=True)
+        return result
+
+    try:
+        if ASYNC_GENERATION:
+            result = _run_async(step_id, placeholder, render_html, messages, stage, model, stream, display, options)
+        else:
+            result = _run_sync(step_id, placeholder, render_html, messages, stage, model, stream, display, options)
+    except Exception as exc:
+        # st.rerun() 은 Exception 이 아니라서 여기서 잡히지 않음
+        if fallback is None:
+            raise
+        print(f"[LLM FALLBACK] stage={stage} model={model} error={exc!r}")
+        result = LLMResponse(
+            text=fallback(),
+            model=model or "",
+            stage=stage,
+            attempts=0,
+            source="fallback",
+            error=repr(exc),
+        )
+
+    if route is not None:
+        result = replace(result, route=route.name, slo_ms=route.slo_ms)
+        if result.slo_met is False:
+            print(f"[LLM SLO] {route.name} model={route.model} latency={result.latency}s > {route.slo_ms}ms")
+
+    # 말풍선을 그리기 전에 저장 → 이후 실행이 중단돼도 이 턴은 다시 호출하지 않는다 (가장 최근 턴 1개만 보관)
+    st.session_state["step_results"] = {step_id: asdict(result)}
+    persist_session()
+    placeholder.markdown(render_html(display(result.text)), unsafe_allow_html=True)
+    return result
+
+
+class _StepJob:
+    """일반 모드 GPT 호출 1건 (작업 스레드에서 실행, 스트리밍 중 텍스트는 partial)."""
+
+    def __init__(self):
+        self.partial = ""
+        self.future = None
+
+    def on_delta(self, partial: str):
+        self.partial = partial
+
+
+def _run_sync(step_id, placeholder, render_html, messages, stage, model, stream, display, options):
+    """
+    일반 모드 실행 (스트리밍이면 말풍선에 부분 텍스트를 그리며 기다림).
+    호출은 작업 스레드에서 돌리므로, 기다리는 도중 실행이 중단(아이 입력 / 연결 끊김)되어도 호출은 계속되고
+    같은 턴에 다시 들어온 실행이 그 작업에 다시 붙는다.
+    """
+    llm = get_llm()
+    jobs = st.session_state.setdefault("llm_jobs", {})
+
+    job = jobs.get(step_id)
+    if job is None:
+        job = _StepJob()
+        if stream:
+            job.future = get_step_pool().submit(
+                llm.stream, messages, stage=stage, model=model, on_delta=job.on_delta, **options
+            )
+        else:
+            job.future = get_step_pool().submit(llm.complete, messages, stage=stage, model=model, **options)
+        jobs[step_id] = job
+    else:
+        print(f"[STEP REATTACH] {step_id} stage={stage} → 진행 중인 호출에 다시 연결")
+
+    placeholder.markdown(render_html(thinking_text(llm.limiter.eta())), unsafe_allow_html=True)
+
+    shown = ""
+    while not job.future.done():
+        time.sleep(STREAM_POLL_INTERVAL)
+        if job.partial != shown:
+            shown = job.partial
+            placeholder.markdown(render_html(display(shown) + " ▌"), unsafe_allow_html=True)
+
+    # 실패한 작업도 목록에서 빼서 다음 실행에서 새로 제출되도록 한다
+    del jobs[step_id]
+    return job.future.result()
+
+
+def _run_async(step_id, placeholder, render_html, messages, stage, model, stream, display, options):
+    """
+    비동기 모드 실행.
+    - 현재 봇 턴(step ID)에 대한 작업이 없으면 이벤트 루프에 제출한다.
+    - 짧게(ASYNC_POLL_INTERVAL) 기다려도 안 끝나면 임시 말풍선만 그리고 st.rerun()
+      → 스크립트 스레드는 바로 반납되고, 다음 실행에서 같은 작업의 결과를 확인한다.
+    - 끝났으면 결과를 돌려주고 작업 목록에서 제거한다.
+    """
+    jobs = st.session_state.setdefault("llm_jobs", {})
+
+    job = jobs.get(step_id)
+    if job is None:
+        job = get_runner().submit(messages, stage=stage, model=model, stream=stream, **options)
+        jobs[step_id] = job
+
+    if not job.wait(ASYNC_POLL_INTERVAL):
+        partial = display(job.partial)
+        text = partial + " ▌" if partial else thinking_text(job.ready_at - time.time())
+        placeholder.markdown(render_html(text), unsafe_allow_html=True)
+        st.rerun()
+
+    # 실패한 작업도 목록에서 빼서 다음 실행에서 새로 제출되도록 한다
+    del jobs[step_id]
+    return job.result()
@@ -0,0 +1,86 @@
+from typing import Dict, Optional, Tuple
+
+import streamlit as st
+
+from backend.core.question_index import (
+    QUESTION_REGENERATE,
+    QUESTION_REGENERATE_MAX_TOKENS,
+    QuestionIndex,
+    build_regenerate_messages,
+    resolve_repeat,
+    tally_repeat,
+)
+from backend.core.structured import extract_question
+from core.llm_stream import get_llm, get_route, scheduling_context
+from core.session_store import current_step_id, persist_session
+
+# 다시 생성 프롬프트에 "이미 한 질문" 으로 넣는 최근 자유 질문 수 (겹친 질문은 항상 포함)
+REGENERATE_AVOID = 8
+
+
+def get_question_index(fixed_questions: Dict[int, str]) -> QuestionIndex:
+    """
+    세션의 자유 질문 색인. 질문이 생길 때마다 add 로 늘려 가고,
+    세션 복원 등으로 generated_questions 와 개수가 어긋났을 때만 목록에서 다시 만든다.
+    """
+    generated = st.session_state.setdefault("generated_questions", [])
+    index = st.session_state.get("question_index")
+    if index is None or index.generated != len(generated):
+        index = QuestionIndex(generated, fixed=[fixed_questions[i] for i in sorted(fixed_questions)])
+        st.session_state["question_index"] = index
+    return index
+
+
+def dedupe_question(
+    question: str,
+    user_message: str,
+    app: str,
+    stage: int,
+    fixed_questions: Dict[int, str],
+    system: Optional[str] = None,
+) -> Tuple[str, Optional[dict]]:
+    """
+    공감 + 자유 질문 턴의 질문을 generated_questions 에 넣기 전에 중복 확인.
+    - 같은 질문 / 비슷한 질문이면 질문 1문장만 짧게 한 번 다시 생성, 그래도 겹치면 규칙 기반 질문으로 교체
+    - 반환: (실제로 쓸 질문, 중복 기록 또는 None) → 중복 기록은 last_llm_meta 의 question_repeat
+    - 같은 턴(step)을 다시 실행하면 저장된 결정을 그대로 쓴다 (목록에 두 번 넣거나 다시 생성하지 않음)
+    """
+    if not question:
+        return question, None
+
+    step_id = current_step_id()
+    checked = st.session_state.get("question_checks", {}).get(step_id)
+    if checked is not None:
+        return checked["question"], checked["repeat"]
+
+    index = get_question_index(fixed_questions)
+    generated = st.session_state["generated_questions"]
+
+    def regenerate() -> str:
+        match = index.match(question)
+        avoid = generated[-REGENERATE_AVOID:]
+        if match and match.question not in avoid:
+            avoid = [match.question] + avoid
+        route = get_route(app, stage, "question_regenerate")
+        result = get_llm().complete(
+            build_regenerate_messages(user_message, avoid, system or ""),
+            stage="question_regenerate",
+            model=route.model,
+            **{**route.options(), "max_tokens": QUESTION_REGENERATE_MAX_TOKENS},
+            **scheduling_context(),
+        )
+        return extract_question(result.text)
+
+    final, repeat = resolve_repeat(index, question, regenerate if QUESTION_REGENERATE else None)
+    generated.append(final)
+
+    if repeat:
+        totals = tally_repeat(st.session_state.setdefault("question_repeats", {}), repeat)
+        print(f"[QUESTION REPEAT] {repeat['kind']} score={repeat['score']} resolved={repeat['resolved']} "
+              f"{repeat['original']!r} ~ {repeat['similar_to']!r} → {final!r} caught={totals['caught']}")
+
+    # 가장 최근 턴 1개만 보관 (step_results 와 같은 방식).
+    # 목록에 넣은 질문과 함께 바로 세션 파일에 저장 → ?sid= 로 복원해 같은 턴을 다시 실행해도 두 번 넣거나 다시 생성하지 않음
+    st.session_state["question_checks"] = {step_id: {"question": final, "repeat": repeat}}
+    persist_session()
+    return final, repeat
@@ -0,0 +1,28 @@
+import streamlit as st
+
+# -------------------------------
+# 아이 턴 1번에 스크립트가 몇 번 실행되었는지 세기
+# -------------------------------
+# 턴 = 아이 입력이 들어온 실행 ~ 봇 답변이 화면에 나온 실행.
+# 한 번의 실행에서 "입력 → 봇 답변"을 모두 처리하면 1, st.rerun() 이 끼어들 때마다 +1
+# (비동기 생성 모드의 결과 대기 rerun 도 포함). chat_log 의 봇 메시지에 script_runs 로 기록된다.
+
+
+def count_script_run():
+    """main() 맨 앞에서 한 번 호출. 진행 중인 턴이 있으면 그 턴의 실행 횟수도 올린다."""
+    st.session_state["script_runs"] = st.session_state.get("script_runs", 0) + 1
+    if st.session_state.get("turn_runs") is not None:
+        st.session_state["turn_runs"] += 1
+
+
+def start_turn():
+    """아이 입력을 받은 실행에서 호출 (이 실행이 1번째)."""
+    st.session_state["turn_runs"] = 1
+
+
+def finish_turn():
+    """봇 답변이 끝났을 때 호출. 이번 턴의 실행 횟수 반환 (진행 중인 턴이 없으면 None)."""
+    runs = st.session_state.pop("turn_runs", None)
+    if runs is not None:
+        print(f"[SCRIPT RUNS] turn_runs={runs} total_runs={st.session_state.get('script_runs', 0)}")
+    return runs
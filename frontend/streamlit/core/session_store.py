@@ -0,0 +1,75 @@
+import uuid
+from datetime import datetime
+
+import streamlit as st
+
+from backend.core.storage import get_storage, is_valid_session_id
+
+# -------------------------------
+# 대화 진행 상태 저장 / 복원 (새로고침 · 연결 끊김 · 서버 재시작 대비)
+# -------------------------------
+# URL 의 ?sid=<세션 토큰> 으로 세션을 구분하고, FSM 행동이 끝날 때마다
+# (state, substep, messages, generated_questions) 를 data/sessions/<토큰>.json 에 atomic 하게 저장한다.
+# 같은 URL 로 다시 접속하면 저장된 지점부터 이어서 진행.
+# 봇 턴 도중 끊겼으면 이미 받아 둔 GPT 응답(step_results)을 다시 쓰고, 없을 때만 그 턴을 새로 생성한다.
+
+SESSION_PARAM = "sid"
+PERSIST_KEYS = (
+    "state", "substep", "messages", "generated_questions", "question_repeats", "question_checks",
+    "downloads_enabled", "step_results",
+)
+
+
+def restore_session(app_name: str) -> bool:
+    """
+    init_session() 맨 앞에서 호출. 브라우저 세션당 한 번만 URL 토큰을 확인한다.
+    저장된 같은 앱의 대화가 있으면 세션 상태에 채우고 True.
+    """
+    if "session_token" in st.session_state:
+        return False
+
+    token = st.query_params.get(SESSION_PARAM)
+    snapshot = None
+    if is_valid_session_id(token):
+        snapshot = get_storage().load_session(token)
+        if snapshot and snapshot.get("app") != app_name:
+            snapshot = None
+    else:
+        token = uuid.uuid4().hex[:16]
+        st.query_params[SESSION_PARAM] = token
+
+    st.session_state["session_token"] = token
+    st.session_state["session_app"] = app_name
+    # 공정 스케줄러도 다시 접속한 세션을 같은 세션으로 본다
+    st.session_state["llm_session_id"] = token
+
+    if not snapshot:
+        return False
+
+    for key in PERSIST_KEYS:
+        if key in snapshot:
+            st.session_state[key] = snapshot[key]
+    print(f"[SESSION RESTORE] token={token} state={snapshot.get('state')} substep={snapshot.get('substep')} "
+          f"messages={len(snapshot.get('messages', []))}")
+    return True
+
+
+def current_step_id() -> str:
+    """봇 턴 1개의 고유 ID (세션, 단계, substep). 같은 턴을 다시 실행해도 같은 값."""
+    token = st.session_state.get("session_token") or st.session_state.get("llm_session_id", "")
+    return f"{token}:S{st.session_state.get('state')}-{st.session_state.get('substep')}"
+
+
+def persist_session(app_name: str = None):
+    """FSM 행동 1개(아이 입력 기록 / 봇 답변)가 끝날 때마다 호출. 저장 실패는 대화를 막지 않는다."""
+    token = st.session_state.get("session_token")
+    if not token:
+        return
+    app_name = app_name or st.session_state.get("session_app")
+
+    snapshot = {key: st.session_state[key] for key in PERSIST_KEYS if key in st.session_state}
+    snapshot.update(app=app_name, updated_at=datetime.now().isoformat())
+    try:
+        get_storage().save_session(token, snapshot)
+    except OSError as e:
+        print(f"[SESSION SAVE FAILED] token={token} error={e!r}")
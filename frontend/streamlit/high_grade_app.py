@@ -2,11 +2,37 @@ import os
 import sys
 import json
 from datetime import datetime
-import time
 import streamlit as st
 from dotenv import load_dotenv
 import pandas as pd
-from openai import OpenAI
+
+# 프로젝트 루트를 import 경로에 추가 (backend 공용 모듈 사용)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from core.llm_stream import get_route, routed_models_label, run_chat_completion
+from core.question_guard import dedupe_question
+from core.run_stats import count_script_run, finish_turn, start_turn
+from core.session_store import persist_session, restore_session
+from backend.core.conversation import (
+    PROMPT_LAYOUT,
+    TEMPLATE_FIELDS,
+    apply_prompt_template,
+    build_fixed_questions_str,
+    build_messages,
+    fit_turn_values,
+    format_generated_questions,
+    get_scenario,
+    next_action,
+)
+from backend.core.fallback import fallback_closing, fallback_reply
+from backend.core.log_sink import get_log_sink
+from backend.core.structured import (
+    EMPATHY_TURN_FORMAT,
+    empathy_turn_display,
+    parse_empathy_turn,
+    use_structured_output,
+)
+from backend.core.prompt_registry import PromptSet, get_prompt_registry
 
 
 # Streamlit 스크롤 방지용 컴포넌트
@@ -15,11 +41,11 @@ import streamlit.components.v1 as components
 # 환경 변수 로드
 load_dotenv()
 
-# OpenAI 클라이언트
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# 스트리밍 모드 (토큰이 도착하는 대로 말풍선에 표시)
+STREAMING = os.getenv("STREAMING", "true").lower() == "true"  # 기본값 스트리밍 사용
 
-# 모델 환경 변수 읽기 추가
-MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o")  # 기본값 gpt-4o
+# 모델 라우팅 키로 쓰는 앱 이름 (config/model_routing.json 의 "app")
+APP_NAME = os.path.splitext(os.path.basename(__file__))[0]
 
 # ------------------------------
 # 프롬프트 파일 경로 (외부 JSON)
@@ -31,22 +57,11 @@ PROMPTS_PATH = os.path.join(
 )
 
 # ------------------------------
-# 고정 질문
-# ------------------------------
-RULE_QUESTIONS = {
-    1: "친구야, 오늘 어땠어?",
-    2: "오늘 활동 중에 가장 기억에 남았던 순간은 뭐였어?",
-    3: "마지막으로, 오늘 활동을 마치며 봉봉이에게 하고 싶은 말 있을까?"
-}
-
-# ------------------------------
-# 단계 라벨 (프롬프트에 넣는 사람용 라벨)
+# 대화 시나리오 (단계 / 공감 턴 수 / 고정 질문 / 템플릿) → 전이 표로 컴파일
 # ------------------------------
-STAGE_LABELS = {
-    1: "S1 활동묻기 단계",
-    2: "S2 기억회상 단계",
-    3: "S3 활동 마무리 단계",
-}
+SCENARIO = get_scenario(APP_NAME, os.path.join(os.path.dirname(__file__), "config", "scenarios.json"))
+RULE_QUESTIONS = SCENARIO.rule_questions
+STAGE_LABELS = SCENARIO.stage_labels
 
 # ------------------------------
 # 디버그용 헬퍼
@@ -62,70 +77,28 @@ def debug_block(title: str, lines: list[str]):
 # -------------------------------------------------
 # 프롬프트 유틸 함수들
 # -------------------------------------------------
-def load_prompts() -> dict:
+def load_prompts() -> PromptSet:
     """
-    prompts/prompts.json 파일을 읽어서 dict로 반환하는 유틸 함수.
+    PROMPTS_PATH 의 컴파일된 템플릿 (프로세스 공용 레지스트리, 모든 세션이 공유).
     - empathy_free_question
     - empathy_rule_question
     - empathy_ending_message
-    세 가지 키를 가진 JSON 구조를 기대한다.
-    """
-    with open(PROMPTS_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    debug_block("LOAD PROMPTS", [
-        f"PROMPTS_PATH: {PROMPTS_PATH}",
-        f"keys: {list(data.keys())}"
-    ])
-    return data
-
-
-def apply_prompt_template(lines, **kwargs) -> str:
-    """
-    prompts.json에서 가져온 문자열 리스트(lines)를 하나의 문자열로 합치고,
-    {{key}} 형태의 플레이스홀더를 kwargs로 치환한다.
+    세 가지 키를 가진 JSON 구조를 기대하고, 플레이스홀더가 TEMPLATE_FIELDS 와 다르면 TemplateError.
+    파일을 고치면 PROMPT_RELOAD_INTERVAL 초 안에 다시 컴파일되어 열려 있는 세션도 다음 턴부터 새 프롬프트를 쓴다.
+    prompts.version: 파일 내용 해시 (chat_log 의 prompt_version)
     """
-    text = "\n".join(lines)
-    for key, value in kwargs.items():
-        placeholder = "{{" + key + "}}"
-        text = text.replace(placeholder, value)
-    return text
+    return get_prompt_registry().get(PROMPTS_PATH, TEMPLATE_FIELDS)
 
 
-def extract_question_from_reply(reply: str) -> str:
-    """
-    GPT 응답(reply)에서 '질문 문장'을 단순하게 추출하기 위한 보조 함수.
-    - 마지막 줄부터 위로 올라가며,
-      물음표(?)가 포함된 첫 번째 비어있지 않은 줄을 질문으로 본다.
-    - 질문이 하나도 없으면 빈 문자열("")을 반환.
-    """
-    lines = reply.splitlines()
-    for line in reversed(lines):
-        line = line.strip()
-        if not line:
-            continue
-        if "?" in line:
-            return line
-    return ""
-
-
-def build_fixed_questions_str() -> str:
-    """
-    RULE_QUESTIONS 전체를 사람이 읽기 좋은 한 줄 문자열로 만들어준다.
-    예: "친구야, 오늘 어땠어? / 오늘 활동 중에 가장 기억에 남았던 순간은 뭐였어? / ..."
-    """
-    return " / ".join(RULE_QUESTIONS[i] for i in sorted(RULE_QUESTIONS.keys()))
-
-
-def build_generated_questions_str() -> str:
+def build_generated_questions_str(generated=None) -> str:
     """
     지금까지 생성된 자유 질문 목록을 문자열로 변환.
+    - generated 를 넘기지 않으면 세션의 generated_questions 사용.
     - 아무것도 없으면 '현재까지 생성된 자유 질문 없음'으로 반환.
     """
-    generated = st.session_state.get("generated_questions", [])
-    if not generated:
-        return "현재까지 생성된 자유 질문 없음"
-    return " / ".join(generated)
+    if generated is None:
+        generated = st.session_state.get("generated_questions", [])
+    return format_generated_questions(generated)
 
 
 # ------------------------------
@@ -142,21 +115,22 @@ def generate_empathy_free_question(user_message: str, stage: int, turn: int) ->
     stage_label = STAGE_LABELS.get(stage, "대화 단계")
 
     # 프롬프트 로드 (세션 캐싱)
-    prompts = st.session_state["prompts"]
+    prompts = load_prompts()
     lines = prompts["empathy_free_question"]
 
     # 고정 질문/자유 질문 목록 문자열 생성
-    fixed_questions_str = build_fixed_questions_str()
-    generated_questions_str = build_generated_questions_str()
+    fixed_questions_str = build_fixed_questions_str(RULE_QUESTIONS)
 
-    # 템플릿 채우기
-    prompt_text = apply_prompt_template(
-        lines,
+    # 템플릿 채우기 (자유 질문 목록은 토큰 예산에 맞춰 오래된 질문부터 생략)
+    values, budget = fit_turn_values(
+        "empathy_free_question",
+        st.session_state.get("generated_questions", []),
         stage_label=stage_label,
         user_message=user_message,
         fixed_questions=fixed_questions_str,
-        generated_questions=generated_questions_str,
     )
+    generated_questions_str = values["generated_questions"]
+    prompt_text = apply_prompt_template(lines, **values)
 
     current_state = st.session_state.get("state")
     current_sub = st.session_state.get("substep")
@@ -181,46 +155,60 @@ def generate_empathy_free_question(user_message: str, stage: int, turn: int) ->
 
     # GPT 호출
 
-    # GPT 호출 + 응답시간 계산
-    start = time.time()
-
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "너는 어린이를 따뜻하게 도와주는 상담 챗봇 '봉봉'이야. "
-                    "친근한 반말로 말하고, 아이의 감정을 존중하면서 부드럽게 반응해."
-                ),
-            },
-            {"role": "user", "content": prompt_text},
-        ],
+    # GPT 호출 + 응답시간 계산 (스트리밍 모드면 말풍선에 바로 표시)
+    # 구조화 출력(JSON)을 지원하는 모델이면 {empathy, question} 으로 받아서 재파싱 없이 사용
+    route = get_route(APP_NAME, stage, "empathy_free_question")
+    structured = use_structured_output(route.model)
+    result = run_chat_completion(
+        bot_bubble_html,
+        stage="empathy_free_question",
+        stream=STREAMING,
+        fallback=lambda: fallback_reply(exclude=st.session_state.get("generated_questions", [])),
+        route=route,
+        messages=build_messages(
+            "empathy_free_question",
+            prompt_text,
+            structured=structured,
+            system=prompts.system.get("empathy_free_question"),
+        ),
+        response_format=EMPATHY_TURN_FORMAT if structured else None,
+        display=empathy_turn_display if structured else None,
     )
-    elapsed = round(time.time() - start, 2)  # ⏱️ 완료
-    reply = response.choices[0].message.content
-    reply_with_time = f"{reply}\n\n🕒 {elapsed}s"  # UI 말풍선 표시
-
-
-    # 생성된 응답에서 질문 문장을 추출해 자유 질문 목록에 누적
-    question_line = extract_question_from_reply(reply)
-    already_exists = False
+    elapsed = result.latency  # ⏱️ 완료
+    ttft = result.ttft  # ⏱️ 첫 토큰 도착
+    parsed = parse_empathy_turn(result.text)
+    reply = parsed["reply"]
+    st.session_state["last_llm_meta"] = {
+        **result.meta(),
+        "prompt_version": prompts.version,
+        "prompt_layout": PROMPT_LAYOUT,
+        "prompt_budget": budget.meta(),
+    }
 
-    if question_line:
-        if "generated_questions" not in st.session_state:
-            st.session_state["generated_questions"] = []
-        if question_line in st.session_state["generated_questions"]:
-            already_exists = True
-        st.session_state["generated_questions"].append(question_line)
+    # 응답의 질문 문장(JSON question 필드 / fallback 파서)을 자유 질문 목록에 누적
+    # 이미 한 질문과 같거나 비슷하면 한 번 다시 생성(안 되면 규칙 기반 질문)해서 답변의 질문도 바꿈
+    question_line, repeat = dedupe_question(
+        parsed["question"],
+        user_message,
+        APP_NAME,
+        stage,
+        RULE_QUESTIONS,
+        system=prompts.system.get("empathy_free_question"),
+    )
+    if repeat:
+        reply = reply.replace(parsed["question"], question_line)
+        st.session_state["last_llm_meta"]["question_repeat"] = repeat
+    reply_with_time = f"{reply}\n\n🕒 {elapsed}s (첫 토큰 {ttft}s)"  # UI 말풍선 표시 (바꾼 질문 포함)
 
     debug_block("GPT FREE QUESTION RESULT", [
-        f"[⏱️ RESPONSE TIME] {elapsed}s",
+        f"[⏱️ RESPONSE TIME] {elapsed}s (TTFT {ttft}s)",
         "---------------- GPT RAW RESPONSE ----------------",
-        reply,
+        result.text,
         "",
         "-------------- EXTRACTED QUESTION -----------------",
+        f"STRUCTURED: {parsed['structured']}",
         f"EXTRACTED: {repr(question_line)}",
-        f"ALREADY_EXISTS: {already_exists}",
+        f"REPEAT: {repeat}",
         "",
         "----------- UPDATED GENERATED_QUESTIONS ----------",
         build_generated_questions_str()
@@ -238,20 +226,22 @@ def generate_empathy_rule_question(prev_answer: str, stage: int, rule_question:
     """
     stage_label = STAGE_LABELS.get(stage, "다음 단계")
 
-    prompts = st.session_state["prompts"]
+    prompts = load_prompts()
     lines = prompts["empathy_rule_question"]
 
-    fixed_questions_str = build_fixed_questions_str()
-    generated_questions_str = build_generated_questions_str()
+    fixed_questions_str = build_fixed_questions_str(RULE_QUESTIONS)
 
-    prompt_text = apply_prompt_template(
-        lines,
+    # 템플릿 채우기 (자유 질문 목록은 토큰 예산에 맞춰 오래된 질문부터 생략)
+    values, budget = fit_turn_values(
+        "empathy_rule_question",
+        st.session_state.get("generated_questions", []),
         stage_label=stage_label,
         prev_answer=prev_answer,
         rule_question=rule_question,
         fixed_questions=fixed_questions_str,
-        generated_questions=generated_questions_str,
     )
+    generated_questions_str = values["generated_questions"]
+    prompt_text = apply_prompt_template(lines, **values)
 
     current_state = st.session_state.get("state")
     current_sub = st.session_state.get("substep")
@@ -277,56 +267,69 @@ def generate_empathy_rule_question(prev_answer: str, stage: int, rule_question:
     ])
 
 
-    # GPT 호출 + 응답시간 계산
-    start = time.time()
-
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "너는 어린이를 따뜻하게 도와주는 상담 챗봇 '봉봉'이야. "
-                    "친근한 반말로 말하고, 아이의 말을 먼저 공감해 준 뒤, "
-                    "이번 턴에서 사용할 고정 질문을 자연스럽게 한 번만 사용해야 해."
-                ),
-            },
-            {"role": "user", "content": prompt_text},
-        ],
+    # GPT 호출 + 응답시간 계산 (스트리밍 모드면 말풍선에 바로 표시)
+    # 구조화 출력(JSON)을 지원하는 모델이면 {empathy, question} 으로 받아서 재파싱 없이 사용
+    route = get_route(APP_NAME, stage, "empathy_rule_question")
+    structured = use_structured_output(route.model)
+    result = run_chat_completion(
+        bot_bubble_html,
+        stage="empathy_rule_question",
+        stream=STREAMING,
+        fallback=lambda: fallback_reply(rule_question),
+        route=route,
+        messages=build_messages(
+            "empathy_rule_question",
+            prompt_text,
+            structured=structured,
+            system=prompts.system.get("empathy_rule_question"),
+        ),
+        response_format=EMPATHY_TURN_FORMAT if structured else None,
+        display=empathy_turn_display if structured else None,
     )
 
-    elapsed = round(time.time() - start, 2)  # ⏱️ 완료
-    reply = response.choices[0].message.content
-    reply_with_time = f"{reply}\n\n🕒 {elapsed}s"  # UI 말풍선 표시
+    elapsed = result.latency  # ⏱️ 완료
+    ttft = result.ttft  # ⏱️ 첫 토큰 도착
+    parsed = parse_empathy_turn(result.text)
+    reply = parsed["reply"]
+    st.session_state["last_llm_meta"] = {
+        **result.meta(),
+        "prompt_version": prompts.version,
+        "prompt_layout": PROMPT_LAYOUT,
+        "prompt_budget": budget.meta(),
+    }
+    reply_with_time = f"{reply}\n\n🕒 {elapsed}s (첫 토큰 {ttft}s)"  # UI 말풍선 표시
 
     debug_block("GPT RULE QUESTION RESULT", [
-        f"[⏱️ RESPONSE TIME] {elapsed}s",
+        f"[⏱️ RESPONSE TIME] {elapsed}s (TTFT {ttft}s)",
         "---------------- GPT RAW RESPONSE ----------------",
-        reply
+        result.text,
+        f"STRUCTURED: {parsed['structured']}",
     ])
 
     return reply_with_time
 
 
 
-def generate_empathy_ending_message(user_message: str) -> str:
+def generate_empathy_ending_message(user_message: str, stage: int = 3) -> str:
     """
     S3 마지막 GPT 턴 — 공감 + 마무리 메시지 생성.
     - 질문 없이 끝나야 하며, 마지막 문장은 반드시 '안녕'으로 끝나야 함.
     - prompts.json의 empathy_ending_message 템플릿 사용.
     """
-    prompts = st.session_state["prompts"]
+    prompts = load_prompts()
     lines = prompts["empathy_ending_message"]
 
-    fixed_questions_str = build_fixed_questions_str()
-    generated_questions_str = build_generated_questions_str()
+    fixed_questions_str = build_fixed_questions_str(RULE_QUESTIONS)
 
-    prompt_text = apply_prompt_template(
-        lines,
+    # 템플릿 채우기 (자유 질문 목록은 토큰 예산에 맞춰 오래된 질문부터 생략)
+    values, budget = fit_turn_values(
+        "empathy_ending_message",
+        st.session_state.get("generated_questions", []),
         user_message=user_message,
         fixed_questions=fixed_questions_str,
-        generated_questions=generated_questions_str,
     )
+    generated_questions_str = values["generated_questions"]
+    prompt_text = apply_prompt_template(lines, **values)
 
     current_state = st.session_state.get("state")
     current_sub = st.session_state.get("substep")
@@ -347,29 +350,33 @@ def generate_empathy_ending_message(user_message: str) -> str:
         prompt_text
     ])
 
-    # GPT 호출 + 응답시간 계산
-    start = time.time()
-
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "너는 오늘 활동을 마무리하는 마지막 인사를 하는 상담 챗봇 '봉봉'이야. "
-                    "절대 질문을 하지 말고, 마지막 문장은 반드시 '안녕'으로 끝내야 해."
-                ),
-            },
-            {"role": "user", "content": prompt_text},
-        ],
+    # GPT 호출 + 응답시간 계산 (스트리밍 모드면 말풍선에 바로 표시)
+    result = run_chat_completion(
+        bot_bubble_html,
+        stage="empathy_ending_message",
+        stream=STREAMING,
+        fallback=fallback_closing,
+        route=get_route(APP_NAME, stage, "empathy_ending_message"),
+        messages=build_messages(
+            "empathy_ending_message",
+            prompt_text,
+            system=prompts.system.get("empathy_ending_message"),
+        ),
     )
 
-    elapsed = round(time.time() - start, 2)  # ⏱️ 완료
-    reply = response.choices[0].message.content
-    reply_with_time = f"{reply}\n\n🕒 {elapsed}s"  # UI 말풍선 표시
+    elapsed = result.latency  # ⏱️ 완료
+    ttft = result.ttft  # ⏱️ 첫 토큰 도착
+    reply = result.text
+    st.session_state["last_llm_meta"] = {
+        **result.meta(),
+        "prompt_version": prompts.version,
+        "prompt_layout": PROMPT_LAYOUT,
+        "prompt_budget": budget.meta(),
+    }
+    reply_with_time = f"{reply}\n\n🕒 {elapsed}s (첫 토큰 {ttft}s)"  # UI 말풍선 표시
 
     debug_block("GPT ENDING MESSAGE RESULT", [
-        f"[⏱️ RESPONSE TIME] {elapsed}s",
+        f"[⏱️ RESPONSE TIME] {elapsed}s (TTFT {ttft}s)",
         "---------------- GPT RAW RESPONSE ----------------",
         reply
     ])
@@ -382,6 +389,8 @@ def generate_empathy_ending_message(user_message: str) -> str:
 # 세션 초기화
 # -------------------------------------------------
 def init_session():
+    # URL 세션 토큰(?sid=)으로 저장된 대화가 있으면 이어서 진행 (새로고침 / 재접속 / 서버 재시작)
+    restored = restore_session(APP_NAME)
     first_init = "messages" not in st.session_state
 
     if "messages" not in st.session_state:
@@ -400,24 +409,21 @@ def init_session():
     if "generated_questions" not in st.session_state:
         st.session_state["generated_questions"] = []
 
-    # ⭐ prompts.json 파일을 최초 1번만 읽어 캐싱
-    if "prompts" not in st.session_state:
-        st.session_state["prompts"] = load_prompts()
-
     debug_block("INIT SESSION", [
-        f"FIRST_INIT: {first_init}",
+        f"FIRST_INIT: {first_init} / RESTORED: {restored}",
+        f"session_token: {st.session_state['session_token']}",
         f"state: {st.session_state['state']}",
         f"substep: {st.session_state['substep']}",
         f"downloads_enabled: {st.session_state['downloads_enabled']}",
         f"generated_questions: {st.session_state['generated_questions']}",
-        f"prompts_loaded_keys: {list(st.session_state['prompts'].keys())}"
+        f"prompt_version: {load_prompts().version}"
     ])
 
 
 # -------------------------------------------------
 # 턴 단위 파일 저장 (실시간 append) - 데모 1에서 가져옴
 # -------------------------------------------------
-def append_turn_to_file(role, text):
+def append_turn_to_file(role, text, meta=None):
     current_index = len(st.session_state["messages"]) - 1
     turn_number = (current_index // 2) + 1
     
@@ -428,24 +434,28 @@ def append_turn_to_file(role, text):
         "text": text,
         "turn": turn_number
     }
-    
-    # 저장 경로 설정
-    log_dir = os.path.join(os.path.dirname(__file__), "data/logs")  # 실제 환경에 맞게 경로 조정
-    os.makedirs(log_dir, exist_ok=True)
 
-    log_path = os.path.join(log_dir, "chat_log.jsonl")
+    # 이 턴에 쓰인 프롬프트 버전 (봇 턴은 생성 시점 버전이 meta 에 있음)
+    log["prompt_version"] = load_prompts().version
 
-    # JSONL 형식 저장
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(log, ensure_ascii=False) + "\n")
+    # GPT 응답 메타 정보 (첫 토큰 시간 / 전체 응답 시간 등)
+    if meta:
+        log.update(meta)
+    
+    # 저장 경로 설정
+    log_path = os.path.join(os.path.dirname(__file__), "data/logs", "chat_log.jsonl")  # 실제 환경에 맞게 경로 조정
 
-    print(f"[FILE_APPEND] role={role}, turn={turn_number}, path={log_path}")
+    # JSONL 형식 저장: 백그라운드 기록기 큐에 넣기만 하고 바로 돌아옴 (봇 메시지 = 턴 끝, LOG_FLUSH 정책으로 flush)
+    get_log_sink(log_path).write(log, end_of_turn=(role == "bot"))
 
 
 # -------------------------------------------------
 # 메시지 추가 (로그 저장 통합)
 # -------------------------------------------------
 def add_message(role: str, text: str):
+    # 직전 GPT 호출의 메타 정보는 봇 메시지 로그에 한 번만 붙인다
+    meta = st.session_state.pop("last_llm_meta", None) if role == "bot" else None
+
     st.session_state["messages"].append({
         "role": role,
         "message": text,
@@ -463,7 +473,7 @@ def add_message(role: str, text: str):
     ])
     
     # 턴 단위 파일 실시간 저장
-    append_turn_to_file(role, text)
+    append_turn_to_file(role, text, meta)
 
 
 # -------------------------------------------------
@@ -471,32 +481,53 @@ def add_message(role: str, text: str):
 # -------------------------------------------------
 def render_chat_messages():
     for msg in st.session_state["messages"]:
-        if msg["role"] == "bot":
-            st.markdown(f"""
-            <div style="text-align:left;">
-                <div style="
-                    display:inline-block; background:#f1f0f0;
-                    padding:12px 15px; border-radius:12px;
-                    margin:5px 0; max-width:70%;
-                    font-size:16px;
-                    color:#000000;">
-                    🧸 <b>봉봉</b><br>{msg['message']}
-                </div>
+        render_message(msg)
+
+
+def render_message(msg: dict):
+    """말풍선 1개 (대화 기록 렌더링 / 같은 실행에서 바로 그리는 새 메시지 공용)."""
+    if msg["role"] == "bot":
+        st.markdown(f"""
+        <div style="text-align:left;">
+            <div style="
+                display:inline-block; background:#f1f0f0;
+                padding:12px 15px; border-radius:12px;
+                margin:5px 0; max-width:70%;
+                font-size:16px;
+                color:#000000;">
+                🧸 <b>봉봉</b><br>{msg['message']}
             </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div style="text-align:right;">
-                <div style="
-                    display:inline-block; background:#d1e7ff;
-                    padding:12px 15px; border-radius:12px;
-                    margin:5px 0; max-width:70%;
-                    font-size:16px;
-                    color:#000000;">
-                    🌟 <b>나</b><br>{msg['message']}
-                </div>
+        </div>
+        """, unsafe_allow_html=True)
+    else:
+        st.markdown(f"""
+        <div style="text-align:right;">
+            <div style="
+                display:inline-block; background:#d1e7ff;
+                padding:12px 15px; border-radius:12px;
+                margin:5px 0; max-width:70%;
+                font-size:16px;
+                color:#000000;">
+                🌟 <b>나</b><br>{msg['message']}
             </div>
-            """, unsafe_allow_html=True)
+        </div>
+        """, unsafe_allow_html=True)
+
+
+def bot_bubble_html(text: str) -> str:
+    """스트리밍 중인 봇 말풍선 HTML (render_chat_messages 의 봇 말풍선과 동일한 스타일)."""
+    return f"""
+    <div style="text-align:left;">
+        <div style="
+            display:inline-block; background:#f1f0f0;
+            padding:12px 15px; border-radius:12px;
+            margin:5px 0; max-width:70%;
+            font-size:16px;
+            color:#000000;">
+            🧸 <b>봉봉</b><br>{text}
+        </div>
+    </div>
+    """
 
 
 # -------------------------------------------------
@@ -607,6 +638,11 @@ def process_flow(user_input=None):
     process_flow(user_input)
 
     챗봇의 전체 대화 단계를 관리하는 Finite State Machine(FSM).
+    전이 규칙은 backend/core/conversation.py 의 next_action() 이 정하고,
+    여기서는 그 행동을 세션 상태 / 화면에 반영한다.
+    - 한 번의 실행에서 "아이 입력 → 봇 답변"까지 처리한다 (턴마다 st.rerun() 하지 않음).
+      아이 말풍선은 바로 그리고, 봇 답변은 그 아래에서 생성해서 그대로 둔다.
+    - 상태는 행동마다 바로 저장하므로, 실행이 중간에 끊겨도 다음 실행에서 남은 봇 턴을 이어서 처리한다.
     """
 
     debug_block("PROCESS FLOW - ENTER", [
@@ -614,187 +650,85 @@ def process_flow(user_input=None):
         f"CURRENT state: {st.session_state.get('state')}",
         f"CURRENT substep: {st.session_state.get('substep')}"
     ])
-    
-    # 🔥 0. 대화 종료 후 입력/자동진행 완전 차단
-    if st.session_state["state"] == 3 and st.session_state["substep"] == 6:
-        debug_block("PROCESS FLOW - END STATE", [
-            "state=3 & substep=6 → 종료 상태, 추가 처리 없음"
-        ])
-        return
-
-    state = st.session_state["state"]
-    sub = st.session_state["substep"]
 
-    # GPT 답변 중(sub=1,3,5)에 들어온 유저 입력은 무시
-    if user_input and sub not in [2, 4, 6]:
-        debug_block("PROCESS FLOW - IGNORE USER INPUT", [
-            f"sub={sub} (GPT 자동 발화 턴) 이므로, user_input 무시"
-        ])
-        return
-
-    # -------------------------------------------------
-    # 1. 유저 입력 처리 (sub 2, 4, 6)
-    # -------------------------------------------------
-    if user_input:
-        debug_block("PROCESS FLOW - USER INPUT HANDLING", [
-            f"state={state}, substep={sub}",
-            f"user_input: {user_input}"
-        ])
-
-        add_message("user", user_input)
+    while True:
+        state = st.session_state["state"]
+        sub = st.session_state["substep"]
+
+        action = next_action(
+            state,
+            sub,
+            st.session_state["messages"],
+            st.session_state.get("generated_questions", []),
+            user_input,
+            SCENARIO,
+        )
 
-        if sub in [2, 4]:
-            st.session_state["substep"] += 1
-            debug_block("PROCESS FLOW - MOVE TO NEXT GPT TURN", [
-                f"NEXT substep: {st.session_state['substep']}"
+        # 🔥 0. 대화 종료 후 입력/자동진행 완전 차단 / 아이 입력 대기
+        if action.kind in ("end", "wait"):
+            debug_block(f"PROCESS FLOW - {action.kind.upper()}", [
+                f"state={state}, substep={sub} → 추가 처리 없음"
             ])
-            st.rerun()
+            return
 
-        elif sub == 6:
-            if state < 3:
-                st.session_state["state"] += 1
-                st.session_state["substep"] = 1
-                debug_block("PROCESS FLOW - MOVE TO NEXT STATE", [
-                    f"NEXT state: {st.session_state['state']}",
-                    f"RESET substep: {st.session_state['substep']}"
-                ])
-                st.rerun()
-            else:
-                debug_block("PROCESS FLOW - FINAL USER INPUT AT END", [
-                    "state=3 & substep=6 에서 user_input 처리 후 종료"
-                ])
-                return
-
-        return  # user_input 처리 종료
-
-    # -------------------------------------------------
-    # 2. GPT/RULE 자동 발화 처리 (user_input == None일 때)
-    # -------------------------------------------------
-    
-    # S1 활동묻기
-    if state == 1:
-        if sub == 1:  # S1-1: 룰베이스 고정 질문 (첫 로딩 시점)
-            debug_block("FSM AUTO BOT - S1 SUB1", [
-                "RULE_QUESTION[1] 발화"
-            ])
-            add_message("bot", RULE_QUESTIONS[1])
-            st.session_state["substep"] = 2
-            debug_block("FSM TRANSITION", [
-                "state=1 유지, substep 1 → 2"
-            ])
-            st.rerun()
-        
-        if sub == 3:  # S1-3: GPT 공감 1턴
-            last = st.session_state["messages"][-1]["message"]
-            debug_block("FSM AUTO BOT - S1 SUB3", [
-                f"LAST USER MSG: {last}"
-            ])
-            bot_msg = generate_empathy_free_question(last, 1, 1)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 4
-            debug_block("FSM TRANSITION", [
-                "state=1 유지, substep 3 → 4"
+        # GPT 답변 중(sub=1,3,5)에 들어온 유저 입력은 무시하고 남은 봇 턴 진행
+        if action.kind == "ignore":
+            debug_block("PROCESS FLOW - IGNORE USER INPUT", [
+                f"sub={sub} (GPT 자동 발화 턴) 이므로, user_input 무시"
             ])
-            st.rerun()
-        
-        if sub == 5:  # S1-5: GPT 공감 2턴
-            last = st.session_state["messages"][-1]["message"]
-            debug_block("FSM AUTO BOT - S1 SUB5", [
-                f"LAST USER MSG: {last}"
-            ])
-            bot_msg = generate_empathy_free_question(last, 1, 2)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 6
-            debug_block("FSM TRANSITION", [
-                "state=1 유지, substep 5 → 6"
-            ])
-            st.rerun()
+            user_input = None
+            continue
 
-    # S2 기억회상
-    elif state == 2:
-        if sub == 1:  # S2-1: GPT 공감 + 고정 질문 (S1 종료 후)
-            prev_answer = st.session_state["messages"][-1]["message"]
-            fixed = RULE_QUESTIONS[2]
-            debug_block("FSM AUTO BOT - S2 SUB1", [
-                f"PREV_ANSWER: {prev_answer}",
-                f"FIXED_QUESTION: {fixed}"
-            ])
-            bot_msg = generate_empathy_rule_question(prev_answer, 2, fixed)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 2
-            debug_block("FSM TRANSITION", [
-                "state=2 유지, substep 1 → 2"
-            ])
-            st.rerun()
-            
-        if sub == 3:  # S2-3: GPT 공감 1턴
-            last = st.session_state["messages"][-1]["message"]
-            debug_block("FSM AUTO BOT - S2 SUB3", [
-                f"LAST USER MSG: {last}"
-            ])
-            bot_msg = generate_empathy_free_question(last, 2, 1)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 4
-            debug_block("FSM TRANSITION", [
-                "state=2 유지, substep 3 → 4"
-            ])
-            st.rerun()
-            
-        if sub == 5:  # S2-5: GPT 공감 2턴
-            last = st.session_state["messages"][-1]["message"]
-            debug_block("FSM AUTO BOT - S2 SUB5", [
-                f"LAST USER MSG: {last}"
-            ])
-            bot_msg = generate_empathy_free_question(last, 2, 2)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 6
-            debug_block("FSM TRANSITION", [
-                "state=2 유지, substep 5 → 6"
+        # -------------------------------------------------
+        # 1. 유저 입력 처리 (sub 2, 4, 6) → 같은 실행에서 봇 턴으로
+        # -------------------------------------------------
+        if action.kind == "user":
+            slot = st.empty()
+            add_message("user", user_input)
+            start_turn()
+            user_input = None
+
+        # -------------------------------------------------
+        # 2. GPT/RULE 자동 발화 처리
+        # -------------------------------------------------
+        else:
+            debug_block(f"FSM AUTO BOT - S{state} SUB{sub}", [
+                f"ACTION: {action.kind} / TEMPLATE: {action.template}",
+                f"LAST USER MSG: {action.user_message}",
+                f"FIXED_QUESTION: {action.rule_question or action.text}"
             ])
-            st.rerun()
 
-    # S3 마무리
-    elif state == 3:
-        if sub == 1:  # S3-1: GPT 공감 + 고정 질문 (S2 종료 후)
-            prev_answer = st.session_state["messages"][-1]["message"]
-            fixed = RULE_QUESTIONS[3]
-            debug_block("FSM AUTO BOT - S3 SUB1", [
-                f"PREV_ANSWER: {prev_answer}",
-                f"FIXED_QUESTION: {fixed}"
-            ])
-            bot_msg = generate_empathy_rule_question(prev_answer, 3, fixed)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 2
-            debug_block("FSM TRANSITION", [
-                "state=3 유지, substep 1 → 2"
-            ])
-            st.rerun()
-            
-        if sub == 3:  # S3-3: GPT 공감 1턴
-            last = st.session_state["messages"][-1]["message"]
-            debug_block("FSM AUTO BOT - S3 SUB3", [
-                f"LAST USER MSG: {last}"
-            ])
-            bot_msg = generate_empathy_free_question(last, 3, 1)
-            add_message("bot", bot_msg)
-            st.session_state["substep"] = 4
-            debug_block("FSM TRANSITION", [
-                "state=3 유지, substep 3 → 4"
-            ])
-            st.rerun()
-            
-        if sub == 5:  # S3-5: GPT 공감 2턴 (마무리 발화)
-            last = st.session_state["messages"][-1]["message"]
-            debug_block("FSM AUTO BOT - S3 SUB5 (ENDING)", [
-                f"LAST USER MSG: {last}"
-            ])
-            bot_msg = generate_empathy_ending_message(last)
+            # 생성 중 말풍선(스트리밍)을 담을 자리 → 끝나면 최종 말풍선으로 바꿔 그림
+            slot = st.empty()
+            with slot.container():
+                if action.kind == "rule":
+                    bot_msg = action.text
+                elif action.turn_kind == "rule_question":
+                    bot_msg = generate_empathy_rule_question(action.user_message, action.stage, action.rule_question)
+                elif action.turn_kind == "ending":
+                    bot_msg = generate_empathy_ending_message(action.user_message, action.stage)
+                else:
+                    bot_msg = generate_empathy_free_question(action.user_message, action.stage, action.turn)
+
+            # 봇 답변으로 턴이 끝나면(다음이 아이 입력 차례) 이번 턴에 든 스크립트 실행 횟수를 로그에 남김
+            runs = finish_turn()
+            if runs is not None:
+                st.session_state.setdefault("last_llm_meta", {})["script_runs"] = runs
+
             add_message("bot", bot_msg)
-            st.session_state["substep"] = 6
-            debug_block("FSM TRANSITION", [
-                "state=3 유지, substep 5 → 6 (END STATE CANDIDATE)"
-            ])
-            st.rerun()
+
+        # 기록 → 상태 전이 → 저장을 말풍선 그리기보다 먼저 끝낸다.
+        # 그리는 도중 실행이 중단돼도 같은 턴에 다시 들어와 메시지를 두 번 기록하지 않음
+        st.session_state["state"] = action.state
+        st.session_state["substep"] = action.substep
+        # 행동마다 저장 → 봇 답변 생성 중에 끊겨도 다음 접속에서 이 지점부터 이어감
+        persist_session(APP_NAME)
+        debug_block("FSM TRANSITION", [
+            f"state {state} → {action.state}, substep {sub} → {action.substep}"
+        ])
+
+        with slot.container():
+            render_message(st.session_state["messages"][-1])
 
 
 # -------------------------------------------------
@@ -802,6 +736,7 @@ def process_flow(user_input=None):
 # -------------------------------------------------
 def main():
     st.set_page_config(layout="centered", page_title="Chatbot Demo – Step 4")
+    count_script_run()
 
     st.markdown("""
         <style>
@@ -825,9 +760,10 @@ def main():
         </div>
     """, unsafe_allow_html=True)
 
-    # 모델명 표기
+    # 모델명 표기 (턴 종류별 라우팅 결과, 실제 호출 모델은 chat_log 의 model)
     st.markdown(
-        f"<div style='text-align:right; color:#888; font-size:14px;'>🔮 model: {MODEL_NAME}</div>",
+        f"<div style='text-align:right; color:#888; font-size:14px;'>🔮 model: "
+        f"{routed_models_label(APP_NAME, st.session_state.get('state', 1))}</div>",
         unsafe_allow_html=True
     )
 
@@ -840,12 +776,8 @@ def main():
     sub = st.session_state["substep"]
     downloads_enabled = st.session_state.get("downloads_enabled", False)
 
-    # --- 입력 가능 substep 정의: 유저 입력 턴만 가능 ---
-    can_user_input = (sub in [2, 4, 6])
-
-    # --- S3 종료(sub=6)면 입력창 숨김 ---
-    if state == 3 and sub == 6:
-        can_user_input = False
+    # --- 입력 가능 substep 정의: 유저 입력 턴만 가능 (대화 종료 후에는 입력창 숨김) ---
+    can_user_input = SCENARIO.accepts_input(state, sub)
 
     if can_user_input:
         user_input = st.chat_input("봉봉에게 마음을 이야기해줘 😊")
@@ -853,14 +785,18 @@ def main():
         user_input = None
 
     process_flow(user_input)
+
+    # 입력창 표시 여부가 바뀌었을 때만(첫 고정 질문 직후 / 마무리 인사 직후) 한 번 다시 그림
+    if can_user_input != SCENARIO.accepts_input(st.session_state["state"], st.session_state["substep"]):
+        st.rerun()
     
-    # 4. 저장 영역 (S3-5 → substep=6 이후 처리)
+    # 4. 저장 영역 (마무리 인사 후 대화 종료 상태에서 처리)
     state = st.session_state["state"]
     sub = st.session_state["substep"]
     downloads_enabled = st.session_state.get("downloads_enabled", False)
 
     # (1) 아직 다운로드 버튼 누르기 전 → 중앙에 "대화 저장" 버튼만 표시
-    if state == 3 and sub == 6 and not downloads_enabled:
+    if SCENARIO.is_finished(state, sub) and not downloads_enabled:
 
         st.markdown("<div style='height:25px;'></div>", unsafe_allow_html=True)
 
@@ -870,6 +806,7 @@ def main():
 
         if save_click:
             st.session_state["downloads_enabled"] = True
+            persist_session(APP_NAME)
             debug_block("DOWNLOAD ENABLED", [
                 "downloads_enabled set to True"
             ])
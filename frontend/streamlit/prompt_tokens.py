@@ -0,0 +1,84 @@
+"""
+조립된 프롬프트 템플릿별 입력 토큰 수 보고 (학년별 프롬프트 파일마다)
+
+- system : 템플릿의 system 메시지 (파일에 없으면 conversation.SYSTEM_MESSAGES)
+- user   : 값을 채우기 전 user 메시지 (플레이스홀더 제외한 고정 부분)
+- 합계    : 매 턴 보내는 고정 입력 토큰 (여기에 아이 답변 / 질문 목록 값이 더해짐)
+- 중복제거 : system 또는 앞부분과 겹쳐서 조립할 때 지운 규칙 줄 수
+
+토큰 수는 tiktoken 이 설치돼 있으면 모델 토크나이저로, 없으면 rate limit 예약과 같은 추정(글자 2개당 1토큰)으로 센다.
+
+사용법 (프로젝트 루트에서):
+    python frontend/streamlit/prompt_tokens.py
+    python frontend/streamlit/prompt_tokens.py --baseline old_prompts.json --show-removed
+"""
+import argparse
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROMPTS_DIR = os.path.join(BASE_DIR, "prompts")
+
+# 프로젝트 루트를 import 경로에 추가 (backend 공용 모듈 사용)
+sys.path.append(os.path.abspath(os.path.join(BASE_DIR, "..", "..")))
+
+from backend.core.client import DEFAULT_MODEL
+from backend.core.conversation import SYSTEM_MESSAGES
+from backend.core.prompt_compose import load_prompt_file
+from backend.core.template import PLACEHOLDER_RE
+
+
+def token_counter(model: str):
+    """(이름, 문자열 → 토큰 수 함수)."""
+    try:
+        import tiktoken
+    except ImportError:
+        return "estimate(chars/2)", lambda text: len(text) // 2
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("o200k_base")
+    return f"tiktoken:{encoding.name}", lambda text: len(encoding.encode(text))
+
+
+def template_sizes(path: str, count) -> dict:
+    """템플릿 이름 → (system 토큰, user 고정 부분 토큰, 지운 줄 목록)."""
+    composed = load_prompt_file(path)
+    sizes = {}
+    for name, text in composed.templates.items():
+        system = composed.system.get(name) or SYSTEM_MESSAGES.get(name, "")
+        sizes[name] = (count(system), count(PLACEHOLDER_RE.sub("", text)), composed.removed.get(name, []))
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="조립된 프롬프트 템플릿별 고정 입력 토큰 수")
+    parser.add_argument("files", nargs="*", help="프롬프트 파일 (기본: prompts/ 폴더의 모든 .json)")
+    parser.add_argument("--baseline", default=None, help="비교할 이전 프롬프트 파일 (예: 조각 도입 전 prompts.json)")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="tiktoken 토크나이저를 고를 모델 이름")
+    parser.add_argument("--show-removed", action="store_true", help="중복이라 지운 줄 출력")
+    args = parser.parse_args()
+
+    files = args.files or sorted(
+        os.path.join(PROMPTS_DIR, name) for name in os.listdir(PROMPTS_DIR) if name.endswith(".json")
+    )
+    counter_name, count = token_counter(args.model)
+    baseline = template_sizes(args.baseline, count) if args.baseline else {}
+    print(f"[TOKENS] counter={counter_name}" + (f" baseline={args.baseline}" if baseline else ""))
+
+    for path in files:
+        print(f"\n{os.path.basename(path)}")
+        print(f"{'template':<26} {'system':>7} {'user':>7} {'합계':>7} {'중복제거':>6}" + ("   baseline" if baseline else ""))
+        for name, (system, user, removed) in template_sizes(path, count).items():
+            line = f"{name:<26} {system:>7} {user:>7} {system + user:>7} {len(removed):>8}"
+            if name in baseline:
+                before = baseline[name][0] + baseline[name][1]
+                line += f"   {before:>7} ({(system + user - before) / before:+.1%})"
+            print(line)
+            if args.show_removed:
+                for removed_line in removed:
+                    print(f"    - {removed_line.strip()}")
+
+
+if __name__ == "__main__":
+    main()
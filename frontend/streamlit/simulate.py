@@ -0,0 +1,320 @@
+"""
+헤드리스 대화 시뮬레이터 (Streamlit 없이 S1→S3 전체 대화 실행)
+
+앱과 같은 대화 엔진(backend/core/conversation.py)과 같은 프롬프트 / 모델 라우팅 / 공용 LLM 클라이언트로
+N개 세션을 동시에 돌린다. 아이 답변은 chat_log.jsonl 의 실제 답변에서 무작위로 고른다.
+→ 브라우저를 클릭하지 않고 턴별 응답 시간 / 세션 전체 시간 / GPT 호출 수를 잰다.
+
+사용법 (프로젝트 루트에서):
+    python frontend/streamlit/simulate.py --app update_app --sessions 30
+    LLM_BASE_URL=http://127.0.0.1:8001/v1 python frontend/streamlit/simulate.py --sessions 200 --stream
+    PROMPT_LAYOUT=prefix LLM_BASE_URL=http://127.0.0.1:8001/v1 python frontend/streamlit/simulate.py --sessions 50
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 프로젝트 루트를 import 경로에 추가 (backend 공용 모듈 사용)
+sys.path.append(os.path.abspath(os.path.join(BASE_DIR, "..", "..")))
+
+from backend.core.client import get_llm_client
+from backend.core.conversation import (
+    PROMPT_LAYOUT,
+    TEMPLATE_FIELDS,
+    build_messages,
+    get_scenario,
+    next_action,
+    render_prompt,
+)
+from backend.core.fallback import fallback_closing, fallback_reply
+from backend.core.question_index import (
+    QUESTION_REGENERATE,
+    QUESTION_REGENERATE_MAX_TOKENS,
+    QuestionIndex,
+    build_regenerate_messages,
+    resolve_repeat,
+    tally_repeat,
+)
+from backend.core.routing import get_model_router
+from backend.core.structured import EMPATHY_TURN_FORMAT, extract_question, parse_empathy_turn, use_structured_output
+from backend.core.prompt_registry import get_prompt_registry
+
+load_dotenv()
+
+ROUTING_PATH = os.path.join(BASE_DIR, "config", "model_routing.json")
+SCENARIO_PATH = os.path.join(BASE_DIR, "config", "scenarios.json")
+
+# 앱별 프롬프트 파일 (없으면 prompts.json)
+PROMPT_FILES = {
+    "low_grade_app": "low_grade_prompts.json",
+}
+
+LOG_PATHS = [
+    os.path.join(BASE_DIR, "data", "logs", "chat_log.jsonl"),
+    os.path.join(BASE_DIR, "..", "..", "data", "logs", "chat_log.jsonl"),
+]
+
+# 로그가 없을 때 쓰는 아이 답변 예시
+SAMPLE_ANSWERS = [
+    "재밌었어!",
+    "그림 그리는 게 좋았어",
+    "슈퍼맨 색칠했어 파란색이랑 빨간색",
+    "내 얼굴 그리는 게 어려웠어",
+    "몰라",
+    "친구랑 같이 해서 좋았어",
+    "봉봉아 고마워",
+]
+
+
+def load_answers(paths) -> list:
+    """로그에 남은 아이 답변 목록 (중복 포함 → 자주 나온 답변이 더 자주 뽑힘)."""
+    answers = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                text = (record.get("text") or "").strip()
+                if record.get("role") == "user" and text:
+                    answers.append(text)
+    return answers or SAMPLE_ANSWERS
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p * len(ordered)) - 1))]
+
+
+class Simulation:
+    """세션 1개 = 앱의 process_flow 를 처음부터 끝까지 한 번 돈 것과 같은 흐름."""
+
+    def __init__(self, args, prompts, answers):
+        self.args = args
+        self.prompts = prompts
+        self.answers = answers
+        self.llm = get_llm_client()
+        self.router = get_model_router(ROUTING_PATH)
+        self.scenario = get_scenario(args.app, SCENARIO_PATH)
+
+    def generate(self, action, generated_questions, session_id):
+        """GPT 턴 1번 (앱의 generate_empathy_* 와 같은 프롬프트 / 옵션 / fallback)."""
+        route = self.router.resolve(self.args.app, action.stage, action.template)
+        structured = action.turn_kind != "ending" and use_structured_output(route.model)
+
+        options = route.options()
+        if structured:
+            options["response_format"] = EMPATHY_TURN_FORMAT
+        messages = build_messages(
+            action.template,
+            render_prompt(self.prompts, action, generated_questions, self.scenario),
+            structured=structured,
+            system=self.prompts.system.get(action.template),
+        )
+        context = {"session_id": session_id, "classroom": self.args.classroom}
+
+        try:
+            if self.args.stream:
+                result = self.llm.stream(
+                    messages, stage=action.template, model=route.model, on_delta=lambda partial: None,
+                    **context, **options,
+                )
+            else:
+                result = self.llm.complete(messages, stage=action.template, model=route.model, **context, **options)
+        except Exception as exc:
+            if action.turn_kind == "ending":
+                text = fallback_closing()
+            elif action.turn_kind == "rule_question":
+                text = fallback_reply(action.rule_question)
+            else:
+                text = fallback_reply(exclude=generated_questions)
+            return text, None, {"source": "fallback", "error": repr(exc), "attempts": 0, "latency": None}
+
+        if action.turn_kind == "ending":
+            return result.text, None, result.meta()
+        parsed = parse_empathy_turn(result.text)
+        return parsed["reply"], parsed["question"], result.meta()
+
+    def dedupe(self, index, action, reply, question, generated_questions, session_id):
+        """앱의 core/question_guard.dedupe_question 과 같은 처리 → (답변, 질문, 중복 기록 또는 None)."""
+        def regenerate() -> str:
+            route = self.router.resolve(self.args.app, action.stage, "question_regenerate")
+            result = self.llm.complete(
+                build_regenerate_messages(action.user_message, generated_questions[-8:],
+                                          self.prompts.system.get(action.template) or ""),
+                stage="question_regenerate",
+                model=route.model,
+                session_id=session_id,
+                classroom=self.args.classroom,
+                **{**route.options(), "max_tokens": QUESTION_REGENERATE_MAX_TOKENS},
+            )
+            return extract_question(result.text)
+
+        final, repeat = resolve_repeat(index, question, regenerate if QUESTION_REGENERATE else None)
+        return reply.replace(question, final) if repeat else reply, final, repeat
+
+    def run_session(self, index: int) -> dict:
+        rng = random.Random(self.args.seed + index)
+        session_id = f"sim-{index:04d}-{uuid.uuid4().hex[:6]}"
+
+        state, substep = 1, 1
+        messages, generated_questions, turns = [], [], []
+        index = QuestionIndex(fixed=[self.scenario.rule_questions[i] for i in sorted(self.scenario.rule_questions)])
+        repeats = {}
+        started = time.time()
+
+        while True:
+            action = next_action(state, substep, messages, generated_questions, scenario=self.scenario)
+
+            if action.kind == "end":
+                break
+
+            if action.kind == "wait":
+                # 아이가 답을 생각하고 입력하는 시간
+                if self.args.think_time:
+                    time.sleep(rng.uniform(0, 2 * self.args.think_time))
+                user_input = rng.choice(self.answers)
+                action = next_action(state, substep, messages, generated_questions, user_input, self.scenario)
+                messages.append({"role": "user", "message": user_input})
+
+            elif action.kind == "rule":
+                messages.append({"role": "bot", "message": action.text})
+
+            elif action.kind == "llm":
+                turn_started = time.time()
+                reply, question, meta = self.generate(action, generated_questions, session_id)
+                if question and action.turn_kind == "free_question":
+                    reply, question, repeat = self.dedupe(
+                        index, action, reply, question, generated_questions, session_id)
+                    if repeat:
+                        meta = {**meta, "question_repeat": repeat}
+                        tally_repeat(repeats, repeat)
+                elif question:
+                    index.add(question)
+                if question:
+                    generated_questions.append(question)
+                messages.append({"role": "bot", "message": reply})
+                turns.append({
+                    "key": f"S{state}-{substep} {action.template}",
+                    "wall": round(time.time() - turn_started, 2),
+                    "prompt_version": self.prompts.version,
+                    "prompt_layout": PROMPT_LAYOUT,
+                    **meta,
+                })
+
+            state, substep = action.state, action.substep
+
+        return {
+            "session_id": session_id,
+            "total": round(time.time() - started, 2),
+            "turns": turns,
+            "messages": len(messages),
+            "question_repeats": repeats,
+        }
+
+
+def report(sessions: list, elapsed: float, llm_stats: dict):
+    turns = [t for s in sessions for t in s["turns"]]
+
+    print(f"\n[SIM] sessions={len(sessions)} elapsed={elapsed:.1f}s")
+    print(f"[SIM] llm_calls={len(turns)} ({len(turns) / max(1, len(sessions)):.1f}/session) "
+          f"upstream_attempts={sum(t.get('attempts') or 0 for t in turns)}")
+    print(f"[SIM] sources={dict(Counter(t.get('source') for t in turns))}")
+
+    totals = [s["total"] for s in sessions]
+    print(f"[SIM] session_time p50={percentile(totals, 0.5):.2f}s p95={percentile(totals, 0.95):.2f}s "
+          f"max={max(totals, default=0):.2f}s")
+
+    by_key = defaultdict(list)
+    for t in turns:
+        by_key[t["key"]].append(t["wall"])
+
+    print("\n턴                                        n     p50     p95     max")
+    for key in sorted(by_key):
+        values = by_key[key]
+        print(f"{key:<40} {len(values):>4} {percentile(values, 0.5):>7.2f} "
+              f"{percentile(values, 0.95):>7.2f} {max(values):>7.2f}")
+
+    # 자유 질문 중복: 잡은 수 (exact / near) 와 처리 방법 (regenerated / reworded / kept)
+    repeats = Counter()
+    for s in sessions:
+        repeats.update(s["question_repeats"])
+    free_turns = sum(1 for t in turns if t["key"].endswith("empathy_free_question"))
+    print(f"[SIM] question_repeats caught={repeats['caught']}/{free_turns} free turns {dict(repeats)}")
+
+    ttfts = [t["ttft"] for t in turns if t.get("ttft") is not None]
+    if ttfts:
+        print(f"\n[SIM] ttft p50={percentile(ttfts, 0.5):.2f}s p95={percentile(ttfts, 0.95):.2f}s")
+
+    # 템플릿별 프롬프트 캐시 (업스트림이 cached_tokens 를 알려준 호출만)
+    by_template = defaultdict(list)
+    for t in turns:
+        if t.get("source") == "upstream" and t.get("prompt_tokens"):
+            by_template[t["key"].split(" ", 1)[1]].append(t)
+    if by_template:
+        print(f"\n[SIM] prompt_layout={PROMPT_LAYOUT}")
+        print("템플릿                          n  입력토큰  캐시비율  적중률  ttft(적중)  ttft(미적중)")
+        for template in sorted(by_template):
+            calls = by_template[template]
+            prompt_tokens = sum(t["prompt_tokens"] for t in calls)
+            cached = sum(t.get("cached_tokens") or 0 for t in calls)
+            hits = [t["ttft"] for t in calls if t.get("cached_tokens")]
+            misses = [t["ttft"] for t in calls if not t.get("cached_tokens")]
+            print(f"{template:<28} {len(calls):>4} {prompt_tokens / len(calls):>8.0f} "
+                  f"{cached / prompt_tokens:>9.1%} {len(hits) / len(calls):>7.1%} "
+                  f"{percentile(hits, 0.5):>10.2f}s {percentile(misses, 0.5):>11.2f}s")
+    # 세션별 대기 시간은 위 표로 충분하므로 요약만 출력
+    llm_stats.get("scheduler", {}).pop("session_wait", None)
+    print(f"[SIM] client stats={json.dumps(llm_stats, ensure_ascii=False, default=str)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamlit 없이 S1→S3 대화 세션 시뮬레이션")
+    parser.add_argument("--app", default="update_app", help="프롬프트 / 라우팅 기준 앱 이름")
+    parser.add_argument("--sessions", type=int, default=10, help="전체 세션 수")
+    parser.add_argument("--concurrency", type=int, default=None, help="동시에 진행하는 세션 수 (기본: --sessions)")
+    parser.add_argument("--stream", action="store_true", help="스트리밍 호출 사용 (앱 기본값과 같게)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="아이 답변 입력까지 평균 대기 시간(초)")
+    parser.add_argument("--classroom", default="sim", help="스케줄러 교실 이름")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="세션별 결과를 JSON 으로 저장할 경로")
+    args = parser.parse_args()
+
+    prompts_path = os.path.join(BASE_DIR, "prompts", PROMPT_FILES.get(args.app, "prompts.json"))
+    prompts = get_prompt_registry().get(prompts_path, TEMPLATE_FIELDS)
+    answers = load_answers(LOG_PATHS)
+
+    sim = Simulation(args, prompts, answers)
+    print(f"[SIM] app={args.app} sessions={args.sessions} stream={args.stream} answers={len(answers)} "
+          f"prompt_version={prompts.version}")
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency or args.sessions) as pool:
+        sessions = list(pool.map(sim.run_session, range(args.sessions)))
+    elapsed = time.time() - started
+
+    report(sessions, elapsed, sim.llm.stats())
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(sessions, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
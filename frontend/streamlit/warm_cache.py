@@ -0,0 +1,127 @@
+"""
+LLM 응답 캐시 사전 채우기 (warm-up)
+
+지난 대화 로그(chat_log.jsonl)에서 아이들이 첫 고정 질문(RULE_QUESTIONS[1])에
+답한 말을 모아, 현재 prompts.json 으로 S1 첫 자유 질문 프롬프트를 그대로 만들어
+캐시에 미리 넣어둔다. → 아침 첫 수업부터 캐시 hit.
+
+사용법 (프로젝트 루트에서):
+    python frontend/streamlit/warm_cache.py --app update_app --limit 200
+    python frontend/streamlit/warm_cache.py --app low_grade_app --dry-run
+"""
+import argparse
+import importlib
+import json
+import os
+from collections import Counter
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LOG_PATHS = [
+    os.path.join(BASE_DIR, "data", "logs", "chat_log.jsonl"),
+    os.path.join(BASE_DIR, "..", "..", "data", "logs", "chat_log.jsonl"),
+]
+
+TEMPLATE_NAME = "empathy_free_question"
+
+
+def load_first_answers(paths, first_question: str) -> Counter:
+    """로그에서 첫 고정 질문 바로 뒤에 나온 아이의 답변을 빈도와 함께 모은다."""
+    answers = Counter()
+
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+
+        prev = None
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+                if (
+                    record.get("role") == "user"
+                    and prev is not None
+                    and prev.get("role") == "bot"
+                    and prev.get("text") == first_question
+                ):
+                    text = record.get("text", "").strip()
+                    if text:
+                        answers[text] += 1
+                prev = record
+
+    return answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="chat_log.jsonl 기반 LLM 응답 캐시 warm-up")
+    parser.add_argument("--app", default="update_app", help="프롬프트/시스템 메시지를 가져올 앱 모듈 이름")
+    parser.add_argument("--model", default=None, help="캐시 키에 사용할 모델 (기본: 라우팅 표의 S1 free_question 모델)")
+    parser.add_argument("--limit", type=int, default=200, help="빈도순 상위 N개 답변만 사용")
+    parser.add_argument("--dry-run", action="store_true", help="GPT 호출 없이 대상 목록만 출력")
+    args = parser.parse_args()
+
+    app = importlib.import_module(args.app)
+
+    # 앱 모듈이 프로젝트 루트를 sys.path 에 추가한 뒤에 backend 를 가져온다
+    from backend.core.client import get_llm_client
+    from backend.core.routing import get_model_router
+    from backend.core.structured import EMPATHY_TURN_FORMAT, use_structured_output
+    from core.llm_stream import ROUTING_PATH
+
+    # 앱의 S1 첫 자유 질문 턴과 같은 모델 / 출력 옵션 사용
+    route = get_model_router(ROUTING_PATH).resolve(args.app, 1, TEMPLATE_NAME)
+    model = args.model or route.model
+    prompts = app.load_prompts()
+    answers = load_first_answers(LOG_PATHS, app.RULE_QUESTIONS[1])
+
+    print(f"[WARM-UP] app={args.app} model={model} unique_answers={len(answers)}")
+
+    llm = get_llm_client()
+    if not llm.cache.enabled_for(TEMPLATE_NAME):
+        print(f"[WARM-UP] '{TEMPLATE_NAME}' 는 LLM_CACHE_STAGES 에 없어 캐시되지 않습니다.")
+        return
+
+    # S1-3 첫 자유 질문 턴과 같은 조건으로 프롬프트 생성 (자유 질문 목록은 아직 비어 있음)
+    fixed_questions_str = app.build_fixed_questions_str(app.RULE_QUESTIONS)
+    generated_questions_str = app.build_generated_questions_str([])
+
+    # 앱과 같은 출력 형식(JSON / 텍스트)으로 요청해야 같은 캐시 키가 된다
+    structured = use_structured_output(model)
+    options = route.options()
+    if structured:
+        options["response_format"] = EMPATHY_TURN_FORMAT
+
+    called = 0
+    for text, count in answers.most_common(args.limit):
+        prompt_text = app.apply_prompt_template(
+            prompts[TEMPLATE_NAME],
+            stage_label=app.STAGE_LABELS[1],
+            user_message=text,
+            fixed_questions=fixed_questions_str,
+            generated_questions=generated_questions_str,
+        )
+        messages = app.build_messages(
+            TEMPLATE_NAME, prompt_text, structured=structured, system=prompts.system.get(TEMPLATE_NAME)
+        )
+
+        if args.dry_run:
+            print(f"  ({count}회) {text}")
+            continue
+
+        # 변형 풀(LLM_CACHE_VARIANTS)이 찰 때까지 채운다. 이미 차 있으면 캐시 hit 로 바로 반환됨.
+        for _ in range(llm.cache.variants):
+            result = llm.complete(messages, stage=TEMPLATE_NAME, model=model, **options)
+            if result.source != "cache":
+                called += 1
+
+    print(f"[WARM-UP] done. upstream_calls={called} cache={llm.cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()